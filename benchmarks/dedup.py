@@ -0,0 +1,63 @@
+"""
+Memory used to remember delivered posts as posts keep coming in.
+
+Compares the old per-channel ``already_posted`` lists with models.DedupIndex.
+
+Run from the repository root:
+    python -m benchmarks.dedup --posts 20000
+"""
+from argparse import ArgumentParser
+from time import perf_counter
+import tracemalloc
+from models import DedupIndex
+
+
+def simulate(args, deliver, label):
+    tracemalloc.start()
+    start = perf_counter()
+    checkpoint = max(args.posts // 5, 1)
+    for post_number in range(1, args.posts + 1):
+        community_name = f"club{post_number % args.clubs}"
+        post_slug = f"post-{post_number:08d}"
+        deliver(community_name, post_slug)
+        if post_number % checkpoint == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            print(f"{label:>14} posts={post_number:>8} memory={current / 1024:>10.1f} KiB")
+    elapsed = perf_counter() - start
+    tracemalloc.stop()
+    deliveries = args.posts * args.channels
+    print(f"{label:>14} {deliveries} deliveries in {elapsed:.2f}s ({elapsed / deliveries * 1e9:.0f} ns each)\n")
+
+
+def bench(args):
+    channel_ids = list(range(args.channels))
+
+    already_posted = {}  # community name : {channel id: list of post slugs}
+
+    def deliver_lists(community_name, post_slug):
+        channels = already_posted.setdefault(community_name, {})
+        for channel_id in channel_ids:
+            posted = channels.setdefault(channel_id, [])
+            if post_slug in posted:
+                continue
+            posted.append(post_slug)
+
+    dedup = DedupIndex()
+
+    def deliver_index(community_name, post_slug):
+        seq, _ = dedup.get_seq(community_name, post_slug)
+        for channel_id in channel_ids:
+            dedup.claim(community_name, channel_id, seq)
+        dedup.pop_dirty(community_name)
+
+    print(f"clubs={args.clubs} channels/club={args.channels} posts={args.posts}\n")
+    simulate(args, deliver_lists, "already_posted")
+    simulate(args, deliver_index, "DedupIndex")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--clubs", type=int, default=10)
+    parser.add_argument("--channels", type=int, default=100, help="Channels following each club.")
+    parser.add_argument("--posts", type=int, default=20000, help="Total posts across every club.")
+    bench(parser.parse_args())
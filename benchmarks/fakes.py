@@ -0,0 +1,191 @@
+"""
+Local stand-ins for UCube, Discord and the media/translation hosts used by the load test.
+"""
+from asyncio import sleep
+from itertools import count
+from random import Random
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from aiohttp import web
+import discord
+from models import Lifecycle
+
+
+class FakeUCubeClient:
+    def __init__(self, **kwargs):
+        """
+        A scripted UCubeClientAsync. Polls find nothing, notifications are sent to the cog by the load test instead.
+        """
+        self.clubs: Dict[str, SimpleNamespace] = {}  # club slug : club
+        self.posts: Dict[str, SimpleNamespace] = {}  # post slug : post
+        self.notifications: Dict[str, SimpleNamespace] = {}  # notification slug : notification
+        self.cache_loaded = False
+        self._slugs = count(1)
+
+    async def start(self, **kwargs):
+        self.cache_loaded = True
+
+    def stop(self):
+        ...
+
+    def add_club(self, name) -> SimpleNamespace:
+        """Add a club that can be followed."""
+        club = SimpleNamespace(name=name, slug=f"club-{next(self._slugs)}", boards={}, notifications=[])
+        self.clubs[club.slug] = club
+        return club
+
+    def add_post(self, club, content, media_urls) -> SimpleNamespace:
+        """Add a post to a club with one image per media url."""
+        slug = f"post-{next(self._slugs)}"
+        images = [SimpleNamespace(path=url, name=f"{slug}-{number}.jpg") for number, url in enumerate(media_urls)]
+        post = SimpleNamespace(slug=slug, content=content, images=images, videos=[],
+                               user=SimpleNamespace(name=club.name))
+        self.posts[slug] = post
+        return post
+
+    def get_post(self, post_slug):
+        return self.posts.get(post_slug)
+
+    async def fetch_post(self, post_slug):
+        return self.posts.get(post_slug)
+
+    async def fetch_all_clubs(self):
+        return list(self.clubs.values())
+
+    async def fetch_club_boards(self, club_slug):
+        return []
+
+    async def fetch_club_notifications(self, club_slug, **kwargs):
+        return []
+
+    def notify(self, club, posts) -> List[SimpleNamespace]:
+        """Create a notification for every post, like the new notifications a poll of a club finds."""
+        return [SimpleNamespace(slug=f"notification-{post.slug}", club_slug=club.slug, club_name=club.name,
+                                post_slug=post.slug, created_at=None) for post in posts]
+
+
+class FakeResponse:
+    def __init__(self, status, reason, headers=None):
+        """The parts of an aiohttp response discord.HTTPException reads."""
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+class FakeMessage:
+    _ids = count(1)
+
+    def __init__(self):
+        self.id = next(self._ids)
+
+    async def publish(self):
+        ...
+
+
+class FakeChannel:
+    def __init__(self, channel_id, latency, rate_limit_chance=0.0, retry_after=1.0, news=False, guild_id=None,
+                 random=None):
+        """
+        A discord text channel whose sends take ``latency`` seconds and fail with a 429 by chance.
+
+        :param channel_id: (int) The channel ID.
+        :param latency: (float) Seconds a send takes.
+        :param rate_limit_chance: (float) The chance (0-1) that a send is rejected with a 429.
+        :param retry_after: (float) The Retry-After of a 429.
+        :param news: (bool) Whether messages are published afterwards.
+        :param guild_id: (int) The ID of the guild the channel is in.
+        """
+        self.id = channel_id
+        self.latency = latency
+        self.rate_limit_chance = rate_limit_chance
+        self.retry_after = retry_after
+        self.news = news
+        self.guild = SimpleNamespace(id=guild_id) if guild_id is not None else None
+        self.random = random or Random(channel_id)
+        self.sent = 0
+        self.rate_limited = 0
+
+    def is_news(self):
+        return self.news
+
+    async def send(self, content=None, *, embed=None, embeds=None, files=None):
+        await sleep(self.latency)
+        if self.random.random() < self.rate_limit_chance:
+            self.rate_limited += 1
+            response = FakeResponse(429, "Too Many Requests", {"Retry-After": str(self.retry_after)})
+            raise discord.HTTPException(response, {"message": "You are being rate limited.", "code": 0})
+
+        # discord.py serializes the embeds and reads every file into the multipart form.
+        for item in embeds or ([embed] if embed else []):
+            item.to_dict()
+        for file in files or []:
+            file.fp.read()
+            file.close()
+        self.sent += 1
+        return FakeMessage()
+
+
+class FakeBot:
+    def __init__(self, conn, channels: List[FakeChannel]):
+        """The parts of UCubeBot the UCube cog uses."""
+        self.conn = conn
+        self.channels = {channel.id: channel for channel in channels}
+        self.worker_id = 0
+        self.workers = 1
+        self.lifecycle = Lifecycle()
+
+    def get_channel(self, channel_id) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    async def fetch_channel(self, channel_id) -> FakeChannel:
+        channel = self.channels.get(channel_id)
+        if not channel:
+            raise discord.NotFound(FakeResponse(404, "Not Found"), "Unknown Channel")
+        return channel
+
+
+class FakeHost:
+    def __init__(self, translation_latency=0.0, media_latency=0.0):
+        """
+        A local HTTP server for media downloads and the translation endpoint.
+
+        ``/media/{size}/{name}`` returns ``size`` bytes that are unique to the name.
+        ``/translate`` answers like the translation endpoint.
+        """
+        self.translation_latency = translation_latency
+        self.media_latency = media_latency
+        self.translations = 0
+        self.media_requests = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = None
+
+    async def start(self, host="127.0.0.1"):
+        app = web.Application()
+        app.router.add_get("/media/{size}/{name}", self._media)
+        app.router.add_post("/translate", self._translate)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def media_url(self, size, name) -> str:
+        return f"{self.url}/media/{size}/{name}"
+
+    async def _media(self, request):
+        self.media_requests += 1
+        await sleep(self.media_latency)
+        size = int(request.match_info["size"])
+        header = request.match_info["name"].encode()[:size]
+        return web.Response(body=header + bytes(size - len(header)), content_type="application/octet-stream")
+
+    async def _translate(self, request):
+        self.translations += 1
+        data = await request.post()
+        await sleep(self.translation_latency)
+        return web.json_response({"code": 0, "text": f"[en] {data.get('text', '')}"})
@@ -0,0 +1,56 @@
+"""
+Time to deliver one post to many channels with a fake send layer.
+
+Run from the repository root:
+    python -m benchmarks.fanout --channels 10000
+"""
+from argparse import ArgumentParser
+from asyncio import run, sleep
+from time import perf_counter
+from models import DeliveryScheduler, TextChannel
+
+
+class FakeChannel:
+    def __init__(self, channel_id, latency):
+        self.id = channel_id
+        self.latency = latency
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        await sleep(self.latency)
+        self.sent += 1
+
+
+async def bench(args):
+    channels = [TextChannel(channel_id, None) for channel_id in range(args.channels)]
+    fakes = {channel.id: FakeChannel(channel.id, args.latency) for channel in channels}
+    scheduler = DeliveryScheduler(max_concurrency=args.concurrency, global_limit=args.global_limit)
+
+    async def deliver(channel_info):
+        fake = fakes[channel_info.id]
+        for _ in range(args.messages):
+            await scheduler.throttle(channel_info.id)
+            await fake.send()
+
+    start = perf_counter()
+    delivered = await scheduler.deliver(channels, deliver)
+    elapsed = perf_counter() - start
+
+    requests = args.channels * args.messages
+    print(f"channels={args.channels} messages/channel={args.messages} concurrency={args.concurrency} "
+          f"latency={args.latency}s global_limit={args.global_limit}/s")
+    print(f"delivered={delivered} requests={sum(fake.sent for fake in fakes.values())} elapsed={elapsed:.2f}s "
+          f"({requests / elapsed:.1f} req/s)")
+    print(f"rate-limit floor: {requests / args.global_limit:.2f}s")
+    print(f"previous sequential loop (2s sleep + sends): "
+          f"{args.channels * (2 + args.messages * args.latency):.0f}s")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--channels", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=2, help="Messages sent to each channel per post.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds a fake send takes.")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--global-limit", type=int, default=50, help="Global requests allowed per second.")
+    run(bench(parser.parse_args()))
@@ -0,0 +1,172 @@
+"""
+Throughput, delivery latency and peak memory of the real UCube cog driven by local fakes.
+
+A scripted UCube client emits bursts of notifications, a local server hosts the media and the translation
+endpoint, Discord channels are fakes with a configurable send latency and chance of a 429, and the
+DataBase is a models.MemoryDataBase. Discord's rate-limits are enforced the same as in production.
+
+Every scenario runs in a new process so the peak memory of one does not hide another.
+
+Run from the repository root:
+    python -m benchmarks.loadtest --followers 10 100 --media-sizes 0 1000000
+"""
+import logging
+from argparse import ArgumentParser
+from asyncio import run, sleep
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import environ, path
+from resource import getrusage, RUSAGE_SELF
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from models import MemoryDataBase
+from benchmarks.fakes import FakeBot, FakeChannel, FakeHost, FakeUCubeClient
+
+
+class RecordingDataBase(MemoryDataBase):
+    def __init__(self, emitted):
+        """Records the time from a notification being emitted until each of its jobs is completed."""
+        super().__init__()
+        self.emitted = emitted  # post slug : when the notification was emitted
+        self.latencies = []
+        self.club_latencies = {}  # community name : latencies of its deliveries
+
+    async def complete_job(self, job_id):
+        job = self._jobs.get(job_id)
+        if job:
+            latency = perf_counter() - self.emitted[job["postslug"]]
+            self.latencies.append(latency)
+            self.club_latencies.setdefault(job["communityname"], []).append(latency)
+        await super().complete_job(job_id)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[round(fraction * (len(values) - 1))]
+
+
+async def scenario(followers, media_size, args):
+    host = FakeHost(translation_latency=args.translation_latency, media_latency=args.media_latency)
+    await host.start()
+
+    with TemporaryDirectory() as folder:
+        environ.update({
+            "TRANSLATION_URL": f"{host.url}/translate",
+            "TRANSLATION_KEY": "",
+            "UCUBE_FOLDER_LOCATION": path.join(folder, ""),
+            "UPLOAD_FROM_HOST": "1",
+            "CLUB_SNAPSHOT_LOCATION": path.join(folder, "clubs.json"),
+            "DIGEST_WINDOW": str(args.digest_window),
+        })
+        import cogs.UCube
+        cogs.UCube.UCubeClientAsync = FakeUCubeClient
+
+        emitted = {}
+        conn = RecordingDataBase(emitted)
+        channels = []
+        for club_number in range(args.clubs):
+            club_channels = [FakeChannel(club_number * followers + number + 1, args.latency,
+                                         rate_limit_chance=args.rate_limit_chance, retry_after=args.retry_after,
+                                         guild_id=number % args.guilds)
+                             for number in range(followers)]
+            await conn.bulk_insert_channels([(channel.id, f"club {club_number}", None) for channel in club_channels])
+            if args.digest:
+                for channel in club_channels:
+                    await conn.update_digest(channel.id, f"club {club_number}", True)
+            channels.extend(club_channels)
+
+        cog = cogs.UCube.UCube(FakeBot(conn, channels))
+        client: FakeUCubeClient = cog.ucube_client
+        clubs = [client.add_club(f"Club {club_number}") for club_number in range(args.clubs)]
+        while not cog.get_followed_community_names(channels[-1].id):
+            await sleep(0.01)
+
+        start = perf_counter()
+        posts = 0
+        for burst in range(args.bursts):
+            if burst:
+                await sleep(args.burst_interval)
+            for club in clubs:
+                club_posts = []
+                for _ in range(args.burst_size):
+                    posts += 1
+                    media_urls = [host.media_url(media_size, f"{posts}-{media}.jpg")
+                                  for media in range(args.media if media_size else 0)]
+                    club_posts.append(client.add_post(club, f"Post number {posts} " * 20, media_urls))
+                for post in club_posts:
+                    emitted[post.slug] = perf_counter()
+                await cog.on_new_notifications(client.notify(club, club_posts))
+
+        while (await conn.fetch_queue_stats())[0]:
+            if perf_counter() - start > args.timeout:
+                print(f"Timed out with {(await conn.fetch_queue_stats())[0]} deliveries left.")
+                break
+            await sleep(0.05)
+        elapsed = perf_counter() - start
+
+        await cog.bot.lifecycle.shutdown()
+        await host.stop()
+
+    club_p50s = [percentile(latencies, 0.5) for latencies in conn.club_latencies.values()]
+    return {
+        "posts": posts,
+        "deliveries": len(conn.latencies),
+        "elapsed": elapsed,
+        "p50": percentile(conn.latencies, 0.5),
+        "p99": percentile(conn.latencies, 0.99),
+        # how far apart the clubs are, 1.0 when every club is served equally.
+        "club_p50_spread": max(club_p50s) / min(club_p50s) if club_p50s else 1.0,
+        "rate_limited": sum(channel.rate_limited for channel in channels),
+        "sends": sum(channel.sent for channel in channels),
+        "translations": host.translations,
+        "media_requests": host.media_requests,
+        "peak_rss": getrusage(RUSAGE_SELF).ru_maxrss / 1024,  # MiB
+    }
+
+
+def run_scenario(followers, media_size, args):
+    logging.basicConfig(level=args.log_level)
+    return run(scenario(followers, media_size, args))
+
+
+def main(args):
+    print(f"clubs={args.clubs} posts/club={args.bursts * args.burst_size} media/post={args.media} "
+          f"latency={args.latency}s 429 chance={args.rate_limit_chance} digest={args.digest}")
+    for media_size in args.media_sizes:
+        for followers in args.followers:
+            # a new process for every scenario so the peak memory is not shared.
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(run_scenario, followers, media_size, args).result()
+            elapsed = result["elapsed"]
+            print(f"followers={followers:>6} media={media_size:>9}B posts={result['posts']:>4} "
+                  f"deliveries={result['deliveries']:>6} elapsed={elapsed:>7.2f}s "
+                  f"posts/s={result['posts'] / elapsed:>7.2f} deliveries/s={result['deliveries'] / elapsed:>7.1f} "
+                  f"p50={result['p50']:>6.2f}s p99={result['p99']:>6.2f}s "
+                  f"club p50 spread={result['club_p50_spread']:>5.2f} 429s={result['rate_limited']:>4} "
+                  f"sends/delivery={result['sends'] / max(result['deliveries'], 1):>5.2f} "
+                  f"translations={result['translations']:>3} downloads={result['media_requests']:>4} "
+                  f"peak rss={result['peak_rss']:>6.1f}MiB")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--followers", type=int, nargs="+", default=[10, 100], help="Channels following each club.")
+    parser.add_argument("--media-sizes", type=int, nargs="+", default=[0, 1000000], help="Bytes per media file.")
+    parser.add_argument("--media", type=int, default=2, help="Media files per post.")
+    parser.add_argument("--clubs", type=int, default=2)
+    parser.add_argument("--guilds", type=int, default=10, help="Guilds the channels of a club are spread over.")
+    parser.add_argument("--bursts", type=int, default=2)
+    parser.add_argument("--burst-size", type=int, default=1, help="Posts per club in every burst.")
+    parser.add_argument("--burst-interval", type=float, default=1.0, help="Seconds between bursts.")
+    parser.add_argument("--digest", action="store_true", help="Every channel receives digests.")
+    parser.add_argument("--digest-window", type=float, default=1.0, help="Seconds a burst is collected.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds a Discord send takes.")
+    parser.add_argument("--rate-limit-chance", type=float, default=0.0, help="Chance of a send getting a 429.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of a 429.")
+    parser.add_argument("--translation-latency", type=float, default=0.05)
+    parser.add_argument("--media-latency", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--log-level", default="ERROR")
+    main(parser.parse_args())
@@ -0,0 +1,61 @@
+"""
+Overhead of recording metrics and structured logs in the hot path of a delivery.
+
+Run from the repository root:
+    python -m benchmarks.metrics --number 200000
+"""
+import logging
+from argparse import ArgumentParser
+from timeit import repeat
+from models import MetricsRegistry, JsonFormatter
+
+
+class DiscardHandler(logging.Handler):
+    """Formats every record like the bot does but does not write it anywhere."""
+    def emit(self, record):
+        self.format(record)
+
+
+def bench(args):
+    registry = MetricsRegistry()
+    counter = registry.counter("bench_total", "A counter.")
+    histogram = registry.histogram("bench_seconds", "A histogram.")
+
+    handler = DiscardHandler()
+    handler.setFormatter(JsonFormatter())
+    loggers = {}
+    for level in (logging.INFO, logging.WARNING):
+        log = loggers[level] = logging.getLogger(f"benchmarks.metrics.{logging.getLevelName(level).lower()}")
+        log.propagate = False
+        log.setLevel(level)
+        log.addHandler(handler)
+
+    def log_enabled():
+        loggers[logging.INFO].info("UCube Post sent.", extra={"club_name": "club", "channel_id": 123})
+
+    def log_disabled():
+        loggers[logging.WARNING].info("UCube Post sent.", extra={"club_name": "club", "channel_id": 123})
+
+    def time_block():
+        with histogram.time():
+            pass
+
+    cases = (
+        ("counter inc", lambda: counter.inc(result="sent")),
+        ("histogram observe", lambda: histogram.observe(0.2)),
+        ("histogram timer", time_block),
+        ("log below level", log_disabled),
+        ("log as json", log_enabled),
+    )
+    for label, method in cases:
+        best = min(repeat(method, number=args.number, repeat=args.repeat))
+        print(f"{label:>18} {best / args.number * 1e9:>9.0f}ns/call")
+
+    print(f"{'render':>18} {len(registry.render())} bytes")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    bench(parser.parse_args())
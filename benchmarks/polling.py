@@ -0,0 +1,149 @@
+"""
+Detection latency and request volume of polling UCube for new notifications, on a simulated clock.
+
+Compares the fixed loop of the ucube client (sleep 25 seconds, then poll every club one after another) with
+models.PollScheduler, which skips clubs nobody follows and polls every other club by its recent post rate and
+hour-of-day pattern. Clubs post in bursts around a peak hour of their own and are seeded with a week of history.
+Concurrency is not simulated since both strategies stay far below the request rate of a single connection.
+
+Run from the repository root:
+    python -m benchmarks.polling --clubs 200 --followed 0.3 --days 2
+"""
+from argparse import ArgumentParser
+from bisect import bisect_left, bisect_right
+from heapq import heappop, heappush
+import random
+from random import Random
+from statistics import median, quantiles
+from models import PollScheduler
+
+DAY = 86400
+START = 1700006400  # midnight UTC
+HISTORY_DAYS = 7
+# (name, share of clubs, posts per day)
+PROFILES = [("hot", 0.05, 30), ("active", 0.15, 5), ("quiet", 0.3, 0.5), ("dead", 0.5, 0)]
+
+
+def make_posts(rng: Random, posts_per_day, days):
+    """Post times in bursts of 1-4 posts within a few minutes, mostly in the 4 hours around a peak hour."""
+    peak_hour = rng.randrange(24)
+    end = START + days * DAY
+    posts = []
+    time = START - HISTORY_DAYS * DAY
+    while posts_per_day:
+        time += rng.expovariate(posts_per_day / 2.5 / DAY)  # 2.5 posts per burst on average
+        if time >= end:
+            break
+        if rng.random() < 0.7:
+            day_start = time - time % DAY
+            burst = day_start + (peak_hour - 2) * 3600 + rng.uniform(0, 4 * 3600)
+        else:
+            burst = time
+        posts.extend(burst + rng.uniform(0, 300) for _ in range(rng.randint(1, 4)))
+    return sorted(post for post in posts if post < end)
+
+
+def make_clubs(args):
+    rng = Random(args.seed)
+    clubs = []
+    for number in range(args.clubs):
+        pick = rng.random()
+        for name, share, posts_per_day in PROFILES:
+            pick -= share
+            if pick < 0:
+                break
+        clubs.append({"slug": f"club-{number}", "profile": name, "followed": rng.random() < args.followed,
+                      "posts": make_posts(rng, posts_per_day, args.days)})
+    return clubs
+
+
+def detect(posts, poll_times):
+    """The detection latency of every post: the time until the first poll at or after it."""
+    latencies = []
+    for post in posts:
+        index = bisect_left(poll_times, post)
+        if index < len(poll_times):
+            latencies.append(poll_times[index] - post)
+    return latencies
+
+
+def simulate_fixed(clubs, args):
+    """The ucube client loop: sleep, then poll every club (followed or not) one request at a time."""
+    end = START + args.days * DAY
+    cycle = args.fixed_interval + len(clubs) * args.request_latency
+    latencies = {}
+    requests = 0
+    for index, club in enumerate(clubs):
+        first = START + args.fixed_interval + (index + 1) * args.request_latency
+        poll_times = [first + cycle * number for number in range(int((end - first) // cycle) + 1)]
+        requests += len(poll_times)
+        if club["followed"]:
+            latencies[club["slug"]] = detect(live_posts(club), poll_times)
+    return requests, latencies
+
+
+def simulate_adaptive(clubs, args):
+    """models.PollScheduler deciding when every followed club is polled next."""
+    end = START + args.days * DAY
+    scheduler = PollScheduler(None, None, min_interval=args.min_interval, max_interval=args.max_interval,
+                              posts_per_poll=args.posts_per_poll)
+    heap = []
+    for club in clubs:
+        history = club["posts"][:bisect_left(club["posts"], START)]
+        scheduler.add(club["slug"], history)
+        if club["followed"]:
+            heappush(heap, (START + scheduler.get_delay(club["slug"], START), club["slug"], START))
+
+    by_slug = {club["slug"]: club for club in clubs}
+    poll_times = {club["slug"]: [] for club in clubs if club["followed"]}
+    requests = 0
+    while heap:
+        now, slug, last_poll = heappop(heap)
+        if now >= end:
+            continue
+        requests += 1
+        poll_times[slug].append(now)
+        posts = by_slug[slug]["posts"]
+        scheduler.record_posts(slug, posts[bisect_right(posts, last_poll):bisect_right(posts, now)])
+        heappush(heap, (now + scheduler.get_delay(slug, now), slug, now))
+    return requests, {slug: detect(live_posts(by_slug[slug]), times) for slug, times in poll_times.items()}
+
+
+def live_posts(club):
+    return club["posts"][bisect_left(club["posts"], START):]
+
+
+def report(label, clubs, requests, latencies, args):
+    hours = args.days * 24
+    line = f"{label:>9} requests={requests:>8} requests/hour={requests / hours:>8.1f}"
+    for profile in ("hot", "active", "quiet"):
+        values = [latency for club in clubs if club["profile"] == profile and club["slug"] in latencies
+                  for latency in latencies[club["slug"]]]
+        if len(values) > 1:
+            line += f" {profile} p50={median(values):>6.1f}s p90={quantiles(values, n=10)[-1]:>6.1f}s"
+    print(line)
+
+
+def bench(args):
+    random.seed(args.seed)  # the jitter of models.PollScheduler
+    clubs = make_clubs(args)
+    counts = {name: sum(club["profile"] == name for club in clubs) for name, _, _ in PROFILES}
+    followed = sum(club["followed"] for club in clubs)
+    posts = sum(len(live_posts(club)) for club in clubs if club["followed"])
+    print(f"clubs={len(clubs)} {counts} followed={followed} followed posts={posts} days={args.days}")
+    report("fixed", clubs, *simulate_fixed(clubs, args), args)
+    report("adaptive", clubs, *simulate_adaptive(clubs, args), args)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--clubs", type=int, default=200)
+    parser.add_argument("--followed", type=float, default=0.3, help="Share of clubs followed by a channel.")
+    parser.add_argument("--days", type=int, default=2)
+    parser.add_argument("--request-latency", type=float, default=0.3, help="Seconds per notification request.")
+    parser.add_argument("--fixed-interval", type=float, default=25, help="Sleep of the ucube client loop.")
+    parser.add_argument("--min-interval", type=float, default=10)
+    parser.add_argument("--max-interval", type=float, default=40)
+    parser.add_argument("--posts-per-poll", type=float, default=0.003)
+    parser.add_argument("--seed", type=int, default=1)
+    bench(parser.parse_args())
@@ -0,0 +1,81 @@
+"""
+File opens and CPU time per post as the amount of followers grows.
+
+Compares opening ``discord.File(location)`` for every channel with a models.RenderedPost built once per post.
+
+Run from the repository root:
+    python -m benchmarks.render --followers 10 100 1000
+"""
+from argparse import ArgumentParser
+from asyncio import run
+from os import path
+from sys import addaudithook
+from tempfile import TemporaryDirectory
+from time import process_time
+import discord
+from models import RenderedPost
+
+opened_files = 0
+
+
+def count_opens(event, args):
+    global opened_files
+    if event == "open":
+        opened_files += 1
+
+
+class FakeChannel:
+    async def send(self, content=None, *, embed=None, files=None):
+        # discord.py reads every file into the multipart form and closes it.
+        for file in files or []:
+            file.fp.read()
+            file.close()
+        if embed:
+            embed.to_dict()
+
+
+async def per_channel(channels, embeds, media_files, message_text):
+    for channel in channels:
+        for embed in embeds:
+            await channel.send(embed=embed)
+        await channel.send(message_text, files=[discord.File(location) for location in media_files])
+
+
+async def render_once(channels, embeds, media_files, message_text):
+    rendered = await RenderedPost.create("club", "post", embeds, media_files, message_text)
+    for channel in channels:
+        for group in rendered.embeds:
+            await channel.send(embed=group[0])
+        await channel.send(rendered.message_text, files=rendered.get_files())
+
+
+async def bench(args):
+    global opened_files
+    addaudithook(count_opens)
+    with TemporaryDirectory() as folder:
+        media_files = []
+        for number in range(args.files):
+            location = path.join(folder, f"{number}.jpg")
+            with open(location, "wb") as fd:
+                fd.write(b"\0" * args.file_size)
+            media_files.append(location)
+        embeds = [discord.Embed(title="UCube", description="x" * 1600)]
+
+        print(f"files/post={args.files} file_size={args.file_size}")
+        for followers in args.followers:
+            channels = [FakeChannel() for _ in range(followers)]
+            for label, method in (("per channel", per_channel), ("render once", render_once)):
+                opened_files = 0
+                start = process_time()
+                await method(channels, embeds, media_files, "")
+                elapsed = process_time() - start
+                print(f"followers={followers:>6} {label:>12} file opens={opened_files:>7} "
+                      f"cpu={elapsed * 1000:>9.1f}ms")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--followers", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--files", type=int, default=4, help="Media files per post.")
+    parser.add_argument("--file-size", type=int, default=1000000, help="Bytes per media file.")
+    run(bench(parser.parse_args()))
@@ -0,0 +1,52 @@
+"""
+Time to split large Korean and English posts into embeds, and the amount of messages needed to send them.
+
+Run from the repository root:
+    python -m benchmarks.splitter --length 200000
+"""
+from argparse import ArgumentParser
+from math import ceil
+from random import Random
+from timeit import repeat
+from models import TextSplitter
+from models.TextSplitter import EMBEDS_PER_MESSAGE
+
+EMBED_OVERHEAD = 100  # title, author and footer of an embed.
+
+
+def english_post(length, random):
+    words = ["the", "club", "posted", "a", "new", "photo", "today", "thank", "you", "everyone", "for", "waiting"]
+    paragraphs = []
+    while sum(map(len, paragraphs)) < length:
+        paragraphs.append(" ".join(random.choice(words) for _ in range(random.randint(20, 120))) + ".")
+    return "\n\n".join(paragraphs)[:length]
+
+
+def korean_post(length, random):
+    # long runs of hangul syllables with few spaces.
+    text = []
+    while len(text) < length:
+        text.extend(chr(random.randint(0xAC00, 0xD7A3)) for _ in range(random.randint(50, 600)))
+        text.append(random.choice([" ", "\n"]))
+    return "".join(text[:length])
+
+
+def bench(args):
+    random = Random(0)
+    splitter = TextSplitter()
+    for label, text in (("english", english_post(args.length, random)), ("korean", korean_post(args.length, random))):
+        timing = min(repeat(lambda: splitter.split(text), number=args.number, repeat=3)) / args.number
+        chunks = splitter.split(text)
+        sizes = [len(chunk) + EMBED_OVERHEAD for chunk in chunks]
+        single = len(TextSplitter.pack(sizes, size=int, max_items=1))
+        packed = len(TextSplitter.pack(sizes, size=int, max_items=EMBEDS_PER_MESSAGE))
+        print(f"{label:>8} length={len(text)} split={timing * 1000:.2f}ms ({len(text) / timing / 1e6:.1f} M chars/s) "
+              f"chunks={len(chunks)} messages: 1600 cap={ceil(len(text) / 1600)} one embed={single} "
+              f"packed={packed}")
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--length", type=int, default=200000, help="Characters in each post.")
+    parser.add_argument("--number", type=int, default=20, help="Splits per timing.")
+    bench(parser.parse_args())
@@ -0,0 +1,100 @@
+"""
+Memory and GC pause time of every (community, channel) subscription held by the UCube cog.
+
+Compares the old dict of dicts of TextChannel objects (and a set of community names per channel) with
+models.SubscriptionStore.
+
+Run from the repository root:
+    python -m benchmarks.subscriptions --subscriptions 100000 500000
+"""
+import gc
+import tracemalloc
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+from models import SubscriptionStore
+
+
+class OldTextChannel:
+    def __init__(self, channel_id, role_id):
+        """The TextChannel before it had __slots__."""
+        self.id = channel_id
+        self.role_id = role_id
+
+
+def load_dicts(subscriptions):
+    channels = {}  # community name : { channel id : TextChannel }
+    followed = {}  # channel id : { community name }
+    for community_name, channel_id, role_id in subscriptions:
+        channels.setdefault(community_name, {})[channel_id] = OldTextChannel(channel_id, role_id)
+        followed.setdefault(channel_id, set()).add(community_name)
+    return channels, followed
+
+
+def iterate_dicts(store, community_name):
+    channels, _ = store
+    return sum(1 for channel_info in channels[community_name].copy().values() if channel_info.id)
+
+
+def load_store(subscriptions):
+    store = SubscriptionStore()
+    for community_name, channel_id, role_id in subscriptions:
+        store.load(community_name, channel_id, role_id)
+    store.sort()
+    return store
+
+
+def iterate_store(store, community_name):
+    return sum(1 for channel_id, _ in store.iter_community(community_name) if channel_id)
+
+
+def make_subscriptions(args, amount):
+    """Channels (discord snowflakes) that follow one or more clubs, some with a role."""
+    random = Random(amount)
+    subscriptions = []
+    channel_ids = [random.randrange(10 ** 17, 10 ** 18) for _ in range(amount // args.follows)]
+    for channel_id in channel_ids:
+        for club_number in random.sample(range(args.clubs), args.follows):
+            role_id = random.randrange(10 ** 17, 10 ** 18) if random.random() < args.role_chance else None
+            subscriptions.append((f"club {club_number}", channel_id, role_id))
+    return subscriptions
+
+
+def bench(args, label, load, iterate, amount):
+    subscriptions = make_subscriptions(args, amount)
+    gc.collect()
+    tracemalloc.start()
+    store = load(subscriptions)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    pauses = []
+    for _ in range(args.repeat):
+        start = perf_counter()
+        gc.collect()
+        pauses.append(perf_counter() - start)
+
+    start = perf_counter()
+    for club_number in range(args.clubs):
+        iterate(store, f"club {club_number}")
+    elapsed = perf_counter() - start
+
+    print(f"{label:>17} subscriptions={len(subscriptions):>8} bytes/subscription={memory / len(subscriptions):>7.1f} "
+          f"full gc={min(pauses) * 1000:>8.2f}ms iterate every club={elapsed * 1000:>8.2f}ms")
+
+
+def main(args):
+    print(f"clubs={args.clubs} communities/channel={args.follows} role chance={args.role_chance}")
+    for amount in args.subscriptions:
+        bench(args, "dict of dicts", load_dicts, iterate_dicts, amount)
+        bench(args, "SubscriptionStore", load_store, iterate_store, amount)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--subscriptions", type=int, nargs="+", default=[100000, 500000])
+    parser.add_argument("--clubs", type=int, default=30)
+    parser.add_argument("--follows", type=int, default=2, help="Communities every channel follows.")
+    parser.add_argument("--role-chance", type=float, default=0.3, help="Chance a subscription mentions a role.")
+    parser.add_argument("--repeat", type=int, default=3, help="Full collections timed (the fastest is shown).")
+    main(parser.parse_args())
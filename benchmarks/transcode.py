@@ -0,0 +1,98 @@
+"""
+Images transcoded per second and event-loop lag while oversized media is shrunk to fit the upload limit.
+
+Compares transcoding on the event loop with models.MediaTranscoder and its pool of worker processes.
+Needs Pillow. Videos are not benchmarked since they need ffmpeg.
+
+Run from the repository root:
+    python -m benchmarks.transcode --images 16 --processes 1 2 4
+"""
+from argparse import ArgumentParser
+from asyncio import gather, get_event_loop, run, sleep
+from os import path, urandom
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from PIL import Image
+from models import MediaTranscoder
+from models.MediaTranscoder import transcode_image
+
+UPLOAD_LIMIT = 8000000
+TICK = 0.01
+
+
+def make_images(folder, amount, size):
+    """Photos over the upload limit. Noise keeps them from compressing well, like detailed photos."""
+    sources = []
+    for number in range(amount):
+        location = path.join(folder, f"source{number}.png")
+        Image.frombytes("RGB", (size, size), urandom(size * size * 3)).save(location, compress_level=1)
+        sources.append(location)
+    return sources
+
+
+async def measure_lag(work):
+    """Run ``work`` while a ticker sleeps for TICK, returning the elapsed time and the worst tick lateness."""
+    loop = get_event_loop()
+    worst = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            start = loop.time()
+            await sleep(TICK)
+            worst = max(worst, loop.time() - start - TICK)
+
+    ticking = loop.create_task(ticker())
+    await sleep(0)  # the ticker is sleeping before the work starts.
+    start = perf_counter()
+    await work()
+    elapsed = perf_counter() - start
+    done = True
+    await ticking
+    return elapsed, worst
+
+
+async def bench_inline(sources, folder):
+    async def work():
+        for number, source in enumerate(sources):
+            transcode_image(source, path.join(folder, f"inline{number}.jpg"), UPLOAD_LIMIT)
+            await sleep(0)  # like every post transcoding its own media.
+    return await measure_lag(work)
+
+
+async def bench_pool(sources, folder, processes):
+    transcoder = MediaTranscoder(path.join(folder, f"pool{processes}"), processes=processes)
+    # start the worker processes outside of the timing.
+    await get_event_loop().run_in_executor(transcoder._executor, abs, 0)
+
+    async def work():
+        await gather(*[transcoder.fit(source, UPLOAD_LIMIT) for source in sources])
+    try:
+        return await measure_lag(work)
+    finally:
+        transcoder.close()
+
+
+def report(label, images, elapsed, lag, processes):
+    print(f"{label:>18} images={images:>4} images/s={images / elapsed:>7.2f} "
+          f"images/s/process={images / elapsed / processes:>6.2f} max loop lag={lag * 1000:>9.1f}ms")
+
+
+async def bench(args):
+    with TemporaryDirectory() as folder:
+        sources = make_images(folder, args.images, args.size)
+        print(f"source size={path.getsize(sources[0]) / 1000000:.1f}MB upload limit={UPLOAD_LIMIT / 1000000:.0f}MB")
+        elapsed, lag = await bench_inline(sources, folder)
+        report("event loop", len(sources), elapsed, lag, 1)
+        for processes in args.processes:
+            elapsed, lag = await bench_pool(sources, folder, processes)
+            report(f"{processes} processes", len(sources), elapsed, lag, processes)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--size", type=int, default=3000, help="Width and height of every source image.")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    run(bench(parser.parse_args()))
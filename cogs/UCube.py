@@ -1,20 +1,56 @@
-from typing import Optional, TYPE_CHECKING, List, Union
+from typing import Dict, Optional, TYPE_CHECKING, List, Union
+
+import json
+import logging
 
 import discord
 from discord.ext import commands
-from asyncio import get_event_loop, sleep
-from os import getenv
+from asyncio import get_event_loop, sleep, gather, Semaphore, Future, Event, wait_for, TimeoutError
+from collections import OrderedDict, namedtuple
+from inspect import signature
+from time import perf_counter, time
+from datetime import datetime, timedelta, timezone
+from os import getenv, path
 from aiohttp import ClientSession
-from models import TextChannel
+from models import TextChannel, DeliveryScheduler, DedupIndex, MediaCache, Translator, RenderedPost, ClubRegistry, \
+    NotificationQueue, TextSplitter, ClusterServer, ClusterClient, ChannelResolver, PublishQueue, DeliveryPlanner, \
+    ClubSnapshot, SubscriptionStore, WebhookPool, MediaRelay, MediaTranscoder, PollScheduler, STOP_INTAKE, DRAIN, \
+    CHECKPOINT, CLOSE, metrics
 from random import randint
+from hashlib import sha256
 import aiofiles
-from UCube import UCubeClientAsync, models
+from UCube import UCubeClientAsync, models, check_expired_token, create_club
 
 if TYPE_CHECKING:
     from ..run import UCubeBot
 
 DEV_MODE = False
-EMBED_CAP = 1600
+EMBED_CAP = 4096  # discord embed description limit
+CONTENT_LIMIT = 2000  # discord message content limit
+# discord.py 2.0+ can send several embeds in one message.
+MAX_EMBEDS_PER_MESSAGE = 10 if "embeds" in signature(discord.abc.Messageable.send).parameters else 1
+UPLOAD_LIMIT = 8000000  # 8 mb
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+MAX_RENDERED_POSTS = 8
+NOTIFICATIONS_PER_POLL = 15
+UCUBE_TIMEZONE = timezone(timedelta(hours=9))  # UCube times without an offset are in KST
+
+# the parts of a club that cluster workers receive from the leader.
+ClusterClub = namedtuple("ClusterClub", ["slug", "name"])
+# a following channel and its guild (None if the guild is not cached) as seen by the delivery planner.
+PlannedChannel = namedtuple("PlannedChannel", ["id", "role_id", "guild"])
+
+log = logging.getLogger(__name__)
+
+NOTIFICATIONS_QUEUED = metrics.counter("ucube_notifications_queued_total", "Notifications queued for delivery.")
+FIRST_DELIVERY_SECONDS = metrics.histogram("ucube_notification_first_delivery_seconds",
+                                           "Time from a notification being queued to its first delivery.")
+CHANNEL_SEND_SECONDS = metrics.histogram("ucube_channel_send_seconds", "Time to send a post to one channel.")
+CHANNEL_SENDS = metrics.counter("ucube_channel_sends_total", "Posts sent to channels by result.")
+MEDIA_DOWNLOAD_BYTES = metrics.counter("ucube_media_download_bytes_total", "Bytes of media downloaded.")
+MEDIA_DOWNLOAD_SECONDS = metrics.histogram("ucube_media_download_seconds", "Time to download one media file.")
+DETECTION_SECONDS = metrics.histogram("ucube_notification_detection_seconds",
+                                      "Time from a notification being created on UCube to it being found by a poll.")
 
 """
 THIS FILE USED A TEMPLATE FROM WEVERSE
@@ -25,7 +61,13 @@ UCUBE CLUBS MAY BE REFERRED TO AS COMMUNITIES HERE
 class UCube(commands.Cog):
     def __init__(self, bot):
         self.bot: UCubeBot = bot
-        self._channels = {}  # Community Name : { channel_id: models.TextChannel }
+        self._subscriptions = SubscriptionStore()  # the channels following each community
+        self._dedup = DedupIndex()  # posts already delivered to a channel
+        self._club_registry = ClubRegistry()  # clubs by name and slug
+        # commands and notifications wait until the following channels and the clubs (restored or live) are loaded.
+        self._channels_loaded = Event()
+        self._clubs_loaded = Event()
+        self._club_snapshot = ClubSnapshot(getenv("CLUB_SNAPSHOT_LOCATION") or "ucube_clubs.json")
         loop = get_event_loop()
         loop.create_task(self.fetch_channels())
         self._web_session = ClientSession()
@@ -35,18 +77,117 @@ class UCube(commands.Cog):
             "verbose": True,  # Will print warning messages for links that have failed to connect or were not found.
             "web_session": self._web_session,  # Existing web session
             "loop": loop,  # current event loop
-            "hook": self.on_new_notifications
+            # no hook, the ucube client would poll every club every 25 seconds. self._poller polls instead.
         }
 
-        self._translate_headers = {"Authorization": getenv("TRANSLATION_KEY")}
-        self._translate_endpoint = getenv("TRANSLATION_URL")
+        self._translator = Translator(self._web_session, getenv("TRANSLATION_URL"),
+                                      {"Authorization": getenv("TRANSLATION_KEY")}, conn=self.bot.conn,
+                                      batch=bool(getenv("TRANSLATION_BATCH")))
         self._ucube_image_folder = getenv("UCUBE_FOLDER_LOCATION")
         self._upload_from_host = getenv("UPLOAD_FROM_HOST")
 
+        # unfinished downloads are kept out of the served folder.
+        media_temp_folder = getenv("MEDIA_TEMP_LOCATION") or None
+        self._media_cache = MediaCache(self._ucube_image_folder,
+                                       max_bytes=int(getenv("MEDIA_CACHE_BYTES") or 5000000000),
+                                       temp_folder=media_temp_folder)
+        self._media_semaphore = Semaphore(int(getenv("MEDIA_CONCURRENCY") or 4))  # parallel media downloads
+        # media over the upload limit is shrunk in worker processes instead of being sent as a link.
+        self._transcoder: Optional[MediaTranscoder] = None
+        if self._upload_from_host and getenv("TRANSCODE_MEDIA"):
+            self._transcoder = MediaTranscoder(
+                path.join(self._ucube_image_folder, "transcoded"),
+                max_bytes=int(getenv("TRANSCODE_CACHE_BYTES") or 1000000000),
+                processes=int(getenv("TRANSCODE_PROCESSES") or 0) or None, ffmpeg=getenv("FFMPEG_LOCATION"),
+                temp_folder=media_temp_folder)
+        self._text_splitter = TextSplitter(EMBED_CAP)
+        self._content_splitter = TextSplitter(CONTENT_LIMIT)
+
+        # in a cluster, worker 0 is the leader that polls UCube and renders every post for the other workers.
+        self._worker_id = self.bot.worker_id
+        self._workers = self.bot.workers
+        self._cluster_server: Optional[ClusterServer] = None
+        self._cluster_client: Optional[ClusterClient] = None
+        if self._workers > 1:
+            socket_location = getenv("CLUSTER_SOCKET") or "/tmp/ucubebot.sock"
+            if self._worker_id == 0:
+                self._cluster_server = ClusterServer(socket_location, greeting=self.get_cluster_greeting,
+                                                     handler=self.on_worker_message)
+                loop.create_task(self._cluster_server.start())
+                loop.create_task(self.publish_clubs())
+            else:
+                self._cluster_client = ClusterClient(socket_location, self.on_cluster_message)
+                self._cluster_client.start()
+
+        # Discord's global rate-limit is shared by every process of the bot.
+        global_limit = max(int(getenv("GLOBAL_RATE_LIMIT") or 50) // self._workers, 1)
+        self._scheduler = DeliveryScheduler(max_concurrency=int(getenv("DELIVERY_CONCURRENCY") or 50),
+                                            global_limit=global_limit)
+        self._queue = NotificationQueue(self.bot.conn, self.deliver_job, self._scheduler,
+                                        on_batch_done=self.save_delivered,
+                                        workers=int(getenv("QUEUE_WORKERS") or 2), worker=self._worker_id,
+                                        group_by=self.get_digest_group, group_handler=self.deliver_digest,
+                                        aging=float(getenv("QUEUE_RANK_AGING") or 100))
+        # digest channels receive the posts of a burst together once the window of the burst closes.
+        self._digest_window = float(getenv("DIGEST_WINDOW") or 120)
+        self._digest_windows: Dict[str, float] = {}  # community name : when its current window closes
+        # Discord only allows 10 crossposts per hour in a news channel, so publishing gets its own buckets and
+        # workers and never holds up sending to other channels.
+        self._publish_queue = PublishQueue(DeliveryScheduler(
+            max_concurrency=int(getenv("PUBLISH_CONCURRENCY") or 5), global_limit=max(global_limit // 10, 1),
+            route_limit=10, route_per=3600))
+        self._publish_queue.start()
+        # webhooks have their own rate-limits (5 requests every 2 seconds per webhook), so channels the bot can
+        # create webhooks in are delivered to faster.
+        self._webhooks: Optional[WebhookPool] = None
+        if getenv("WEBHOOK_DELIVERY"):
+            self._webhooks = WebhookPool(self.bot.conn, self._web_session, DeliveryScheduler(
+                max_concurrency=self._scheduler.max_concurrency,
+                global_limit=max(int(getenv("WEBHOOK_RATE_LIMIT") or 50) // self._workers, 1),
+                route_limit=5, route_per=2.0))
+            loop.create_task(self._webhooks.load())
+        self._planner = DeliveryPlanner(self.get_priority_tiers())
+        self._channel_resolver = ChannelResolver(self.bot, ttl=float(getenv("CHANNEL_CACHE_TTL") or 3600))
+        # media uploaded from the host is uploaded once to an archive channel and followers get its urls.
+        self._media_relay: Optional[MediaRelay] = None
+        if self._upload_from_host and getenv("MEDIA_RELAY_CHANNEL"):
+            self._media_relay = MediaRelay(self._channel_resolver, int(getenv("MEDIA_RELAY_CHANNEL")),
+                                           self._scheduler, upload_limit=UPLOAD_LIMIT)
+        loop.create_task(self.prune_channels_forever())
+        self._rendered_posts: OrderedDict = OrderedDict()  # post slug : Future of a RenderedPost
+        self._queued_at: OrderedDict = OrderedDict()  # post slug : when it was queued (for the first delivery)
+
         self.ucube_client = UCubeClientAsync(**client_kwargs)
+        # every club is polled on its own interval that follows how active it is, and not while nobody follows it.
+        self._poller = PollScheduler(self.poll_club, self.is_club_followed,
+                                     min_interval=float(getenv("POLL_MIN_INTERVAL") or 10),
+                                     max_interval=float(getenv("POLL_MAX_INTERVAL") or 40),
+                                     max_concurrency=int(getenv("POLL_CONCURRENCY") or 4),
+                                     posts_per_poll=float(getenv("POLL_POSTS_PER_POLL") or 0.003))
+
+        if not self._cluster_client:
+            # only the leader of a cluster polls UCube.
+            self.start_ucube_client()
+
+        lifecycle = self.bot.lifecycle
+        lifecycle.on_shutdown(self.stop_intake, STOP_INTAKE)
+        lifecycle.on_shutdown(self.drain, DRAIN)
+        lifecycle.on_shutdown(self.checkpoint, CHECKPOINT)
+        lifecycle.on_shutdown(self.close_connections, CLOSE)
+
+    def start_ucube_client(self):
+        """Restore the clubs from the snapshot and load the live clubs in the background.
+
+        The boards are not loaded by the ucube client since that takes a request per club before it starts
+        checking for notifications. They are refreshed one club at a time once the clubs are loaded instead.
+        """
+        restored = self._club_snapshot.load()
+        if restored:
+            self.ucube_client.clubs.update({club.slug: club for club in restored})
+            self._clubs_loaded.set()
 
         start_kwargs = {
-            "load_boards": True,
+            "load_boards": False,
             "load_posts": False,
             "load_notices": False,
             "load_media": False,
@@ -56,7 +197,137 @@ class UCube(commands.Cog):
             "load_comments": False,
             "follow_all_clubs": False
         }
+        loop = get_event_loop()
         loop.create_task(self.ucube_client.start(**start_kwargs))
+        loop.create_task(self.reconcile_clubs(restored))
+
+    async def reconcile_clubs(self, restored: List[models.Club]):
+        """Replace the restored clubs with the live clubs once loaded, then keep loading new clubs."""
+        while not self.ucube_client.cache_loaded:
+            await sleep(1)
+
+        # the ucube client replaced every club that still exists, so any restored club left was removed from UCube.
+        restored_ids = {id(club) for club in restored}
+        restored_boards = {club.slug: club.boards for club in restored}
+        live_clubs = {}
+        for club_slug, club in self.ucube_client.clubs.items():
+            if id(club) in restored_ids:
+                continue
+            club.boards = club.boards or restored_boards.get(club_slug, {})
+            live_clubs[club_slug] = club
+        # a new dict, since the ucube client may be looping over the current one.
+        self.ucube_client.clubs = live_clubs
+        self._club_registry = ClubRegistry()  # names of restored clubs may have changed.
+        self._clubs_loaded.set()
+        log.info("UCube clubs loaded.", extra={"clubs": len(live_clubs), "restored": len(restored)})
+        for club in live_clubs.values():
+            self._poller.add(club.slug, self.get_post_times(club.notifications))
+        self._poller.start()
+        await self.on_clubs_changed()
+
+        for club in list(live_clubs.values()):
+            try:
+                club.boards = {board.slug: board for board in await self.ucube_client.fetch_club_boards(club.slug)}
+            except Exception as e:
+                log.warning("Failed to load the boards of a club.", extra={"club_slug": club.slug, "error": str(e)})
+        await self.on_clubs_changed()
+
+        interval = float(getenv("CLUB_REFRESH_INTERVAL") or 3600)
+        while True:
+            await sleep(interval)
+            try:
+                await self.load_new_clubs()
+            except Exception:
+                log.exception("Failed to load new UCube clubs.")
+
+    async def load_new_clubs(self):
+        """Add clubs that were created on UCube since the ucube client started."""
+        new_clubs = [club for club in await self.fetch_club_list() if club.slug not in self.ucube_client.clubs]
+        if not new_clubs:
+            return
+
+        for club in new_clubs:
+            club.notifications = await self.ucube_client.fetch_club_notifications(club.slug)
+            club.boards = {board.slug: board for board in await self.ucube_client.fetch_club_boards(club.slug)}
+        self.ucube_client.clubs = {**self.ucube_client.clubs, **{club.slug: club for club in new_clubs}}
+        for club in new_clubs:
+            self._poller.add(club.slug, self.get_post_times(club.notifications))
+        log.info("Loaded new UCube clubs.", extra={"clubs": [club.name for club in new_clubs]})
+        await self.on_clubs_changed()
+
+    async def fetch_club_list(self) -> List[models.Club]:
+        """Fetch every club on UCube without adding them to the clubs of the ucube client.
+
+        ``fetch_all_clubs`` puts every club it fetches in the clubs of the client, replacing known clubs with ones
+        that have no notifications (the notification loop would treat every one of them as new). The same request
+        is made here with the session and token of the client, and the clubs are only returned.
+        """
+        @check_expired_token
+        async def fetch(client: UCubeClientAsync) -> List[models.Club]:
+            url = client.replace(client._all_clubs_url, **{"{feed_amount}": "99999", "{page_number}": "1"})
+            async with client.web_session.get(url=url, headers=client._headers) as resp:
+                if not client._check_status(resp.status, url):
+                    return []
+                data = await resp.json()
+            return [create_club(raw_club) for raw_club in data.get("items") or []]
+
+        return await fetch(self.ucube_client)
+
+    async def save_club_snapshot(self):
+        """Save the clubs of the ucube client to the snapshot."""
+        try:
+            await self._club_snapshot.save(self.ucube_client.clubs.values())
+        except OSError as e:
+            log.warning("Failed to save the club snapshot.", extra={"error": str(e)})
+
+    async def on_clubs_changed(self):
+        """Save the clubs to the snapshot and send them to the workers of the cluster."""
+        await self.save_club_snapshot()
+        if self._cluster_server:
+            await self._cluster_server.broadcast(self.get_clubs_message())
+
+    async def stop_intake(self):
+        """Stop polling UCube (or receiving posts from the cluster leader) when shutting down."""
+        if self._cluster_client:
+            await self._cluster_client.stop()
+        else:
+            await self._poller.stop()
+
+    async def drain(self):
+        """Finish the deliveries in progress, then publish the messages they left in news channels."""
+        await self._queue.stop()
+        await self._publish_queue.drain()
+
+    async def checkpoint(self):
+        """Save which channels every post was delivered to and hand the unfinished deliveries back to the queue.
+
+        The next start delivers the rest of every post from the queue and skips channels that already have it.
+        """
+        await self._queue.checkpoint()
+        await self.save_delivered()
+        if not self._cluster_client and self._clubs_loaded.is_set():
+            await self.save_club_snapshot()
+
+    async def close_connections(self):
+        """Close the network resources of the cog when shutting down."""
+        await self._publish_queue.stop()
+        if self._transcoder:
+            self._transcoder.close()
+        if self._cluster_server:
+            await self._cluster_server.stop()
+        await self._web_session.close()
+
+    async def wait_until_ready(self):
+        """Wait until the following channels and the clubs are loaded."""
+        await self._channels_loaded.wait()
+        await self._clubs_loaded.wait()
+
+    async def cog_before_invoke(self, ctx):
+        """Give a restarting bot a moment to load before answering, instead of answering with no clubs."""
+        try:
+            await wait_for(self.wait_until_ready(), timeout=float(getenv("READY_TIMEOUT") or 30))
+        except TimeoutError:
+            log.warning("Answering a command before the UCube cog is ready.", extra={"command": str(ctx.command)})
 
     async def cog_check(self, ctx):
         """A local check for this cog. Checks if the user is a data mod."""
@@ -65,89 +336,142 @@ class UCube(commands.Cog):
             return False
         return True
 
+    def wake_poller(self, community_name):
+        """Poll a community that was just followed now, it may not have been polled while nobody followed it."""
+        club = self.club_registry.get_by_name(community_name)
+        if club:
+            self._poller.wake(club.slug)
+
+    def is_club_followed(self, club_slug) -> bool:
+        """Check if any channel follows a club, so it is worth polling."""
+        club = self.ucube_client.clubs.get(club_slug)
+        # a club that no longer exists is polled once more so the poller drops it.
+        return not club or self._subscriptions.count(club.name) > 0
+
+    async def poll_club(self, club_slug, emit=True) -> Optional[List[float]]:
+        """Fetch the latest notifications of a club and send the new ones.
+
+        :param club_slug: (str) The club slug.
+        :param emit: (bool) Whether to send the new notifications. Notifications found after the club was not
+            polled for a while are only remembered, they were made before anybody followed it.
+        :returns: The post times of the new notifications, or None if the club no longer exists.
+        """
+        club = self.ucube_client.clubs.get(club_slug)
+        if not club:
+            return None
+
+        notifications = await self.ucube_client.fetch_club_notifications(
+            club_slug, notifications_per_page=NOTIFICATIONS_PER_POLL)
+        known = {notification.slug for notification in club.notifications}
+        new_notifications = [notification for notification in notifications if notification.slug not in known]
+        # only the latest page can show up in the next poll, so older notifications are forgotten instead of
+        # growing for as long as the bot runs. A notification that moves back into the page because a newer one
+        # was deleted is skipped by the dedup index.
+        page = {notification.slug for notification in notifications}
+        for notification in club.notifications:
+            if notification.slug not in page:
+                self.ucube_client.notifications.pop(notification.slug, None)
+        club.notifications = notifications
+        if not new_notifications:
+            return []
+
+        now = time()
+        if not emit:
+            log.info("Caught up on the notifications of a club that was not followed.", extra={
+                "club_slug": club_slug, "notifications": len(new_notifications)})
+            return self.get_post_times(new_notifications, default=now)
+
+        for post_time in self.get_post_times(new_notifications):
+            DETECTION_SECONDS.observe(now - post_time)
+        await self.on_new_notifications(new_notifications)
+        return self.get_post_times(new_notifications, default=now)
+
+    @staticmethod
+    def get_post_times(notifications: List[models.Notification], default=None) -> List[float]:
+        """Get when notifications were created (unix seconds).
+
+        :param notifications: The notifications.
+        :param default: (float) The time of notifications without a readable time, they are skipped if None.
+        """
+        now = time()
+        post_times = []
+        for notification in notifications:
+            try:
+                created_at = datetime.fromisoformat(notification.created_at)
+            except (AttributeError, TypeError, ValueError):
+                if default is not None:
+                    post_times.append(default)
+                continue
+            # a clock ahead of ours should not look like a post in the future.
+            post_times.append(min(created_at.replace(tzinfo=created_at.tzinfo or UCUBE_TIMEZONE).timestamp(), now))
+        return post_times
+
     async def on_new_notifications(self, notifications: List[models.Notification]):
-        """Hook for when there are new notifications."""
+        """Send the new notifications found by a poll."""
+        await self.wait_until_ready()
         for notification in notifications:
             try:
                 await self.send_notification(notification)
-            except Exception as e:
-                print(f"{e} - Notification Slug: {notification.slug} for {notification.club_name} "
-                      f"[{notification.club_slug}] failed to send.")
+            except Exception:
+                log.exception("Notification failed to send.", extra={
+                    "notification_slug": notification.slug, "club_name": notification.club_name,
+                    "club_slug": notification.club_slug})
 
     async def translate(self, text) -> Optional[str]:
-        """Sends a request to translating endpoint from KR to EN and returns the translated string."""
-        try:
-            data = {
-                'text': text,
-                'src_lang': "ko",
-                'target_lang': "en"
-            }
-            async with self._web_session.post(self._translate_endpoint, headers=self._translate_headers, data=data) \
-                    as r:
-                if r.status == 200:
-                    try:
-                        body: dict = await r.json()
-                    except Exception as e:
-                        print(f"{e} - (Exception)")
-                        body = await r.json(content_type="text/html")
-                    if body.get("code") == 0:
-                        return body.get("text")
-        except Exception as e:
-            print(f"{e} - (Exception)")
+        """Translates a string from KR to EN and returns the translated string."""
+        return await self._translator.translate(text, src_lang="ko", target_lang="en")
 
     async def fetch_channels(self):
         """Fetch the channels from DB and add them to cache."""
-        while not self.bot.conn.pool:
-            await sleep(3)  # give time for DataBase connection to establish and properly create tables/schemas.
-        for channel_id, community_name, role_id in await self.bot.conn.fetch_channels():
+        while not self.bot.conn.ready:
+            await sleep(3)  # give time for DataBase connection to establish and properly migrate tables/schemas.
+        async for channel_id, community_name, role_id, digest in self.bot.conn.iter_channels():
+            self._subscriptions.load(community_name, channel_id, role_id, digest)
+        self._subscriptions.sort()
+
+        for community_name, post_slug, seq in await self.bot.conn.fetch_posts():
+            self._dedup.load_post(community_name, post_slug, seq)
 
-            self.add_to_cache(community_name, channel_id, role_id)
+        for community_name, channel_id, high_water, mask in await self.bot.conn.fetch_delivered():
+            self._dedup.load_delivered(community_name, channel_id, high_water, mask)
 
-        # recreate the db (to match a new structure) and insert values from cache.
-        await self.update_db_struct_from_cache()
+        # only deliver queued jobs once we know which channels are following.
+        self._queue.start()
+        self._channels_loaded.set()
 
-    async def update_db_struct_from_cache(self):
-        """Will destroy the current db and update it's structure and reinsert values from the current cache."""
-        await self.bot.conn.recreate_db()
-        for key, channels in self._channels.items():
-            for channel in channels.values():
-                await self.bot.conn.insert_ucube_channel(channel.id, f"{key}")
+    @property
+    def club_registry(self) -> ClubRegistry:
+        """The club registry, synced with any clubs the ucube client has loaded since the last use."""
+        self._club_registry.sync(self.ucube_client.clubs)
+        return self._club_registry
 
     def is_following(self, community_name, channel_id):
         """Check if a channel is following a community."""
-        community_name = community_name.lower()
-        followed_channels = self._channels.get(community_name)
-        if not followed_channels:
-            return False
-
-        return channel_id in followed_channels.keys()
+        return self._subscriptions.is_following(community_name, channel_id)
 
     def check_community_exists(self, community_name):
         """Check if a community name exists."""
         if not community_name:
             return False
 
-        return community_name.lower() in self.get_community_names()
+        return self.club_registry.get_by_name(community_name) is not None
 
     def get_community_names(self) -> list:
         """Returns a list of all available community names."""
-        return [t_community.name.lower() for t_community in self.ucube_client.clubs.values()]
+        return self.club_registry.names
+
+    def get_followed_community_names(self, channel_id) -> list:
+        """Returns a list of the community names a channel is following."""
+        return sorted(self._subscriptions.get_community_names(channel_id))
 
     def get_channel(self, community_name, channel_id) -> Optional[TextChannel]:
         """Get a models.TextChannel object from a community"""
-        channels = self._channels.get(community_name)
-        if channels:
-            return channels.get(channel_id)
+        return self._subscriptions.get(community_name, channel_id)
 
     def add_to_cache(self, community_name, channel_id, role_id):
         """Add a channel to cache."""
-        community_name = community_name.lower()
-        channels = self._channels.get(community_name)
-        this_channel = TextChannel(channel_id, role_id)
-        if not channels:
-            self._channels[community_name] = {channel_id: this_channel}
-        else:
-            channels[channel_id] = this_channel
+        self._subscriptions.add(community_name, channel_id, role_id)
+        self.send_subscription_to_leader("follow", community_name, channel_id)
 
     async def send_communities_available(self, ctx):
         """Send the available communities to a text channel."""
@@ -157,21 +481,97 @@ class UCube(commands.Cog):
 
     async def delete_channel(self, channel_id, community_name):
         """Deletes a channel from a community in the cache and db."""
-        channels = self._channels.get(community_name.lower())
-        try:
-            channels.pop(channel_id)
-        except (AttributeError, KeyError):
-            pass
+        self.remove_from_cache(channel_id, community_name)
         await self.bot.conn.delete_ucube_channel(channel_id, community_name)
+        if self._webhooks and not self._subscriptions.get_community_names(channel_id):
+            await self._webhooks.remove(channel_id)
+
+    def remove_from_cache(self, channel_id, community_name):
+        """Remove a channel from a community in the cache."""
+        self._subscriptions.remove(community_name, channel_id)
+        self._dedup.remove_channel(community_name, channel_id)
+        self._channel_resolver.forget(channel_id)
+        self.send_subscription_to_leader("unfollow", community_name, channel_id)
+
+    def send_subscription_to_leader(self, action, community_name, channel_id):
+        """Tell the leader of a cluster that a channel of this worker followed or unfollowed a community.
+
+        The leader only publishes the posts of communities it knows are followed.
+        """
+        if self._cluster_client:
+            self._cluster_client.send({"type": "subscription", "action": action, "community_name": community_name,
+                                       "channel_id": channel_id})
+
+    async def prune_channels_forever(self):
+        """Prune dead text channels on an interval."""
+        interval = float(getenv("CHANNEL_PRUNE_INTERVAL") or 3600)
+        while True:
+            await sleep(interval)
+            try:
+                await self.prune_channels()
+            except Exception:
+                log.exception("Failed to prune text channels.")
+
+    async def prune_channels(self) -> int:
+        """Remove every subscription of text channels that were deleted or can no longer be posted in.
+
+        Channels are checked against the discord.py cache, only channels missing from it are fetched (a few at a
+        time) and only a NotFound or Forbidden marks those as dead. Everything is removed from the DB with one
+        batched delete.
+
+        :returns: The amount of subscriptions removed.
+        """
+        self._channel_resolver.prune()
+        if not self.bot.is_ready():
+            return 0  # a cold cache would make every channel look deleted.
+
+        dead, missing = [], []
+        for channel_id, community_names in self._subscriptions.iter_channels():
+            channel = self.bot.get_channel(channel_id)
+            if not channel:
+                # with several workers, the channel may be in the guilds of another worker.
+                if self._workers == 1:
+                    missing.append((channel_id, community_names))
+            elif not self.can_post(channel):
+                dead.extend((channel_id, community_name) for community_name in community_names)
+
+        semaphore = Semaphore(int(getenv("CHANNEL_PRUNE_CONCURRENCY") or 10))
+
+        async def check(channel_id, community_names):
+            try:
+                async with semaphore:
+                    channel = await self._channel_resolver.resolve(channel_id)
+            except Exception:
+                return  # not a NotFound or Forbidden, try again on the next pass.
+            if not channel or not self.can_post(channel):
+                dead.extend((channel_id, community_name) for community_name in community_names)
+
+        await gather(*[check(channel_id, community_names) for channel_id, community_names in missing])
+
+        for channel_id, community_name in dead:
+            self.remove_from_cache(channel_id, community_name)
+        if dead:
+            await self.bot.conn.bulk_delete_channels(dead)
+            if self._webhooks:
+                for channel_id in {channel_id for channel_id, _ in dead}:
+                    await self._webhooks.remove(channel_id)
+        log.info("Pruned text channels.", extra={"removed": len(dead), "channels": len(self._subscriptions)})
+        return len(dead)
+
+    @staticmethod
+    def can_post(channel) -> bool:
+        """Check if the bot can send messages to a channel (if the guild is known)."""
+        me = getattr(getattr(channel, "guild", None), "me", None)
+        if not me:
+            return True
+        permissions = channel.permissions_for(me)
+        return permissions.read_messages and permissions.send_messages
 
     @commands.is_owner()
     @commands.command()
     async def testucube(self, ctx):
         """Test posting CLC notifications."""
-        club: Optional[models.Club] = None
-        for club in self.ucube_client.clubs.values():
-            if club.name.lower() == "clc":
-                break
+        club: Optional[models.Club] = self.club_registry.get_by_name("clc")
 
         # only grab the 5 most recent notifications.
         notifications = await self.ucube_client.fetch_club_notifications(club_slug=club.slug, notifications_per_page=5)
@@ -181,15 +581,36 @@ class UCube(commands.Cog):
                 await self.ucube_client.fetch_post(post_slug=notification.post_slug)
                 # now try to post them.
                 await self.send_notification(notification)
-            except Exception as e:
-                print(f"{e} - Failed Test on Notification.")
+            except Exception:
+                log.exception("Failed Test on Notification.", extra={"notification_slug": notification.slug})
+
+    @commands.is_owner()
+    @commands.command()
+    async def prunechannels(self, ctx):
+        """Remove the subscriptions of deleted channels and channels that can not be posted in."""
+        removed = await self.prune_channels()
+        return await ctx.send(f"Removed {removed} subscriptions.")
+
+    @commands.is_owner()
+    @commands.command()
+    async def translationstats(self, ctx):
+        """View the hits and misses of the translation cache."""
+        stats = ', '.join(f"{name}: {count}" for name, count in self._translator.stats.items())
+        return await ctx.send(f"Translation cache - ``{stats}``.")
+
+    @commands.is_owner()
+    @commands.command()
+    async def queue(self, ctx):
+        """View the depth and age of the notification queue."""
+        depth, oldest_age = await self._queue.get_stats()
+        age = f"{oldest_age:.0f}s" if oldest_age is not None else "n/a"
+        return await ctx.send(f"There are {depth} deliveries queued. The oldest was queued {age} ago.")
 
     @commands.command()
     @commands.has_guild_permissions(manage_messages=True)
     async def list(self, ctx):
         """List the communities the current channel is following."""
-        followed_communities = [community_name for community_name in self.get_community_names() if
-                                self.is_following(community_name, ctx.channel.id)]
+        followed_communities = self.get_followed_community_names(ctx.channel.id)
         msg_string = f"You are currently following `{', '.join(followed_communities)}`."
         return await ctx.send(msg_string)
 
@@ -198,18 +619,15 @@ class UCube(commands.Cog):
     async def ucube(self, ctx, *, community_name: str = None):
         """Follow or Unfollow a UCube Community."""
         try:
-            community_names = ', '.join(self.get_community_names())
             if not community_name:
                 return await self.send_communities_available(ctx)
 
             community_name = community_name.lower()
 
-            community: Optional[models.Club] = None
-            for t_community in self.ucube_client.clubs.values():
-                if t_community.name.lower() == community_name:
-                    community = t_community
+            community: Optional[models.Club] = self.club_registry.get_by_name(community_name)
 
             if not community:
+                community_names = ', '.join(self.get_community_names())
                 return await ctx.send(f"The UCube Community Name you have entered does not exist. Your options are "
                                       f"``{community_names}``.")
 
@@ -219,6 +637,9 @@ class UCube(commands.Cog):
             else:
                 self.add_to_cache(community_name, ctx.channel.id, None)
                 await self.bot.conn.insert_ucube_channel(ctx.channel.id, community_name)
+                if not self._cluster_client:
+                    # workers do not poll, the leader wakes the club once it receives the follow.
+                    self.wake_poller(community.name)
                 await ctx.send(f"You are now following {community.name}.")
         except Exception as e:
             return await ctx.send(e)
@@ -240,6 +661,22 @@ class UCube(commands.Cog):
         text_channel.role_id = role.id
         return await ctx.send("That role will now receive notifications.")
 
+    @commands.command()
+    @commands.has_guild_permissions(manage_messages=True)
+    async def digest(self, ctx, *, community_name: str):
+        """Toggle receiving the posts of a community in bursts as a digest instead of one by one."""
+        community_name = community_name.lower()
+        text_channel = await self.get_channel_following(ctx, community_name)
+        if not text_channel:
+            return
+
+        text_channel.digest = not text_channel.digest
+        await self.bot.conn.update_digest(ctx.channel.id, community_name, text_channel.digest)
+        if text_channel.digest:
+            return await ctx.send(f"Posts made within {self._digest_window:.0f} seconds of each other will now be "
+                                  f"sent together.")
+        return await ctx.send("Posts will now be sent one by one.")
+
     @staticmethod
     def get_random_color():
         """Retrieves a random hex color."""
@@ -282,42 +719,63 @@ class UCube(commands.Cog):
         embed.set_image(url=image_url or EmptyEmbed)
         return embed
 
+    async def stream_to_file(self, url, file_location):
+        """Stream a url to a file in chunks so large videos are never fully held in memory.
+
+        :returns: The size of the file and its sha256 hex digest.
+        """
+        file_hash = sha256()
+        size = 0
+        start = perf_counter()
+        async with self._media_semaphore:
+            async with self._web_session.get(url) as resp:
+                async with aiofiles.open(file_location, mode='wb') as fd:
+                    async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        file_hash.update(chunk)
+                        await fd.write(chunk)
+        MEDIA_DOWNLOAD_SECONDS.observe(perf_counter() - start)
+        MEDIA_DOWNLOAD_BYTES.inc(size)
+        return size, file_hash.hexdigest()
+
     async def download_ucube_post(self, url, file_name):
         """Downloads an image url and returns image host url.
 
+        Media that was already downloaded is reused from the media cache.
         If we are to upload from host, it will return the folder location instead (Unless the file is more than 8mb).
 
 
         :returns: (photos/videos)/image links and whether it is from the host.
         """
-        from_host = False
-        async with self._web_session.get(url) as resp:
-            async with aiofiles.open(self._ucube_image_folder + file_name, mode='wb') as fd:
-                data = await resp.read()
-                await fd.write(data)
-                print(f"{len(data)} - Length of UCube File - {file_name}")
-                if len(data) >= 8000000:  # 8 mb
-                    return [f"https://images.irenebot.com/ucube/{file_name}", from_host]
-
-        if self._upload_from_host:
-            from_host = True
-            return [f"{self._ucube_image_folder}{file_name}", from_host]
-        return [f"https://images.irenebot.com/ucube/{file_name}", from_host]
+        entry = await self._media_cache.fetch(url, file_name, self.stream_to_file)
+        file_name = entry["file_name"]
+        log.debug("UCube File ready.", extra={"file_name": file_name, "size": entry["size"]})
+
+        if entry["size"] >= UPLOAD_LIMIT and self._transcoder:
+            # the smallest upload limit of a guild, so one copy fits every channel.
+            transcoded = await self._transcoder.fit(f"{self._ucube_image_folder}{file_name}", UPLOAD_LIMIT)
+            if transcoded:
+                return [self._transcoder.location(transcoded), True]
+
+        if entry["size"] >= UPLOAD_LIMIT or not self._upload_from_host:
+            # messages keep linking to the file, so the media cache may not remove it.
+            await self._media_cache.pin(entry)
+            return [f"https://images.irenebot.com/ucube/{file_name}", False]
+        return [f"{self._ucube_image_folder}{file_name}", True]
 
     async def get_media_files_and_urls(self, main_post: Union[models.Post]):
         """Get media files and file urls of a post or media post."""
-        # will either be file locations or image links.
-        photos = [await self.download_ucube_post(photo.path, photo.name)
-                  for photo in main_post.images]
-
-        videos = []
+        downloads = [self.download_ucube_post(photo.path, photo.name) for photo in main_post.images]
         for video in main_post.videos:
-            file_name = f"{main_post.slug}_{randint(1, 50000000)}.mp4" if not video.name else video.name
-            videos.append(await self.download_ucube_post(video.url, file_name))
+            file_name = f"{main_post.slug}.mp4" if not video.name else video.name
+            downloads.append(self.download_ucube_post(video.url, file_name))
+
+        # will either be file locations or image links (in the same order as the post).
+        files = await gather(*downloads)
 
         media_files = []  # can be photos or videos
         file_urls = []  # urls of photos or videos
-        for file in photos + videos:  # a list of lists containing the image
+        for file in files:  # a list of lists containing the image
             media = file[0]
             from_host = file[1]
 
@@ -332,35 +790,314 @@ class UCube(commands.Cog):
         return media_files, message
 
     async def send_notification(self, notification: models.Notification):
-        """Send a notification post to all of the channels following."""
-        post = self.ucube_client.get_post(notification.post_slug)
-        club = self.ucube_client.get_club(notification.club_slug)
+        """Queue a notification post for all of the channels following."""
+        if not notification.post_slug:
+            # not every notification is about a post, and those have nothing to deliver.
+            log.info("Notification has no post to send.", extra={
+                "notification_slug": notification.slug, "club_slug": notification.club_slug})
+            return
 
-        channels = self._channels.get(club.name.lower())
-        if not channels:
-            print(f"{club.name} has no channels to send Post Slug: {post.slug} to.")
+        club = self.club_registry.get_by_slug(notification.club_slug)
+
+        if not self._subscriptions.count(club.name):
+            log.info("Club has no channels to send the post to.", extra={
+                "club_name": club.name, "post_slug": notification.post_slug})
             return
 
-        channels = (channels.copy()).values()
+        if self._cluster_server:
+            return await self.publish_post(club, notification.post_slug)
+        await self.queue_deliveries(club.slug, notification.post_slug, club.name.lower())
+
+    async def queue_deliveries(self, club_slug, post_slug, community_name):
+        """Queue a post for the channels following a community (in a cluster, only the channels of our guilds)."""
+        targets = [PlannedChannel(channel_id, role_id, getattr(self.bot.get_channel(channel_id), "guild", None))
+                   for channel_id, role_id in self._subscriptions.iter_community(community_name)]
+        # in a cluster, channels that are not in our guilds belong to another worker.
+        targets = [target for target in targets if self._workers == 1 or target.guild]
+        if not targets:
+            return
 
-        embed_title = f"New [{club.name}] {post.user.name} Notification!"
-        embed_list = await self.set_post_embeds(post, embed_title)
-        media_files, message_text = await self.get_media_files_and_urls(post)
+        self._queued_at.setdefault(post_slug, perf_counter())
+        while len(self._queued_at) > 1000:
+            self._queued_at.popitem(last=False)
+        NOTIFICATIONS_QUEUED.inc()
+        planned = self._planner.plan(targets, lambda target: target.guild.id if target.guild else target.id)
+        digests = self._subscriptions.get_digests(community_name)
+        await self._queue.enqueue([(club_slug, post_slug, community_name, target.id, rank)
+                                   for target, rank in planned if target.id not in digests])
+        if digests:
+            await self._queue.enqueue([(club_slug, post_slug, community_name, target.id, rank)
+                                       for target, rank in planned if target.id in digests],
+                                      delay=self.get_digest_delay(community_name))
+
+    def get_digest_delay(self, community_name) -> float:
+        """Get the seconds until the digest window of a community closes, opening a new window if needed.
+
+        Every post of a burst shares the window opened by its first post, so the jobs of a burst become
+        available together and are delivered as one digest.
+        """
+        now = perf_counter()
+        closes_at = self._digest_windows.get(community_name)
+        if not closes_at or closes_at <= now:
+            closes_at = self._digest_windows[community_name] = now + self._digest_window
+        return closes_at - now
+
+    def get_digest_group(self, job):
+        """Group the claimed jobs of a digest channel by community (None for channels without digests)."""
+        if self._subscriptions.is_digest(job["communityname"], job["channelid"]):
+            return job["communityname"], job["channelid"]
+        return None
 
-        for channel_info in channels:
-            try:
-                channel_info: TextChannel = channel_info
-                await sleep(2)
+    @staticmethod
+    def get_priority_tiers() -> list:
+        """The priority tiers of the delivery planner (channels of priority guilds, then role mentions)."""
+        tiers = []
+        priority_guilds = {int(guild_id) for guild_id in (getenv("PRIORITY_GUILDS") or "").split(",") if guild_id}
+        if priority_guilds:
+            tiers.append(lambda channel: getattr(channel.guild, "id", None) in priority_guilds)
+        if getenv("PRIORITY_ROLE_MENTIONS"):
+            tiers.append(lambda channel: channel.role_id)
+        return tiers
+
+    def get_clubs_message(self) -> dict:
+        """The cluster message with every club the leader knows about."""
+        return {"type": "clubs", "clubs": [[club.slug, club.name] for club in self.ucube_client.clubs.values()]}
+
+    async def get_cluster_greeting(self) -> List[dict]:
+        """The messages a worker receives when it connects to the leader."""
+        return [self.get_clubs_message()]
+
+    async def publish_clubs(self):
+        """Send the clubs to the workers once they are restored or loaded."""
+        await self._clubs_loaded.wait()
+        await self._cluster_server.broadcast(self.get_clubs_message())
+
+    async def publish_post(self, club: models.Club, post_slug):
+        """Render a post once and queue it for every worker of the cluster (including this one).
+
+        The leader gives the post its sequence and stores it with the rendered post, so every worker tracks
+        deliveries the same way and loads the post from the DB. Every other worker gets a fan-out job in the
+        queue that it turns into the deliveries of its own guilds, so a worker that is down or reconnecting
+        receives the post once it claims its jobs again. The message sent over the socket only saves workers
+        the wait for their next claim and a DB read.
+        """
+        community_name = club.name.lower()
+        # the post is stored first, so the rendered post can be stored with it for the workers.
+        seq = await self.get_post_seq(community_name, post_slug)
+        rendered = await self.get_rendered_post(club.slug, post_slug, community_name)
+
+        for worker in range(1, self._workers):
+            await self._queue.enqueue([(club.slug, post_slug, community_name, self.get_fan_out_channel(worker), 0)],
+                                      worker=worker)
+        await self._cluster_server.broadcast({"type": "post", "community_name": community_name, "seq": seq,
+                                              "post": rendered.to_dict()})
+        await self.queue_deliveries(club.slug, post_slug, community_name)
 
-                if post.slug in channel_info.already_posted:
-                    continue
+    @staticmethod
+    def get_fan_out_channel(worker) -> int:
+        """The channel ID of the fan-out jobs of a cluster worker (discord snowflakes are never negative)."""
+        return -1 - worker
+
+    async def on_cluster_message(self, message: dict):
+        """Handle a message from the leader of the cluster."""
+        if message["type"] == "clubs":
+            for club_slug, club_name in message["clubs"]:
+                self._club_registry.add(ClusterClub(club_slug, club_name))
+            self._clubs_loaded.set()
+        elif message["type"] == "post":
+            # the fan-out job of the post is in the queue, claim it now.
+            post_slug = message["post"]["post_slug"]
+            self._dedup.load_post(message["community_name"], post_slug, message["seq"])
+            if post_slug not in self._rendered_posts:
+                try:
+                    rendered = await RenderedPost.from_dict(message["post"])
+                except OSError:
+                    pass  # its media is gone, the jobs ask the leader to render it again.
+                else:
+                    self.cache_rendered_post(post_slug).set_result(rendered)
+            self._queue.wake()
+
+    async def on_worker_message(self, message: dict):
+        """Handle a message from a worker of the cluster."""
+        if message["type"] == "subscription":
+            # only the subscriptions are tracked, the worker of the channel delivers to it.
+            if message["action"] == "follow":
+                self._subscriptions.add(message["community_name"], message["channel_id"])
+                self.wake_poller(message["community_name"])
+            else:
+                self._subscriptions.remove(message["community_name"], message["channel_id"])
+        elif message["type"] == "render":
+            await self.render_again(message["club_slug"], message["post_slug"], message["community_name"])
 
-                channel_info.already_posted.append(post.slug)
+    async def deliver_job(self, job) -> bool:
+        """Deliver a queued notification post to a single channel.
 
-                print(f"Sending Post Slug: {post.slug} to text channel {channel_info.id}")
-                await self.send_ucube_to_channel(channel_info, message_text, embed_list, media_files, club.name)
-            except Exception as e:
-                print(f"{e} - Failed to send to channel id {channel_info.id}.")
+        :param job: The queued job record.
+        :returns: False if the job should be retried.
+        """
+        community_name = job["communityname"]
+        if job["channelid"] < 0:
+            # a post the cluster leader queued for this worker, the guild cache tells which channels are ours.
+            await self.bot.wait_until_ready()
+            await self.queue_deliveries(job["clubslug"], job["postslug"], community_name)
+            return True
+
+        channel_info = self.get_channel(community_name, job["channelid"])
+        if not channel_info:
+            return True  # the channel is no longer following.
+
+        seq = await self.get_post_seq(community_name, job["postslug"])
+        if self._dedup.is_delivered(community_name, channel_info.id, seq):
+            return True
+
+        rendered = await self.get_rendered_post(job["clubslug"], job["postslug"], community_name)
+        log.debug("Sending post to text channel.", extra={"post_slug": rendered.post_slug,
+                                                          "channel_id": channel_info.id})
+        if not await self.send_rendered(channel_info, rendered):
+            return False
+        self.record_delivery(community_name, channel_info.id, seq, rendered.post_slug)
+        return True
+
+    async def deliver_digest(self, jobs) -> bool:
+        """Deliver several queued posts of a community to a digest channel in as few messages as possible.
+
+        :param jobs: The queued job records of one channel and community.
+        :returns: False if the jobs should be retried.
+        """
+        community_name = jobs[0]["communityname"]
+        channel_info = self.get_channel(community_name, jobs[0]["channelid"])
+        if not channel_info:
+            return True
+
+        posts = []  # (seq, rendered post) in the order they were posted
+        for job in jobs:
+            seq = await self.get_post_seq(community_name, job["postslug"])
+            if not self._dedup.is_delivered(community_name, channel_info.id, seq):
+                posts.append((seq, await self.get_rendered_post(job["clubslug"], job["postslug"], community_name)))
+        posts.sort(key=lambda post: post[0])
+        seqs = {rendered.post_slug: seq for seq, rendered in posts}
+
+        for digest in RenderedPost.pack_digests([rendered for _, rendered in posts], max_bytes=UPLOAD_LIMIT):
+            log.debug("Sending digest to text channel.", extra={"posts": len(digest), "channel_id": channel_info.id})
+            if not await self.send_rendered(channel_info, RenderedPost.merge(digest, MAX_EMBEDS_PER_MESSAGE)):
+                return False  # the posts that were sent are skipped by the retry.
+            for rendered in digest:
+                self.record_delivery(community_name, channel_info.id, seqs[rendered.post_slug], rendered.post_slug)
+        return True
+
+    async def send_rendered(self, channel_info: TextChannel, rendered: RenderedPost) -> bool:
+        """Send a rendered post (or digest) to a channel and record how long it took."""
+        start = perf_counter()
+        sent = await self.send_ucube_to_channel(channel_info, rendered)
+        CHANNEL_SEND_SECONDS.observe(perf_counter() - start)
+        CHANNEL_SENDS.inc(result="sent" if sent else "failed")
+        return sent
+
+    def record_delivery(self, community_name, channel_id, seq, post_slug):
+        """Remember that a post was delivered to a channel."""
+        self._dedup.claim(community_name, channel_id, seq)
+        queued_at = self._queued_at.pop(post_slug, None)
+        if queued_at:
+            FIRST_DELIVERY_SECONDS.observe(perf_counter() - queued_at)
+
+    async def get_post_seq(self, community_name, post_slug) -> int:
+        """Get the sequence of a post, storing it if the post is new.
+
+        Cluster workers never create one, they use the sequence the leader stored.
+        """
+        if self._cluster_client:
+            seq = self._dedup.find_seq(community_name, post_slug)
+            if not seq:
+                post = await self.bot.conn.fetch_post(community_name, post_slug)
+                if not post:
+                    raise LookupError(f"The post {post_slug} of {community_name} is not stored.")
+                seq = post[0]
+                self._dedup.load_post(community_name, post_slug, seq)
+            return seq
+
+        seq, new_post = self._dedup.get_seq(community_name, post_slug)
+        if new_post:
+            await self.bot.conn.insert_post(community_name, post_slug, seq)
+            await self.bot.conn.delete_old_posts(community_name, self._dedup.oldest_seq(community_name))
+        return seq
+
+    async def save_delivered(self):
+        """Save the delivery state of every channel that changed."""
+        for community_name, delivered in self._dedup.pop_all_dirty().items():
+            await self.bot.conn.update_delivered(community_name, delivered)
+
+    async def get_rendered_post(self, club_slug, post_slug, community_name) -> RenderedPost:
+        """Get a rendered post, rendering it only once no matter how many channels need it.
+
+        Only a few posts are kept in memory. Rendered posts are stored with the post in the DB, so posts that
+        were dropped from memory (or rendered before a restart) are loaded instead of rendered again, unless the
+        media cache deleted their files. Cluster workers are not logged in to UCube, they only load the posts the
+        leader stored and ask it to render a post again when they can not.
+        """
+        rendered = self._rendered_posts.get(post_slug)
+        if rendered:
+            self._rendered_posts.move_to_end(post_slug)
+            return await rendered
+
+        rendered = self.cache_rendered_post(post_slug)
+        try:
+            stored = await self.load_rendered_post(community_name, post_slug)
+            if stored:
+                rendered.set_result(stored)
+            elif self._cluster_client:
+                self._cluster_client.send({"type": "render", "club_slug": club_slug, "post_slug": post_slug,
+                                           "community_name": community_name})
+                raise LookupError(f"The rendered post {post_slug} of {community_name} can not be loaded, the "
+                                  f"leader renders it again for the retry.")
+            else:
+                post = self.ucube_client.get_post(post_slug) or await self.ucube_client.fetch_post(post_slug)
+                new = await self.render_post(post, self.club_registry.get_by_slug(club_slug))
+                # the post itself was stored by get_post_seq.
+                await self.bot.conn.update_rendered_post(community_name, post_slug, json.dumps(new.to_dict()))
+                rendered.set_result(new)
+        except Exception as e:
+            # let the next job try to render it again.
+            self._rendered_posts.pop(post_slug, None)
+            rendered.set_exception(e)
+        return await rendered
+
+    async def load_rendered_post(self, community_name, post_slug) -> Optional[RenderedPost]:
+        """Load a rendered post from the DB (None if it was not stored or its media files were deleted)."""
+        post = await self.bot.conn.fetch_post(community_name, post_slug)
+        if not post or not post[1]:
+            return None
+        try:
+            return await RenderedPost.from_dict(json.loads(post[1]))
+        except OSError as e:
+            log.info("Media of a stored post is gone, it is rendered again.", extra={
+                "post_slug": post_slug, "error": str(e)})
+            return None
+
+    async def render_again(self, club_slug, post_slug, community_name):
+        """Render a post again and store it, for a worker whose stored copy lost its media files."""
+        pending = self._rendered_posts.get(post_slug)
+        if pending and not pending.done():
+            return  # it is being rendered.
+        self._rendered_posts.pop(post_slug, None)
+        await self.get_rendered_post(club_slug, post_slug, community_name)
+
+    def cache_rendered_post(self, post_slug) -> Future:
+        """Add a Future of a rendered post to the cache and return it."""
+        rendered = self._rendered_posts[post_slug] = Future()
+        while len(self._rendered_posts) > MAX_RENDERED_POSTS:
+            self._rendered_posts.popitem(last=False)
+        return rendered
+
+    async def render_post(self, post: models.Post, club: models.Club) -> RenderedPost:
+        """Render the embeds and media of a post once so it can be sent to every channel."""
+        embed_title = f"New [{club.name}] {post.user.name} Notification!"
+        embed_list = await self.set_post_embeds(post, embed_title)
+        media_files, message_text = await self.get_media_files_and_urls(post)
+        rendered = await RenderedPost.create(club.name, post.slug, embed_list, media_files, message_text,
+                                             max_embeds=MAX_EMBEDS_PER_MESSAGE)
+        if self._media_relay:
+            rendered = await self._media_relay.relay(rendered)
+        return rendered
 
     async def set_post_embeds(self, post: models.Post, embed_title) -> List[discord.Embed]:
         """Set Post Embed for Weverse.
@@ -373,13 +1110,7 @@ class UCube(commands.Cog):
         embed_description = f"Content: **{post.content}**\n" \
                             f"Translated Content: **{translation}**"
 
-        desc_list = []
-        while len(embed_description) >= EMBED_CAP:
-            desc_list.append(embed_description[0:EMBED_CAP])
-            embed_description = embed_description[0:len(embed_description)]
-
-        if embed_description:
-            desc_list.append(embed_description[0:len(embed_description)])
+        desc_list = self._text_splitter.split(embed_description)
 
         embed_list = []
         for count, desc in enumerate(desc_list, 1):
@@ -388,57 +1119,134 @@ class UCube(commands.Cog):
 
         return embed_list
 
-    async def send_ucube_to_channel(self, channel_info: TextChannel, message_text, embed_list, media_files, club_name):
-        """Send a UCube post to a channel."""
-        ...
+    async def send_ucube_to_channel(self, channel_info: TextChannel, rendered: RenderedPost) -> bool:
+        """Send a rendered UCube post to a channel.
+
+        :returns: False if the post failed to send and should be retried.
+        """
+        club_name = rendered.club_name
         try:
-            channel: discord.TextChannel = self.bot.get_channel(channel_info.id)
-            if not channel:
-                # fetch channel instead (assuming discord.py cache did not load)
-                channel: discord.TextChannel = await self.bot.fetch_channel(channel_info.id)
+            channel: Optional[discord.TextChannel] = await self._channel_resolver.resolve(channel_info.id)
         except Exception as e:
+            log.warning("Failed to look up Text Channel.", extra={
+                "channel_id": channel_info.id, "club_name": club_name, "error": str(e)})
+            return False
+
+        if not channel:
             # remove the channel from future updates as it cannot be found.
-            print(f"{e} - Removing Text Channel {channel_info.id} from cache for {club_name} since it could not "
-                  f"be processed/found.")
-            return await self.delete_channel(channel_info.id, club_name.lower())
+            log.warning("Removing Text Channel from cache since it could not be processed/found.", extra={
+                "channel_id": channel_info.id, "club_name": club_name})
+            await self.delete_channel(channel_info.id, club_name.lower())
+            return True
 
         msg_list: List[discord.Message] = []
-        file_list = []
+        webhook: Optional[discord.Webhook] = None
 
         try:
-            mention_role = f"<@&{channel_info.role_id}>" if channel_info.role_id else None
-
-            for count, embed in enumerate(embed_list, 1):
-                msg_list.append(await channel.send(mention_role if count == 1 else None, embed=embed))
-
-            if message_text or media_files:
-                # Since an embed already exists, any individual content will not load
-                # as an embed -> Make it it's own message.
-                if media_files:
-                    # a list of file locations
-                    for photo_location in media_files:
-                        file_list.append(discord.File(photo_location))
-
-                msg_list.append(await channel.send(message_text if message_text else None, files=file_list or None))
-                print(f"UCube Post for {club_name} sent to {channel_info.id}.")
+            if self._webhooks:
+                webhook = await self._webhooks.get(channel)
+
+            if webhook:
+                try:
+                    msg_list = await self.send_with_webhook(webhook, channel, channel_info, rendered)
+                except discord.HTTPException as e:
+                    if e.status not in (401, 403, 404):
+                        raise
+                    # the webhook was deleted or its token is no longer valid (not the bot's permissions), the
+                    # next post creates a new one and this one is sent by the bot.
+                    log.warning("Webhook is no longer valid.", extra={
+                        "club_name": club_name, "channel_id": channel_info.id, "status": e.status})
+                    await self._webhooks.invalidate(channel_info.id)
+                    webhook = None
+            if not webhook:
+                msg_list = await self.send_with_channel(channel, channel_info, rendered)
+            log.info("UCube Post sent.", extra={
+                "club_name": club_name, "channel_id": channel_info.id, "webhook": bool(webhook)})
         except discord.Forbidden as e:
             # no permission to post
-            print(f"{e} (discord.Forbidden) - UCube Post Failed to {channel_info.id} for {club_name}")
+            log.warning("UCube Post Failed (discord.Forbidden).", extra={
+                "club_name": club_name, "channel_id": channel_info.id, "error": str(e)})
 
             # remove the channel from future updates as we do not want it to clog our rate-limits.
-            return await self.delete_channel(channel_info.id, club_name.lower())
-        except Exception as e:
-            print(f"{e} (Exception) - UCube Post Failed to {channel_info.id} for {club_name}")
-            return
+            await self.delete_channel(channel_info.id, club_name.lower())
+            return True
+        except discord.HTTPException as e:
+            if e.status == 429:
+                scheduler = self._webhooks.scheduler if webhook else self._scheduler
+                scheduler.rate_limited(channel_info.id, e)
+            log.warning("UCube Post Failed (discord.HTTPException).", extra={
+                "club_name": club_name, "channel_id": channel_info.id, "status": e.status, "error": str(e)})
+            return False
+        except Exception:
+            log.exception("UCube Post Failed.", extra={"club_name": club_name, "channel_id": channel_info.id})
+            return False
 
-        if not channel.is_news():
-            return
+        if channel.is_news():
+            self._publish_queue.publish(channel_info.id, msg_list)
+        return True
 
-        for msg in msg_list:
-            try:
-                await msg.publish()
-            except Exception as e:
-                print(f"Failed to publish Message ID: {msg.id} for Channel ID: {channel_info.id} - {e}")
+    async def send_with_channel(self, channel: discord.TextChannel, channel_info: TextChannel,
+                                rendered: RenderedPost) -> List[discord.Message]:
+        """Send a rendered UCube post to a channel as the bot.
+
+        :returns: The messages that were sent.
+        """
+        mention_role = f"<@&{channel_info.role_id}>" if channel_info.role_id else None
+        messages = []
+
+        for count, embeds in enumerate(rendered.embeds, 1):
+            await self._scheduler.throttle(channel_info.id)
+            content = mention_role if count == 1 else None
+            if MAX_EMBEDS_PER_MESSAGE > 1:
+                messages.append(await channel.send(content, embeds=list(embeds)))
+            else:
+                messages.append(await channel.send(content, embed=embeds[0]))
+
+        # Since an embed already exists, any individual content will not load
+        # as an embed -> Make it it's own message.
+        for content, files in self.get_text_messages(rendered):
+            await self._scheduler.throttle(channel_info.id)
+            messages.append(await channel.send(content, files=files))
+        return messages
+
+    def get_text_messages(self, rendered: RenderedPost) -> List[tuple]:
+        """Split the media urls and attachments of a rendered post into messages Discord accepts.
+
+        A post can have more urls (of relayed or large media) than fit in the content of one message.
+
+        :returns: A list of (content, files) with the attachments on the first message.
+        """
+        contents = self._content_splitter.split(rendered.message_text or "")
+        if not contents and not rendered.attachments:
+            return []
+        files = rendered.get_files() or None
+        return [(content, files if count == 0 else None) for count, content in enumerate(contents or [None])]
+
+    async def send_with_webhook(self, webhook: discord.Webhook, channel: discord.TextChannel,
+                                channel_info: TextChannel, rendered: RenderedPost) -> List[discord.PartialMessage]:
+        """Send a rendered UCube post through the webhook of a channel.
+
+        Webhooks can send several embeds in one message with every discord.py version.
+
+        :returns: The messages that were sent (as partial messages of the channel so they can be published).
+        """
+        scheduler = self._webhooks.scheduler
+        me = channel.guild.me
+        identity = {"username": me.display_name, "avatar_url": str(me.avatar_url)}
+        content = f"<@&{channel_info.role_id}>" if channel_info.role_id else None
+        messages = []
+
+        for embeds in TextSplitter.pack([embed for group in rendered.embeds for embed in group], size=len):
+            await scheduler.throttle(channel_info.id)
+            messages.append(await webhook.send(content, embeds=embeds, wait=True, **identity))
+            content = None
+
+        for content, files in self.get_text_messages(rendered):
+            await scheduler.throttle(channel_info.id)
+            messages.append(await webhook.send(content, files=files, wait=True, **identity))
+
+        # webhook messages can not publish themselves, the bot publishes them.
+        return [channel.get_partial_message(message.id) for message in messages]
 
 
 def setup(bot: commands.AutoShardedBot):
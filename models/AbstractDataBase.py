@@ -1,11 +1,33 @@
+from functools import wraps
+from time import perf_counter
+from .Metrics import metrics
+
+QUERY_SECONDS = metrics.histogram("ucube_db_query_seconds", "Time of a DataBase call by statement.")
+
+
+def timed(method):
+    """Record how long a DataBase coroutine method takes, labeled by its name."""
+    @wraps(method)
+    async def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            QUERY_SECONDS.observe(perf_counter() - start, statement=method.__name__)
+    return wrapper
+
+
 class AbstractDataBase:
     """
     Abstract Base for a DataBase.
 
     Inherit this class in a new model if you are using a different DB.
     """
-    def __init__(self, host, database, user, password, port, schema_name="ucubebot", table_name="channels"):
+    def __init__(self, host, database, user, password, port, schema_name="ucubebot", table_name="channels",
+                 posts_table_name="posts", delivered_table_name="delivered", translations_table_name="translations",
+                 queue_table_name="queue", webhooks_table_name="webhooks"):
         self.pool = None
+        self.ready = False  # whether the migrations have finished.
 
         self.host = host
         self._database = database
@@ -35,27 +57,221 @@ class AbstractDataBase:
             )
         """
         self._insert_channel_sql = f"INSERT INTO {self._schema_name}.{self._table_name}(channelid, communityname, " \
-                                   f"roleid) VALUES($1, $2, $3)"
+                                   f"roleid) VALUES($1, $2, $3) ON CONFLICT DO NOTHING"
         self._delete_channel_sql = f"DELETE FROM {self._schema_name}.{self._table_name} WHERE channelid = $1 AND " \
                                    f"communityname = $2"
         self._toggle_sql = f"UPDATE {self._schema_name}.{self._table_name} SET column_name=$1 WHERE channelid = " \
                            f"$2 AND communityname = $3"
         self._update_role_sql = self._toggle_sql.replace("column_name", "roleid")
-        self._fetch_all_sql = f"SELECT channelid, communityname, roleid FROM " \
+        self._update_digest_sql = self._toggle_sql.replace("column_name", "digest")
+        self._fetch_all_sql = f"SELECT channelid, communityname, roleid, digest FROM " \
                               f"{self._schema_name}.{self._table_name}"
-        self._drop_schema_sql = f"DROP SCHEMA IF EXISTS {self._schema_name}"
-        self._drop_table_sql = f"DROP TABLE IF EXISTS {self._schema_name}.{self._table_name}"
+
+        # dedup tables
+        self._posts_table_name = posts_table_name
+        self._delivered_table_name = delivered_table_name
+        self._create_posts_table_sql = f"""
+            CREATE TABLE IF NOT EXISTS {self._schema_name}.{self._posts_table_name}
+            (
+                communityname text,
+                postslug text,
+                seq bigint,
+                PRIMARY KEY (communityname, postslug)
+            )
+        """
+        self._create_delivered_table_sql = f"""
+            CREATE TABLE IF NOT EXISTS {self._schema_name}.{self._delivered_table_name}
+            (
+                communityname text,
+                channelid bigint,
+                highwater bigint,
+                mask bigint,
+                PRIMARY KEY (communityname, channelid)
+            )
+        """
+        self._insert_post_sql = f"INSERT INTO {self._schema_name}.{self._posts_table_name}(communityname, " \
+                                f"postslug, seq) VALUES($1, $2, $3) ON CONFLICT DO NOTHING"
+        self._delete_old_posts_sql = f"DELETE FROM {self._schema_name}.{self._posts_table_name} WHERE " \
+                                     f"communityname = $1 AND seq < $2"
+        self._upsert_delivered_sql = f"INSERT INTO {self._schema_name}.{self._delivered_table_name}(communityname, " \
+                                     f"channelid, highwater, mask) VALUES($1, $2, $3, $4) ON CONFLICT " \
+                                     f"(communityname, channelid) DO UPDATE SET highwater = EXCLUDED.highwater, " \
+                                     f"mask = EXCLUDED.mask"
+        self._delete_delivered_sql = f"DELETE FROM {self._schema_name}.{self._delivered_table_name} WHERE " \
+                                     f"channelid = $1 AND communityname = $2"
+        self._fetch_posts_sql = f"SELECT communityname, postslug, seq FROM " \
+                                f"{self._schema_name}.{self._posts_table_name} ORDER BY seq"
+        self._update_rendered_post_sql = f"UPDATE {self._schema_name}.{self._posts_table_name} SET rendered = $3 " \
+                                         f"WHERE communityname = $1 AND postslug = $2"
+        self._fetch_post_sql = f"SELECT seq, rendered FROM {self._schema_name}.{self._posts_table_name} WHERE " \
+                               f"communityname = $1 AND postslug = $2"
+        self._fetch_delivered_sql = f"SELECT communityname, channelid, highwater, mask FROM " \
+                                    f"{self._schema_name}.{self._delivered_table_name}"
+
+        # translation cache
+        self._translations_table_name = translations_table_name
+        self._create_translations_table_sql = f"""
+            CREATE TABLE IF NOT EXISTS {self._schema_name}.{self._translations_table_name}
+            (
+                key text,
+                translated text,
+                PRIMARY KEY (key)
+            )
+        """
+        self._insert_translation_sql = f"INSERT INTO {self._schema_name}.{self._translations_table_name}(key, " \
+                                       f"translated) VALUES($1, $2) ON CONFLICT DO NOTHING"
+        self._fetch_translation_sql = f"SELECT translated FROM {self._schema_name}.{self._translations_table_name} " \
+                                      f"WHERE key = $1"
+
+        # notification queue
+        self._queue_table_name = queue_table_name
+        self._create_queue_table_sql = f"""
+            CREATE TABLE IF NOT EXISTS {self._schema_name}.{self._queue_table_name}
+            (
+                id bigserial,
+                clubslug text,
+                postslug text,
+                communityname text,
+                channelid bigint,
+                attempts integer NOT NULL DEFAULT 0,
+                availableat timestamptz NOT NULL DEFAULT now(),
+                createdat timestamptz NOT NULL DEFAULT now(),
+                PRIMARY KEY (id),
+                UNIQUE (postslug, communityname, channelid)
+            );
+            CREATE INDEX IF NOT EXISTS {self._queue_table_name}_availableat
+                ON {self._schema_name}.{self._queue_table_name} (availableat)
+        """
+        self._enqueue_job_sql = f"INSERT INTO {self._schema_name}.{self._queue_table_name}(clubslug, postslug, " \
+                                f"communityname, channelid, worker, rank) VALUES($1, $2, $3, $4, $5, $6) " \
+                                f"ON CONFLICT DO NOTHING"
+        self._enqueue_delayed_job_sql = f"INSERT INTO {self._schema_name}.{self._queue_table_name}(clubslug, " \
+                                        f"postslug, communityname, channelid, worker, rank, availableat) VALUES($1, " \
+                                        f"$2, $3, $4, $5, $6, now() + make_interval(secs => $7)) ON CONFLICT DO NOTHING"
+        self._claim_jobs_sql = f"UPDATE {self._schema_name}.{self._queue_table_name} SET availableat = now() + " \
+                               f"make_interval(secs => $2) WHERE id IN (SELECT id FROM " \
+                               f"{self._schema_name}.{self._queue_table_name} WHERE worker = $3 AND " \
+                               f"availableat <= now() ORDER BY rank, id LIMIT $1 FOR UPDATE SKIP LOCKED) " \
+                               f"RETURNING id, clubslug, postslug, communityname, channelid, attempts"
+        self._claim_channel_jobs_sql = f"UPDATE {self._schema_name}.{self._queue_table_name} SET availableat = " \
+                                       f"now() + make_interval(secs => $4) WHERE id IN (SELECT id FROM " \
+                                       f"{self._schema_name}.{self._queue_table_name} WHERE worker = $3 AND " \
+                                       f"communityname = $1 AND channelid = $2 AND availableat <= now() " \
+                                       f"FOR UPDATE SKIP LOCKED) " \
+                                       f"RETURNING id, clubslug, postslug, communityname, channelid, attempts"
+        self._complete_job_sql = f"DELETE FROM {self._schema_name}.{self._queue_table_name} WHERE id = $1"
+        self._retry_job_sql = f"UPDATE {self._schema_name}.{self._queue_table_name} SET attempts = attempts + 1, " \
+                              f"availableat = now() + make_interval(secs => $2) WHERE id = $1"
+        self._release_jobs_sql = f"UPDATE {self._schema_name}.{self._queue_table_name} SET availableat = now() " \
+                                 f"WHERE id = ANY($1::bigint[])"
+        self._fetch_queue_stats_sql = f"SELECT count(*), EXTRACT(EPOCH FROM now() - min(createdat)) FROM " \
+                                      f"{self._schema_name}.{self._queue_table_name}"
+
+        # webhooks
+        self._webhooks_table_name = webhooks_table_name
+        self._create_webhooks_table_sql = f"""
+            CREATE TABLE IF NOT EXISTS {self._schema_name}.{self._webhooks_table_name}
+            (
+                channelid bigint,
+                webhookid bigint,
+                token text,
+                PRIMARY KEY (channelid)
+            )
+        """
+        self._upsert_webhook_sql = f"INSERT INTO {self._schema_name}.{self._webhooks_table_name}(channelid, " \
+                                   f"webhookid, token) VALUES($1, $2, $3) ON CONFLICT (channelid) DO UPDATE SET " \
+                                   f"webhookid = EXCLUDED.webhookid, token = EXCLUDED.token"
+        self._delete_webhook_sql = f"DELETE FROM {self._schema_name}.{self._webhooks_table_name} WHERE channelid = $1"
+        self._fetch_webhooks_sql = f"SELECT channelid, webhookid, token FROM " \
+                                   f"{self._schema_name}.{self._webhooks_table_name}"
+
+        # bulk loads
+        self._create_staging_table_sql = f"CREATE TEMPORARY TABLE staging_channels (channelid bigint, " \
+                                         f"communityname text, roleid bigint) ON COMMIT DROP"
+        self._merge_staging_table_sql = f"INSERT INTO {self._schema_name}.{self._table_name}(channelid, " \
+                                        f"communityname, roleid) SELECT channelid, communityname, roleid FROM " \
+                                        f"staging_channels ON CONFLICT (channelid, communityname) DO UPDATE SET " \
+                                        f"roleid = EXCLUDED.roleid"
+
+        # migrations
+        self._create_version_table_sql = f"CREATE TABLE IF NOT EXISTS {self._schema_name}.version " \
+                                         f"(version integer NOT NULL)"
+        self._lock_version_table_sql = f"LOCK TABLE {self._schema_name}.version IN EXCLUSIVE MODE"
+        self._fetch_version_sql = f"SELECT version FROM {self._schema_name}.version LIMIT 1"
+        self._insert_version_sql = f"INSERT INTO {self._schema_name}.version(version) VALUES($1)"
+        self._update_version_sql = f"UPDATE {self._schema_name}.version SET version = $1"
+
+        # Each migration is run once, in order, and the amount that ran is stored in the version table.
+        # Only ever append to this list.
+        self._migrations = [
+            self._create_table_sql,
+            f"ALTER TABLE {self._schema_name}.{self._table_name} ADD COLUMN IF NOT EXISTS roleid bigint",
+            self._create_posts_table_sql,
+            self._create_delivered_table_sql,
+            self._create_translations_table_sql,
+            f"""
+            DELETE FROM {self._schema_name}.{self._table_name} a USING {self._schema_name}.{self._table_name} b
+                WHERE a.id > b.id AND a.channelid = b.channelid AND a.communityname = b.communityname;
+            CREATE UNIQUE INDEX IF NOT EXISTS {self._table_name}_channelid_communityname
+                ON {self._schema_name}.{self._table_name} (channelid, communityname)
+            """,
+            self._create_queue_table_sql,
+            f"""
+            ALTER TABLE {self._schema_name}.{self._queue_table_name} ADD COLUMN IF NOT EXISTS worker integer NOT NULL
+                DEFAULT 0;
+            CREATE INDEX IF NOT EXISTS {self._queue_table_name}_worker_availableat
+                ON {self._schema_name}.{self._queue_table_name} (worker, availableat)
+            """,
+            f"ALTER TABLE {self._schema_name}.{self._posts_table_name} ADD COLUMN IF NOT EXISTS rendered text",
+            f"""
+            ALTER TABLE {self._schema_name}.{self._queue_table_name} ADD COLUMN IF NOT EXISTS rank bigint NOT NULL
+                DEFAULT 0;
+            CREATE INDEX IF NOT EXISTS {self._queue_table_name}_worker_rank
+                ON {self._schema_name}.{self._queue_table_name} (worker, rank, id)
+            """,
+            self._create_webhooks_table_sql,
+            f"ALTER TABLE {self._schema_name}.{self._table_name} ADD COLUMN IF NOT EXISTS digest boolean NOT NULL "
+            f"DEFAULT false",
+            f"CREATE INDEX IF NOT EXISTS {self._queue_table_name}_channelid_communityname "
+            f"ON {self._schema_name}.{self._queue_table_name} (channelid, communityname)"
+        ]
+
+    @property
+    def is_connected(self) -> bool:
+        """Whether the DataBase has a connection to query."""
+        return self.pool is not None
 
     async def connect(self):
         """Create the connection for the DataBase."""
         ...
 
-    async def __create_ucube_schema(self):
-        """Create the UCube Schema."""
+    async def migrate(self):
+        """Create the schema and run every migration that has not run yet inside a single transaction."""
+        ...
+
+    async def close(self):
+        """Close the connection for the DataBase."""
+        ...
+
+    async def bulk_insert_channels(self, channels):
+        """Insert or update many channels at once using a single bulk load.
+
+        :param channels: (List[Tuple[int, str, Optional[int]]]) A list of (channel id, community name, role id).
+        """
+        ...
+
+    async def bulk_delete_channels(self, channels):
+        """Unfollow many UCube communities at once.
+
+        :param channels: (List[Tuple[int, str]]) A list of (channel id, community name).
+        """
         ...
 
-    async def __create_ucube_table(self):
-        """Create the UCube channels table."""
+    async def bulk_update_roles(self, roles):
+        """Update the role of many channels at once.
+
+        :param roles: (List[Tuple[int, str, Optional[int]]]) A list of (channel id, community name, role id).
+        """
         ...
 
     async def insert_ucube_channel(self, channel_id, community_name):
@@ -83,10 +299,167 @@ class AbstractDataBase:
         """
         ...
 
+    async def update_digest(self, channel_id, community_name, digest):
+        """Update whether a channel receives the posts of a community as a digest.
+
+        :param channel_id: (int) Text Channel ID.
+        :param community_name: (str) The name of the community.
+        :param digest: (bool) Whether posts are coalesced into a digest.
+        """
+        ...
+
     async def fetch_channels(self):
         """Fetch channels and the channels they are following"""
         ...
 
-    async def recreate_db(self):
-        """Will update the database by dropping the table and recreating it with the new sql."""
+    async def iter_channels(self):
+        """Stream channels and the communities they are following without loading every row at once.
+
+        This is an async generator of (channel id, community name, role id, digest).
+        """
+        ...
+
+    async def insert_post(self, community_name, post_slug, seq):
+        """Insert the sequence of a post.
+
+        :param community_name: (str) The name of the community.
+        :param post_slug: (str) The post slug.
+        :param seq: (int) The sequence the post was given.
+        """
+        ...
+
+    async def delete_old_posts(self, community_name, min_seq):
+        """Delete the posts of a community that are older than a sequence.
+
+        :param community_name: (str) The name of the community.
+        :param min_seq: (int) The oldest sequence to keep.
+        """
+        ...
+
+    async def update_rendered_post(self, community_name, post_slug, rendered):
+        """Store a rendered post (after its sequence was inserted) for processes that can not render it.
+
+        :param community_name: (str) The name of the community.
+        :param post_slug: (str) The post slug.
+        :param rendered: (str) The post serialized as JSON by RenderedPost.to_dict.
+        """
+        ...
+
+    async def fetch_post(self, community_name, post_slug):
+        """Fetch the sequence and the stored rendered post of a post.
+
+        :param community_name: (str) The name of the community.
+        :param post_slug: (str) The post slug.
+        :returns: A record of (seq, rendered), with the post serialized as JSON (or None if it was not rendered),
+            or None if the post does not exist.
+        """
+        ...
+
+    async def update_delivered(self, community_name, delivered):
+        """Insert or update the delivery state of many channels at once.
+
+        :param community_name: (str) The name of the community.
+        :param delivered: (List[Tuple[int, int, int]]) A list of (channel id, high-water sequence, mask).
+        """
+        ...
+
+    async def fetch_posts(self):
+        """Fetch the post sequences of every community (oldest first)."""
+        ...
+
+    async def fetch_delivered(self):
+        """Fetch the delivery state of every channel."""
+        ...
+
+    async def insert_translation(self, key, translated):
+        """Insert a translation.
+
+        :param key: (str) Hash of the source text and language pair.
+        :param translated: (str) The translated text.
+        """
+        ...
+
+    async def fetch_translation(self, key):
+        """Fetch a translation.
+
+        :param key: (str) Hash of the source text and language pair.
+        :returns: (Optional[str]) The translated text.
+        """
+        ...
+
+    async def insert_webhook(self, channel_id, webhook_id, token):
+        """Insert the webhook of a channel or replace it.
+
+        :param channel_id: (int) The ID of the channel.
+        :param webhook_id: (int) The ID of the webhook.
+        :param token: (str) The token of the webhook.
+        """
+        ...
+
+    async def delete_webhook(self, channel_id):
+        """Delete the webhook of a channel.
+
+        :param channel_id: (int) The ID of the channel.
+        """
+        ...
+
+    async def fetch_webhooks(self):
+        """Fetch the (channel id, webhook id, token) of every channel with a webhook."""
+        ...
+
+    async def enqueue_jobs(self, jobs, worker=0, delay=0):
+        """Add delivery jobs to the notification queue.
+
+        :param jobs: (List[Tuple[str, str, str, int, int]]) A list of
+            (club slug, post slug, community name, channel id, rank). Jobs with a lower rank are claimed first.
+        :param worker: (int) The ID of the cluster worker that delivers the jobs.
+        :param delay: (float) Seconds before the jobs can be claimed.
+        """
+        ...
+
+    async def claim_jobs(self, limit, lease, worker=0):
+        """Claim jobs that are available and hide them from other workers for a while.
+
+        :param limit: (int) The max amount of jobs to claim.
+        :param lease: (float) Seconds until the jobs are available again if they are not completed.
+        :param worker: (int) Only claim the jobs of this cluster worker.
+        :returns: A list of records with id, clubslug, postslug, communityname, channelid and attempts.
+        """
+        ...
+
+    async def claim_channel_jobs(self, community_name, channel_id, lease, worker=0):
+        """Claim every available job of a community for one channel, so they can be delivered together.
+
+        :param community_name: (str) The community name.
+        :param channel_id: (int) The channel ID.
+        :param lease: (float) Seconds until the jobs are available again if they are not completed.
+        :param worker: (int) Only claim the jobs of this cluster worker.
+        :returns: A list of records with id, clubslug, postslug, communityname, channelid and attempts.
+        """
+        ...
+
+    async def complete_job(self, job_id):
+        """Remove a job from the notification queue.
+
+        :param job_id: (int) The job ID.
+        """
+        ...
+
+    async def retry_job(self, job_id, delay):
+        """Make a job available again after a delay.
+
+        :param job_id: (int) The job ID.
+        :param delay: (float) Seconds until the job can be claimed.
+        """
+        ...
+
+    async def release_jobs(self, job_ids):
+        """Make claimed jobs available right away (without counting an attempt).
+
+        :param job_ids: (List[int]) The job IDs.
+        """
+        ...
+
+    async def fetch_queue_stats(self):
+        """Fetch the amount of queued jobs and the age (in seconds) of the oldest one."""
         ...
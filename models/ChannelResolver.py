@@ -0,0 +1,78 @@
+from asyncio import Future, get_event_loop
+from time import monotonic
+from typing import Dict, Optional, Tuple
+import discord
+from . import metrics
+
+LOOKUPS = metrics.counter("ucube_channel_lookups_total", "Text channel lookups by where they were answered from.")
+
+
+class ChannelResolver:
+    def __init__(self, bot, ttl=3600, negative_ttl=600):
+        """
+        Resolves text channel IDs to channels without a REST lookup for channels it already knows.
+
+        The discord.py cache is checked first. Channels that had to be fetched are remembered for ``ttl`` seconds
+        (so a cold cache after a reconnect does not cause a fetch per post), and channels that do not exist or
+        can not be accessed are remembered for ``negative_ttl`` seconds. Concurrent lookups of the same channel
+        share one fetch.
+
+        :param bot: The discord bot.
+        :param ttl: (float) Seconds a fetched channel is remembered.
+        :param negative_ttl: (float) Seconds a missing or forbidden channel is remembered.
+        """
+        self.bot = bot
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._channels: Dict[int, Tuple[Optional[discord.abc.Messageable], float]] = {}  # id : (channel, expires)
+        self._in_flight: Dict[int, Future] = {}
+
+    async def resolve(self, channel_id) -> Optional[discord.abc.Messageable]:
+        """Get a text channel.
+
+        :param channel_id: (int) The channel ID.
+        :returns: The channel, or None if it does not exist or can not be accessed.
+        :raises discord.HTTPException: If Discord failed for another reason (the result is not cached).
+        """
+        channel = self.bot.get_channel(channel_id)
+        if channel:
+            LOOKUPS.inc(source="client")
+            return channel
+
+        cached = self._channels.get(channel_id)
+        if cached and cached[1] > monotonic():
+            LOOKUPS.inc(source="resolver")
+            return cached[0]
+
+        in_flight = self._in_flight.get(channel_id)
+        if in_flight:
+            LOOKUPS.inc(source="resolver")
+            return await in_flight
+
+        LOOKUPS.inc(source="rest")
+        future = self._in_flight[channel_id] = get_event_loop().create_future()
+        try:
+            try:
+                channel = await self.bot.fetch_channel(channel_id)
+                self._channels[channel_id] = (channel, monotonic() + self.ttl)
+            except (discord.NotFound, discord.Forbidden):
+                channel = None
+                self._channels[channel_id] = (None, monotonic() + self.negative_ttl)
+            future.set_result(channel)
+            return channel
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved so it is not logged when nobody else was waiting.
+            raise
+        finally:
+            self._in_flight.pop(channel_id, None)
+
+    def forget(self, channel_id):
+        """Remove a channel so the next lookup asks Discord again."""
+        self._channels.pop(channel_id, None)
+
+    def prune(self):
+        """Remove expired channels so they do not pile up in memory."""
+        now = monotonic()
+        for channel_id in [channel_id for channel_id, (_, expires) in self._channels.items() if expires <= now]:
+            self._channels.pop(channel_id)
@@ -0,0 +1,53 @@
+from typing import Dict, List, Optional
+from UCube import models
+
+
+class ClubRegistry:
+    def __init__(self):
+        """
+        Indexes UCube clubs by lowercase name and by slug.
+
+        The UCube client only ever adds clubs to its cache, so a sync is skipped entirely when the amount
+        of clubs has not changed and otherwise only the new clubs are indexed.
+        """
+        self._by_name: Dict[str, models.Club] = {}  # lowercase club name : club
+        self._by_slug: Dict[str, models.Club] = {}  # club slug : club
+        self._names: List[str] = []  # sorted lowercase club names
+
+    def sync(self, clubs: Dict[str, models.Club]):
+        """Index any clubs that are not in the registry yet.
+
+        :param clubs: The clubs of the UCube client with the slug as the key.
+        """
+        if len(clubs) == len(self._by_slug):
+            return
+
+        for slug in clubs.keys() - self._by_slug.keys():
+            self._index(clubs[slug])
+        self._names = sorted(self._by_name)
+
+    def add(self, club: models.Club):
+        """Add or replace a club in the registry."""
+        self._index(club)
+        self._names = sorted(self._by_name)
+
+    def _index(self, club: models.Club):
+        """Index a club by name and slug."""
+        old_club = self._by_slug.get(club.slug)
+        if old_club:
+            self._by_name.pop(old_club.name.lower(), None)
+        self._by_slug[club.slug] = club
+        self._by_name[club.name.lower()] = club
+
+    def get_by_name(self, community_name) -> Optional[models.Club]:
+        """Get a club by its name (case insensitive)."""
+        return self._by_name.get(community_name.lower()) if community_name else None
+
+    def get_by_slug(self, club_slug) -> Optional[models.Club]:
+        """Get a club by its slug."""
+        return self._by_slug.get(club_slug)
+
+    @property
+    def names(self) -> List[str]:
+        """The sorted lowercase names of every club."""
+        return self._names
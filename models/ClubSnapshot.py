@@ -0,0 +1,59 @@
+import json
+import logging
+from asyncio import Lock
+from os import replace
+from time import time
+from typing import Iterable, List
+import aiofiles
+from UCube import models
+
+log = logging.getLogger(__name__)
+
+
+class ClubSnapshot:
+    def __init__(self, location):
+        """
+        A compact local copy of the UCube clubs and their boards.
+
+        Loading every club from UCube takes a request per club, so the clubs are restored from this file on start
+        and the bot can answer commands while the live clubs are still loading.
+
+        :param location: (str) The location of the snapshot file.
+        """
+        self.location = location
+        self._save_lock = Lock()
+
+    def load(self) -> List[models.Club]:
+        """Load the clubs of the snapshot. A missing or broken snapshot has no clubs."""
+        try:
+            with open(self.location) as fd:
+                snapshot = json.load(fd)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            log.warning("Failed to load the club snapshot.", extra={"location": self.location, "error": str(e)})
+            return []
+
+        clubs = []
+        for club_slug, club_name, boards in snapshot.get("clubs", []):
+            club = models.Club(club_name, None, slug=club_slug)
+            for board_slug, board_name in boards:
+                club.boards[board_slug] = models.Board(slug=board_slug, name=board_name, club_slug=club_slug)
+            clubs.append(club)
+
+        log.info("Restored clubs from the snapshot.", extra={
+            "clubs": len(clubs), "age": time() - snapshot.get("saved_at", 0)})
+        return clubs
+
+    async def save(self, clubs: Iterable[models.Club]):
+        """Replace the snapshot with the given clubs."""
+        snapshot = {
+            "saved_at": time(),
+            "clubs": [[club.slug, club.name, [[board.slug, board.name] for board in club.boards.values()]]
+                      for club in clubs]
+        }
+        temp_location = self.location + ".part"
+        async with self._save_lock:
+            async with aiofiles.open(temp_location, mode='w') as fd:
+                await fd.write(json.dumps(snapshot, separators=(",", ":")))
+            replace(temp_location, self.location)
@@ -0,0 +1,83 @@
+import json
+import logging
+from asyncio import open_unix_connection, sleep, get_event_loop, StreamWriter, Task
+from typing import List, Optional
+
+log = logging.getLogger(__name__)
+
+MAX_MESSAGE_SIZE = 2 ** 24  # a rendered post with every embed fits easily.
+
+
+class ClusterClient:
+    def __init__(self, socket_location, handler, retry_delay=1.0, max_retry_delay=30.0):
+        """
+        Receives the messages of the leader process of a cluster and reconnects whenever the leader restarts.
+
+        Messages sent to the leader while it is not connected are kept and sent once it reconnects.
+
+        :param socket_location: (str) The location of the leader's Unix socket.
+        :param handler: A coroutine function called with every message (dict).
+        :param retry_delay: (float) Seconds before the first reconnect, doubled every failed attempt.
+        :param max_retry_delay: (float) The max seconds between reconnects.
+        """
+        self.socket_location = socket_location
+        self._handler = handler
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.connected = False
+        self._task: Optional[Task] = None
+        self._writer: Optional[StreamWriter] = None
+        self._pending: List[bytes] = []  # messages for the leader sent while disconnected
+
+    def send(self, message: dict):
+        """Send a message to the leader."""
+        data = json.dumps(message, separators=(",", ":")).encode() + b"\n"
+        if self._writer and not self._writer.is_closing():
+            self._writer.write(data)
+        else:
+            self._pending.append(data)
+
+    def start(self):
+        """Connect to the leader in the background."""
+        if not self._task:
+            self._task = get_event_loop().create_task(self._listen_forever())
+
+    async def stop(self):
+        """Disconnect from the leader."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _listen_forever(self):
+        delay = self.retry_delay
+        while True:
+            try:
+                reader, writer = await open_unix_connection(self.socket_location, limit=MAX_MESSAGE_SIZE)
+            except (ConnectionError, OSError):
+                await sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+
+            self.connected = True
+            self._writer = writer
+            delay = self.retry_delay
+            for data in self._pending:
+                writer.write(data)
+            self._pending.clear()
+            log.info("Connected to the cluster leader.", extra={"socket": self.socket_location})
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    try:
+                        await self._handler(json.loads(line))
+                    except Exception:
+                        log.exception("Failed to handle a cluster message.")
+            except (ConnectionError, OSError, ValueError):
+                pass
+            finally:
+                self.connected = False
+                self._writer = None
+                writer.close()
+            log.warning("Lost the connection to the cluster leader.")
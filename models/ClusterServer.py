@@ -0,0 +1,92 @@
+import json
+import logging
+from asyncio import start_unix_server, StreamWriter, StreamReader, AbstractServer
+from os import path, remove
+from typing import Optional, Set
+
+log = logging.getLogger(__name__)
+
+
+class ClusterServer:
+    def __init__(self, socket_location, greeting=None, handler=None):
+        """
+        Publishes messages from the leader process of a cluster to every worker over a Unix socket.
+
+        Messages are dicts sent as one JSON object per line. Workers can send messages back the same way.
+
+        :param socket_location: (str) The location of the Unix socket.
+        :param greeting: An optional coroutine function that returns a list of messages for a new worker.
+        :param handler: An optional coroutine function called with every message (dict) a worker sends.
+        """
+        self.socket_location = socket_location
+        self._greeting = greeting
+        self._handler = handler
+        self._server: Optional[AbstractServer] = None
+        self._writers: Set[StreamWriter] = set()
+
+    async def start(self):
+        """Start accepting workers."""
+        if path.exists(self.socket_location):
+            remove(self.socket_location)  # left behind by a previous leader.
+        self._server = await start_unix_server(self._accept, self.socket_location)
+        log.info("Cluster server started.", extra={"socket": self.socket_location})
+
+    async def stop(self):
+        """Disconnect every worker and stop accepting new ones."""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for writer in self._writers:
+            writer.close()
+        self._writers.clear()
+
+    @property
+    def workers(self) -> int:
+        """The amount of connected workers."""
+        return len(self._writers)
+
+    async def _accept(self, reader: StreamReader, writer: StreamWriter):
+        # added before the greeting, so messages broadcast while it is sent are not missed.
+        self._writers.add(writer)
+        try:
+            for message in await self._greeting() if self._greeting else []:
+                writer.write(self.encode(message))
+            await writer.drain()
+        except Exception:
+            log.exception("Failed to greet a cluster worker.")
+            self._writers.discard(writer)
+            writer.close()
+            return
+
+        log.info("Cluster worker connected.", extra={"workers": self.workers})
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not self._handler:
+                    continue
+                try:
+                    await self._handler(json.loads(line))
+                except Exception:
+                    log.exception("Failed to handle a message from a cluster worker.")
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+        log.info("Cluster worker disconnected.", extra={"workers": self.workers})
+
+    @staticmethod
+    def encode(message: dict) -> bytes:
+        return json.dumps(message, separators=(",", ":")).encode() + b"\n"
+
+    async def broadcast(self, message: dict):
+        """Send a message to every connected worker."""
+        data = self.encode(message)
+        for writer in list(self._writers):
+            try:
+                writer.write(data)
+                await writer.drain()
+            except (ConnectionError, OSError):
+                self._writers.discard(writer)
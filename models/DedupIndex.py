@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class DedupIndex:
+    def __init__(self, max_posts=500, window=63):
+        """
+        Keeps track of which posts were already delivered to which text channels.
+
+        Every post slug of a community gets an increasing sequence number (shared by all channels).
+        Each channel only stores the highest sequence it was sent and a bitmap of the ``window`` sequences
+        before it, so checking and marking a delivery is O(1) and memory stays flat no matter how many posts
+        were sent. Anything older than the window is considered delivered.
+
+        :param max_posts: (int) The amount of post slugs to remember per community.
+        :param window: (int) The amount of sequences tracked behind a channel's high-water mark.
+            63 so the bitmap fits inside a signed bigint.
+        """
+        self.max_posts = max_posts
+        self.window = window
+        self._posts: Dict[str, OrderedDict] = {}  # community name : { post slug: sequence }
+        self._last_seq: Dict[str, int] = {}  # community name : last sequence given out
+        self._delivered: Dict[str, Dict[int, Tuple[int, int]]] = {}  # community name : {channel id: (seq, mask)}
+        self._dirty: Dict[str, Dict[int, Tuple[int, int]]] = {}  # changes that are not in the DB yet.
+
+    def load_post(self, community_name, post_slug, seq):
+        """Add an existing post sequence (from the DB) to the index."""
+        community_name = community_name.lower()
+        posts = self._posts.setdefault(community_name, OrderedDict())
+        posts[post_slug] = seq
+        self._last_seq[community_name] = max(self._last_seq.get(community_name, 0), seq)
+
+    def load_delivered(self, community_name, channel_id, high_water, mask):
+        """Add an existing channel state (from the DB) to the index."""
+        self._delivered.setdefault(community_name.lower(), {})[channel_id] = (high_water, mask)
+
+    def get_seq(self, community_name, post_slug) -> Tuple[int, bool]:
+        """Get the sequence of a post, creating one if it does not exist.
+
+        :returns: The sequence and whether it was just created.
+        """
+        community_name = community_name.lower()
+        posts = self._posts.setdefault(community_name, OrderedDict())
+        seq = posts.get(post_slug)
+        if seq:
+            return seq, False
+
+        seq = self._last_seq[community_name] = self._last_seq.get(community_name, 0) + 1
+        posts[post_slug] = seq
+        while len(posts) > self.max_posts:
+            posts.popitem(last=False)
+        return seq, True
+
+    def find_seq(self, community_name, post_slug) -> Optional[int]:
+        """Get the sequence of a post without creating one (None if it is not known)."""
+        return self._posts.get(community_name.lower(), {}).get(post_slug)
+
+    def oldest_seq(self, community_name) -> int:
+        """The oldest sequence that is still remembered for a community."""
+        posts = self._posts.get(community_name.lower())
+        return next(iter(posts.values())) if posts else 0
+
+    def is_delivered(self, community_name, channel_id, seq) -> bool:
+        """Check if a post sequence was already delivered to a channel."""
+        high_water, mask = self._delivered.get(community_name.lower(), {}).get(channel_id, (0, 0))
+        if seq > high_water:
+            return False
+        offset = high_water - seq
+        return offset >= self.window or bool(mask >> offset & 1)
+
+    def claim(self, community_name, channel_id, seq) -> bool:
+        """Mark a post sequence as delivered to a channel.
+
+        :returns: False if it was already delivered.
+        """
+        community_name = community_name.lower()
+        channels = self._delivered.get(community_name)
+        if channels is None:
+            channels = self._delivered[community_name] = {}
+
+        high_water, mask = channels.get(channel_id, (0, 0))
+        if seq > high_water:
+            mask = (mask << (seq - high_water) | 1) & ((1 << self.window) - 1)
+            high_water = seq
+        else:
+            offset = high_water - seq
+            if offset >= self.window or mask >> offset & 1:
+                return False
+            mask |= 1 << offset
+
+        channels[channel_id] = self._dirty.setdefault(community_name, {})[channel_id] = (high_water, mask)
+        return True
+
+    def remove_channel(self, community_name, channel_id):
+        """Forget the delivery state of a channel for a community."""
+        community_name = community_name.lower()
+        self._delivered.get(community_name, {}).pop(channel_id, None)
+        self._dirty.get(community_name, {}).pop(channel_id, None)
+
+    def pop_dirty(self, community_name) -> List[Tuple[int, int, int]]:
+        """Get and clear the channel states that changed since the last call.
+
+        :returns: A list of (channel id, high-water sequence, mask).
+        """
+        dirty = self._dirty.pop(community_name.lower(), {})
+        return [(channel_id, high_water, mask) for channel_id, (high_water, mask) in dirty.items()]
+
+    def pop_all_dirty(self) -> Dict[str, List[Tuple[int, int, int]]]:
+        """Get and clear the channel states of every community that changed since the last call."""
+        return {community_name: self.pop_dirty(community_name) for community_name in list(self._dirty)}
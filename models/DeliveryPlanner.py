@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from itertools import chain, zip_longest
+from typing import Callable, Hashable, Iterable, List, Sequence, Tuple
+
+# ranks of a tier never reach the next tier.
+TIER_STRIDE = 1_000_000_000
+
+
+class DeliveryPlanner:
+    def __init__(self, tiers: Sequence[Callable[[object], bool]] = ()):
+        """
+        Decides the order a post is delivered to the channels following a club.
+
+        Every target is ranked. Targets of the first tier they match are ranked before every target of a later
+        tier (and targets that match no tier come last). Inside a tier, targets are taken round-robin from each
+        group (the guild) so one guild with many channels does not hold up the others, and followers are no
+        longer served in the order they subscribed.
+
+        The queue claims jobs by rank, so the posts of clubs that are being delivered at the same time take turns
+        instead of running back to back.
+
+        :param tiers: Functions that take a target and return whether it belongs to that tier, highest first.
+        """
+        self.tiers = list(tiers)
+
+    def get_tier(self, target) -> int:
+        """Get the tier of a target (the amount of tiers if it matches none)."""
+        for tier, matches in enumerate(self.tiers):
+            if matches(target):
+                return tier
+        return len(self.tiers)
+
+    def plan(self, targets: Iterable, group: Callable[[object], Hashable]) -> List[Tuple[object, int]]:
+        """Order targets and rank them.
+
+        :param targets: The targets to deliver to.
+        :param group: A function that returns the group (guild) of a target.
+        :returns: A list of (target, rank) in delivery order.
+        """
+        tiers = {}  # tier : { group : [targets] }
+        for target in targets:
+            tiers.setdefault(self.get_tier(target), OrderedDict()).setdefault(group(target), []).append(target)
+
+        planned = []
+        for tier in sorted(tiers):
+            round_robin = chain.from_iterable(zip_longest(*tiers[tier].values()))
+            planned.extend((target, tier * TIER_STRIDE + rank)
+                           for rank, target in enumerate(target for target in round_robin if target is not None))
+        return planned
@@ -0,0 +1,96 @@
+import logging
+from asyncio import gather
+from time import monotonic
+from typing import Dict, Iterable
+from . import RateLimitBucket
+
+log = logging.getLogger(__name__)
+
+
+class DeliveryScheduler:
+    def __init__(self, max_concurrency=50, global_limit=50, global_per=1.0, route_limit=5, route_per=5.0):
+        """
+        Delivers to many text channels at once while staying inside Discord's rate-limits.
+
+        Discord allows 5 messages every 5 seconds per channel and 50 requests per second globally,
+        so instead of sleeping between channels we only wait when one of those buckets is empty.
+
+        :param max_concurrency: (int) The max amount of channels being delivered to at the same time.
+        :param global_limit: (int) Requests allowed globally in a window.
+        :param global_per: (float) Length of the global window in seconds.
+        :param route_limit: (int) Requests allowed per channel in a window.
+        :param route_per: (float) Length of a channel window in seconds.
+        """
+        self.max_concurrency = max_concurrency
+        self._route_limit = route_limit
+        self._route_per = route_per
+        self._global_bucket = RateLimitBucket(global_limit, global_per)
+        self._route_buckets: Dict[int, RateLimitBucket] = {}  # route (channel id) : bucket
+        self._pruned_at = monotonic()
+
+    def get_bucket(self, route) -> RateLimitBucket:
+        """Get (or create) the bucket for a route.
+
+        Creating a bucket prunes the ones that have reset at most once per route window, so schedulers that never
+        call ``deliver`` do not keep a bucket for every channel they ever used.
+        """
+        bucket = self._route_buckets.get(route)
+        if not bucket:
+            if monotonic() - self._pruned_at >= self._route_per:
+                self.prune()
+            bucket = self._route_buckets[route] = RateLimitBucket(self._route_limit, self._route_per)
+        return bucket
+
+    async def throttle(self, route):
+        """Wait for both the route and global bucket before making a request.
+
+        :param route: The route identifier (the text channel id).
+        """
+        await self.get_bucket(route).acquire()
+        await self._global_bucket.acquire()
+
+    def rate_limited(self, route, exception):
+        """Block the correct bucket after a 429 from Discord.
+
+        :param route: The route identifier (the text channel id).
+        :param exception: (discord.HTTPException) The exception that was raised.
+        """
+        headers = getattr(getattr(exception, "response", None), "headers", None) or {}
+        try:
+            retry_after = float(headers.get("Retry-After", 1))
+        except ValueError:
+            retry_after = 1.0
+
+        if headers.get("X-RateLimit-Global"):
+            self._global_bucket.block(retry_after)
+        else:
+            self.get_bucket(route).block(retry_after)
+
+    async def deliver(self, targets: Iterable, send):
+        """Run ``send`` on every target with a bounded amount of deliveries in-flight.
+
+        :param targets: The objects to deliver to (usually models.TextChannel).
+        :param send: A coroutine function that takes a target and delivers to it.
+        :returns: (int) The amount of targets that were delivered to without an exception.
+        """
+        targets = iter(targets)
+        delivered = 0
+
+        async def worker():
+            nonlocal delivered
+            for target in targets:
+                try:
+                    await send(target)
+                    delivered += 1
+                except Exception:
+                    log.exception("Failed to deliver.", extra={"target": getattr(target, "id", str(target))})
+
+        await gather(*[worker() for _ in range(self.max_concurrency)])
+        self.prune()
+        return delivered
+
+    def prune(self):
+        """Remove route buckets that have reset so they do not pile up in memory."""
+        self._pruned_at = monotonic()
+        for route in [route for route, bucket in self._route_buckets.items() if bucket.idle]:
+            self._route_buckets.pop(route, None)
@@ -0,0 +1,73 @@
+import logging
+from asyncio import Future, gather, get_event_loop, wait_for, TimeoutError
+from time import monotonic
+from typing import Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+# shutdown stages, run in this order.
+STOP_INTAKE = 0  # stop taking new work (polling UCube, cluster messages).
+DRAIN = 1  # finish in-flight work, shares the deadline.
+CHECKPOINT = 2  # save what was done and hand back what was not.
+CLOSE = 3  # close network resources and the DataBase.
+STAGE_NAMES = {STOP_INTAKE: "stop_intake", DRAIN: "drain", CHECKPOINT: "checkpoint", CLOSE: "close"}
+
+
+class Lifecycle:
+    def __init__(self, deadline=30.0, step_timeout=10.0):
+        """
+        Shuts the bot down in stages so in-flight deliveries are finished or checkpointed instead of lost.
+
+        Callbacks are registered for a stage. Every stage runs its callbacks at the same time and the next stage
+        starts once they are done. The drain stage gets whatever is left of ``deadline``; every other stage gets
+        ``step_timeout`` so saving and closing still happen after a slow drain. A failing callback is logged
+        and does not stop the shutdown.
+
+        :param deadline: (float) Seconds from the start of the shutdown until draining is given up.
+        :param step_timeout: (float) Seconds every other stage may take.
+        """
+        self.deadline = deadline
+        self.step_timeout = step_timeout
+        self._callbacks: Dict[int, List] = {}  # stage : coroutine functions
+        self._shutdown: Optional[Future] = None
+
+    def on_shutdown(self, callback, stage=CLOSE):
+        """Register a coroutine function to run during shutdown.
+
+        :param callback: A coroutine function without arguments.
+        :param stage: (int) The stage it runs in.
+        """
+        self._callbacks.setdefault(stage, []).append(callback)
+
+    @property
+    def closing(self) -> bool:
+        """Whether the shutdown has started."""
+        return self._shutdown is not None
+
+    def shutdown(self) -> Future:
+        """Run every stage. Calling it again waits for the shutdown that already started."""
+        if not self._shutdown:
+            self._shutdown = get_event_loop().create_task(self._run())
+        return self._shutdown
+
+    async def _run(self):
+        start = monotonic()
+        log.info("Shutting down.", extra={"deadline": self.deadline})
+        for stage in sorted(self._callbacks):
+            timeout = max(self.deadline - (monotonic() - start), 0) if stage == DRAIN else self.step_timeout
+            callbacks = self._callbacks[stage]
+            results = await gather(*[self._run_callback(callback, timeout) for callback in callbacks])
+            log.info("Shutdown stage done.", extra={
+                "stage": STAGE_NAMES.get(stage, stage), "failed": results.count(False),
+                "elapsed": monotonic() - start})
+
+    @staticmethod
+    async def _run_callback(callback, timeout) -> bool:
+        try:
+            await wait_for(callback(), timeout)
+            return True
+        except TimeoutError:
+            log.warning("Shutdown step timed out.", extra={"step": callback.__qualname__, "timeout": timeout})
+        except Exception:
+            log.exception("Shutdown step failed.", extra={"step": callback.__qualname__})
+        return False
@@ -0,0 +1,176 @@
+import json
+from asyncio import Future, Lock, get_event_loop
+from os import makedirs, path, remove, replace
+from shutil import move
+from tempfile import gettempdir
+from time import time
+from typing import Dict, Optional
+from uuid import uuid4
+import aiofiles
+
+
+class MediaCache:
+    def __init__(self, folder, max_bytes=5000000000, min_age=600, index_name=".ucube_media_index.json",
+                 temp_folder=None):
+        """
+        A content-addressed cache of downloaded media.
+
+        Files are stored by the sha256 hash of their content, so the same asset is only written once
+        even if it comes from different urls. The oldest used files are removed once the folder goes over budget,
+        except files that were pinned because messages link to them through the image host.
+
+        :param folder: (str) The folder the media is stored in.
+        :param max_bytes: (int) The disk budget for cached media.
+        :param min_age: (float) Files used within this many seconds are never removed since a post may still
+            be uploading them.
+        :param index_name: (str) The name of the index file inside the folder.
+        :param temp_folder: (str) The folder unfinished downloads are written to, so they are never served from
+            ``folder``. On the same filesystem as ``folder`` they are moved in without a copy. The system temp
+            folder by default.
+        """
+        self.folder = folder
+        self.temp_folder = temp_folder or gettempdir()
+        makedirs(self.temp_folder, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self._index_location = path.join(folder, index_name)
+        # hash : {"file_name": str, "size": int, "last_used": float, "pinned": bool}
+        self._files: Dict[str, dict] = {}
+        self._urls: Dict[str, str] = {}  # source url : hash
+        self._in_flight: Dict[str, Future] = {}  # source url : future of the file entry
+        self._save_lock = Lock()  # concurrent downloads would otherwise write the same temp index
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Load the index from disk, dropping any files that no longer exist."""
+        try:
+            with open(self._index_location) as fd:
+                index = json.load(fd)
+        except (OSError, ValueError):
+            return
+
+        for file_hash, entry in index.get("files", {}).items():
+            if path.isfile(path.join(self.folder, entry["file_name"])):
+                self._files[file_hash] = entry
+                self.total_bytes += entry["size"]
+        self._urls = {url: file_hash for url, file_hash in index.get("urls", {}).items() if file_hash in self._files}
+
+    async def _save_index(self):
+        """Write the index to disk."""
+        temp_location = self._index_location + ".part"
+        async with self._save_lock:
+            async with aiofiles.open(temp_location, mode='w') as fd:
+                await fd.write(json.dumps({"files": self._files, "urls": self._urls}))
+            replace(temp_location, self._index_location)
+
+    def lookup(self, url) -> Optional[dict]:
+        """Get the cached file entry of a url if it is still on disk.
+
+        A file removed outside of the cache is forgotten so it is downloaded again.
+        """
+        file_hash = self._urls.get(url)
+        entry = self._files.get(file_hash)
+        if not entry:
+            return None
+        if not path.isfile(path.join(self.folder, entry["file_name"])):
+            self._forget(file_hash)
+            return None
+        entry["last_used"] = time()
+        return entry
+
+    async def pin(self, entry):
+        """Never evict a file, since sent messages link to it through the image host.
+
+        :param entry: (dict) The file entry returned by ``fetch``.
+        """
+        if entry.get("pinned"):
+            return
+        entry["pinned"] = True
+        await self._save_index()
+
+    def _forget(self, file_hash):
+        """Drop the entry of a file and every url pointing to it."""
+        entry = self._files.pop(file_hash)
+        self.total_bytes -= entry["size"]
+        self._urls = {url: url_hash for url, url_hash in self._urls.items() if url_hash != file_hash}
+
+    async def fetch(self, url, file_name, download) -> dict:
+        """Get the file entry of a url, downloading it only if it is not already cached.
+
+        Concurrent calls for the same url share one download.
+
+        :param url: (str) The source url.
+        :param file_name: (str) The original file name (used for the extension).
+        :param download: A coroutine function taking (url, file location) that returns (size, sha256 hex digest).
+        :returns: (dict) The file entry with the file name and size.
+        """
+        entry = self.lookup(url)
+        if entry:
+            self.hits += 1
+            return entry
+
+        in_flight = self._in_flight.get(url)
+        if in_flight:
+            self.hits += 1
+            return await in_flight
+
+        self.misses += 1
+        future = self._in_flight[url] = get_event_loop().create_future()
+        temp_location = path.join(self.temp_folder, f"ucube-{uuid4().hex}{path.splitext(file_name)[1]}.part")
+        try:
+            size, file_hash = await download(url, temp_location)
+            entry = await self._add(url, file_hash, size, temp_location, path.splitext(file_name)[1])
+            future.set_result(entry)
+            return entry
+        except Exception as e:
+            if path.exists(temp_location):
+                remove(temp_location)
+            future.set_exception(e)
+            future.exception()  # retrieved so it is not logged when nobody else was waiting.
+            raise
+        finally:
+            self._in_flight.pop(url, None)
+
+    async def _add(self, url, file_hash, size, temp_location, extension) -> dict:
+        """Move a finished download into the cache and evict old files if needed."""
+        entry = self._files.get(file_hash)
+        if entry:
+            # same content from a different url.
+            remove(temp_location)
+        else:
+            entry = self._files[file_hash] = {"file_name": f"{file_hash[:40]}{extension}", "size": size}
+            # a rename on the same filesystem, otherwise a copy.
+            move(temp_location, path.join(self.folder, entry["file_name"]))
+            self.total_bytes += size
+
+        entry["last_used"] = time()
+        self._urls[url] = file_hash
+        self._evict()
+        await self._save_index()
+        return entry
+
+    def _evict(self):
+        """Remove the least recently used files that are not pinned until the cache is within budget."""
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        evicted = set()
+        in_use = time() - self.min_age
+        for file_hash, entry in sorted(self._files.items(), key=lambda item: item[1]["last_used"]):
+            if self.total_bytes <= self.max_bytes or entry["last_used"] > in_use:
+                break
+            if entry.get("pinned"):
+                continue
+            try:
+                remove(path.join(self.folder, entry["file_name"]))
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= entry["size"]
+            evicted.add(file_hash)
+
+        for file_hash in evicted:
+            self._files.pop(file_hash)
+        self._urls = {url: file_hash for url, file_hash in self._urls.items() if file_hash not in evicted}
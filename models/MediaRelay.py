@@ -0,0 +1,79 @@
+import logging
+from io import BytesIO
+from typing import List, Optional
+import discord
+from . import ChannelResolver, DeliveryScheduler, RenderedPost, TextSplitter, metrics
+
+log = logging.getLogger(__name__)
+
+RELAYED = metrics.counter("ucube_media_relay_total", "Posts whose media was uploaded to the relay channel by result.")
+RELAYED_BYTES = metrics.counter("ucube_media_relay_bytes_total", "Bytes of media uploaded to the relay channel.")
+
+FILES_PER_MESSAGE = 10  # discord attachment limit of a message
+
+
+class MediaRelay:
+    def __init__(self, resolver: ChannelResolver, channel_id, scheduler: DeliveryScheduler, upload_limit=8000000):
+        """
+        Uploads the media of a post once to an archive channel so followers only receive the attachment urls.
+
+        Uploading the files to every following channel makes the upload traffic of a post grow with the amount of
+        followers. Relayed posts send the Discord CDN urls of the archived attachments instead, which Discord
+        shows the same way. If the upload fails, the post keeps its attachments and every channel gets them
+        uploaded as before.
+
+        :param resolver: (ChannelResolver) Looks up the archive channel.
+        :param channel_id: (int) The ID of the archive channel.
+        :param scheduler: (DeliveryScheduler) The scheduler whose buckets the uploads go through.
+        :param upload_limit: (int) The max total bytes of one message.
+        """
+        self.resolver = resolver
+        self.channel_id = channel_id
+        self.upload_limit = upload_limit
+        self._scheduler = scheduler
+
+    async def relay(self, rendered: RenderedPost) -> RenderedPost:
+        """Upload the attachments of a rendered post and replace them with their urls.
+
+        :returns: A rendered post without attachments, or the same post if it has none or the upload failed.
+        """
+        if not rendered.attachments:
+            return rendered
+
+        urls = await self.upload(rendered)
+        if urls is None:
+            return rendered
+
+        message_text = "\n".join(filter(None, [*urls, rendered.message_text]))
+        return RenderedPost(rendered.club_name, rendered.post_slug, rendered.embeds, (), message_text)
+
+    async def upload(self, rendered: RenderedPost) -> Optional[List[str]]:
+        """Upload the attachments of a post to the archive channel.
+
+        :returns: The urls of the attachments in order, or None if the upload failed.
+        """
+        try:
+            channel = await self.resolver.resolve(self.channel_id)
+            if not channel:
+                raise ValueError("The media relay channel does not exist or can not be accessed.")
+
+            urls = []
+            groups = TextSplitter.pack(rendered.attachments, size=lambda attachment: len(attachment[1]),
+                                       max_items=FILES_PER_MESSAGE, max_total=self.upload_limit)
+            for group in groups:
+                await self._scheduler.throttle(self.channel_id)
+                message = await channel.send(f"{rendered.club_name} {rendered.post_slug}", files=[
+                    discord.File(BytesIO(data), filename=file_name) for file_name, data in group])
+                urls.extend(attachment.url for attachment in message.attachments)
+                RELAYED_BYTES.inc(sum(len(data) for _, data in group))
+            if len(urls) != len(rendered.attachments):
+                raise ValueError("Discord did not return every attachment.")
+        except Exception as e:
+            RELAYED.inc(result="failed")
+            log.warning("Failed to relay media, uploading it to every channel instead.", extra={
+                "post_slug": rendered.post_slug, "channel_id": self.channel_id, "error": str(e)})
+            return None
+
+        RELAYED.inc(result="relayed")
+        log.info("Relayed media.", extra={"post_slug": rendered.post_slug, "files": len(urls)})
+        return urls
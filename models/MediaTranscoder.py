@@ -0,0 +1,168 @@
+import json
+import logging
+import subprocess
+from asyncio import get_event_loop
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+from multiprocessing import get_context
+from os import makedirs, path
+from shutil import which
+from typing import Optional, Set
+from . import MediaCache, metrics
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional, oversized images are then sent as links.
+    Image = None
+
+log = logging.getLogger(__name__)
+
+TRANSCODES = metrics.counter("ucube_media_transcodes_total", "Oversized media transcoded to fit uploads by result.")
+TRANSCODE_SECONDS = metrics.histogram("ucube_media_transcode_seconds", "Time to transcode one media file.")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}  # animated gifs are left as links.
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".webm", ".mkv"}
+AUDIO_BITRATE = 96000
+MIN_VIDEO_BITRATE = 250000  # below this videos are trimmed instead of re-encoded with a lower bitrate.
+
+
+def transcode_image(source, target, max_bytes):
+    """Recompress (and if needed downscale) an image to a JPEG smaller than ``max_bytes``.
+
+    Runs in a worker process.
+
+    :returns: The size and sha256 hex digest of the written file.
+    """
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        quality = 85
+        while True:
+            buffer = BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+            size = buffer.tell()
+            if size < max_bytes:
+                break
+            if quality > 65:
+                quality -= 10
+                continue
+            # JPEG size grows with the pixel count, shrink both sides by the ratio that is still needed.
+            scale = max(min((max_bytes / size) ** 0.5 * 0.95, 0.9), 0.1)
+            image = image.resize((max(int(image.width * scale), 1), max(int(image.height * scale), 1)),
+                                 Image.LANCZOS)
+
+    data = buffer.getvalue()
+    with open(target, "wb") as fd:
+        fd.write(data)
+    return size, sha256(data).hexdigest()
+
+
+def transcode_video(ffmpeg, source, target, max_bytes):
+    """Re-encode a video with a bitrate that fits ``max_bytes``, trimming it if that bitrate would be unwatchable.
+
+    Runs in a worker process.
+
+    :returns: The size and sha256 hex digest of the written file.
+    """
+    ffprobe = path.join(path.dirname(ffmpeg), "ffprobe") if path.dirname(ffmpeg) else "ffprobe"
+    probe = subprocess.run([ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "json", source],
+                           capture_output=True, check=True)
+    duration = float(json.loads(probe.stdout)["format"]["duration"])
+
+    budget = max_bytes * 8 * 0.95  # bits, leaving room for the container.
+    video_bitrate = budget / duration - AUDIO_BITRATE
+    if video_bitrate < MIN_VIDEO_BITRATE:
+        video_bitrate = MIN_VIDEO_BITRATE
+        duration = budget / (MIN_VIDEO_BITRATE + AUDIO_BITRATE)
+
+    subprocess.run([ffmpeg, "-y", "-v", "error", "-i", source, "-t", f"{duration:.2f}",
+                    "-vf", "scale='min(1280,iw)':-2", "-c:v", "libx264", "-preset", "veryfast",
+                    "-b:v", str(int(video_bitrate)), "-maxrate", str(int(video_bitrate)),
+                    "-bufsize", str(int(video_bitrate * 2)), "-c:a", "aac", "-b:a", str(AUDIO_BITRATE),
+                    "-movflags", "+faststart", "-f", "mp4", target], capture_output=True, check=True)
+
+    file_hash = sha256()
+    with open(target, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    size = path.getsize(target)
+    if size >= max_bytes:
+        raise ValueError(f"The transcoded video is still {size} bytes.")
+    return size, file_hash.hexdigest()
+
+
+class MediaTranscoder:
+    def __init__(self, folder, max_bytes=5000000000, processes=None, ffmpeg=None, temp_folder=None):
+        """
+        Shrinks media that is too large to upload so it is sent inline instead of as a link.
+
+        Images are recompressed and downscaled with Pillow and videos are re-encoded (or trimmed) with ffmpeg.
+        Both are optional: media that can not be transcoded is sent as a link like before. Transcoding runs in a
+        pool of worker processes so it never blocks the event loop, and the output is kept in its own
+        models.MediaCache keyed by the source file and the size it had to fit, so the same source is only
+        transcoded once.
+
+        :param folder: (str) The folder transcoded media is stored in.
+        :param max_bytes: (int) The disk budget for transcoded media.
+        :param processes: (int) The amount of worker processes (the amount of CPUs by default).
+        :param ffmpeg: (str) The location of the ffmpeg binary (looked up on the PATH by default).
+        :param temp_folder: (str) The folder media is transcoded into before it is moved to ``folder``.
+        """
+        makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.ffmpeg = ffmpeg or which("ffmpeg")
+        self._cache = MediaCache(folder, max_bytes=max_bytes, temp_folder=temp_folder)
+        self._failed: Set[str] = set()  # cache keys of media that could not be made small enough
+        # spawned like the cluster workers, forking a process with running threads is not safe.
+        self._executor = ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn"))
+
+    def can_transcode(self, file_name) -> bool:
+        """Check if a file type can be transcoded with what is installed."""
+        extension = path.splitext(file_name)[1].lower()
+        return (extension in IMAGE_EXTENSIONS and Image is not None) or \
+            (extension in VIDEO_EXTENSIONS and self.ffmpeg is not None)
+
+    async def fit(self, source, max_bytes) -> Optional[dict]:
+        """Get a copy of a media file that is smaller than ``max_bytes``, transcoding it only once.
+
+        :param source: (str) The location of the media file.
+        :param max_bytes: (int) The size the copy has to be smaller than.
+        :returns: (dict) The cache entry of the copy, or None if it can not be transcoded.
+        """
+        if not self.can_transcode(source):
+            return None
+
+        key = f"{path.basename(source)}:{max_bytes}"
+        if key in self._failed:
+            return None
+
+        is_video = path.splitext(source)[1].lower() in VIDEO_EXTENSIONS
+
+        async def transcode(_, target):
+            loop = get_event_loop()
+            start = loop.time()
+            if is_video:
+                result = await loop.run_in_executor(self._executor, transcode_video, self.ffmpeg, source, target,
+                                                    max_bytes)
+            else:
+                result = await loop.run_in_executor(self._executor, transcode_image, source, target, max_bytes)
+            TRANSCODE_SECONDS.observe(loop.time() - start)
+            TRANSCODES.inc(result="transcoded")
+            return result
+
+        try:
+            entry = await self._cache.fetch(key, "transcoded.mp4" if is_video else "transcoded.jpg", transcode)
+        except Exception as e:
+            self._failed.add(key)
+            TRANSCODES.inc(result="failed")
+            log.warning("Failed to transcode media.", extra={"source": source, "error": str(e)})
+            return None
+        return entry
+
+    def location(self, entry) -> str:
+        """Get the location of a transcoded file."""
+        return path.join(self.folder, entry["file_name"])
+
+    def close(self):
+        """Stop the worker processes."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
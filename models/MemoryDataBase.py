@@ -0,0 +1,185 @@
+from itertools import count
+from time import monotonic
+from typing import Dict, Set, Tuple
+from . import AbstractDataBase
+
+
+class MemoryDataBase(AbstractDataBase):
+    def __init__(self, host=None, database=None, user=None, password=None, port=None, **kwargs):
+        """
+        A DataBase that only lives in memory.
+
+        Nothing is persisted: subscriptions, delivered posts and queued deliveries are lost when the bot stops.
+        It is meant for tests and load tests, not for running the bot. It is ready as soon as it is created.
+        """
+        super().__init__(host, database, user, password, port, **kwargs)
+        self._channels: Dict[Tuple[int, str], int] = {}  # (channel id, community name) : role id
+        self._digests: Set[Tuple[int, str]] = set()  # (channel id, community name) of digest subscriptions
+        self._posts: Dict[str, Dict[str, int]] = {}  # community name : { post slug : seq }
+        self._rendered: Dict[Tuple[str, str], str] = {}  # (community name, post slug) : rendered post
+        self._delivered: Dict[Tuple[str, int], Tuple[int, int]] = {}  # (community, channel id) : (high-water, mask)
+        self._translations: Dict[str, str] = {}
+        self._webhooks: Dict[int, Tuple[int, str]] = {}  # channel id : (webhook id, token)
+        self._jobs: Dict[int, dict] = {}  # job id : job (in the order they were queued)
+        self._job_ids: Dict[Tuple[str, str, int], int] = {}  # (post slug, community name, channel id) : job id
+        self._next_job_id = count(1)
+        self.ready = True
+
+    @property
+    def is_connected(self) -> bool:
+        return True  # the tables are in memory.
+
+    async def connect(self):
+        ...
+
+    async def migrate(self):
+        self.ready = True
+
+    async def close(self):
+        ...
+
+    async def bulk_insert_channels(self, channels):
+        for channel_id, community_name, role_id in channels:
+            self._channels[(channel_id, community_name.lower())] = role_id
+
+    async def bulk_delete_channels(self, channels):
+        for channel_id, community_name in channels:
+            await self.delete_ucube_channel(channel_id, community_name)
+
+    async def bulk_update_roles(self, roles):
+        for channel_id, community_name, role_id in roles:
+            await self.update_role(channel_id, community_name, role_id)
+
+    async def insert_ucube_channel(self, channel_id, community_name):
+        self._channels.setdefault((channel_id, community_name.lower()), None)
+
+    async def delete_ucube_channel(self, channel_id, community_name):
+        self._channels.pop((channel_id, community_name.lower()), None)
+        self._digests.discard((channel_id, community_name.lower()))
+        self._delivered.pop((community_name.lower(), channel_id), None)
+
+    async def update_role(self, channel_id, community_name, role_id):
+        key = (channel_id, community_name.lower())
+        if key in self._channels:
+            self._channels[key] = role_id
+
+    async def update_digest(self, channel_id, community_name, digest):
+        key = (channel_id, community_name.lower())
+        if key not in self._channels:
+            return
+        if digest:
+            self._digests.add(key)
+        else:
+            self._digests.discard(key)
+
+    async def fetch_channels(self):
+        return [(channel_id, community_name, role_id, (channel_id, community_name) in self._digests)
+                for (channel_id, community_name), role_id in self._channels.items()]
+
+    async def iter_channels(self):
+        for record in await self.fetch_channels():
+            yield record
+
+    async def insert_post(self, community_name, post_slug, seq):
+        self._posts.setdefault(community_name.lower(), {}).setdefault(post_slug, seq)
+
+    async def delete_old_posts(self, community_name, min_seq):
+        posts = self._posts.get(community_name.lower())
+        if posts:
+            for post_slug in [post_slug for post_slug, seq in posts.items() if seq < min_seq]:
+                posts.pop(post_slug)
+                self._rendered.pop((community_name.lower(), post_slug), None)
+
+    async def update_rendered_post(self, community_name, post_slug, rendered):
+        if post_slug in self._posts.get(community_name.lower(), {}):
+            self._rendered[(community_name.lower(), post_slug)] = rendered
+
+    async def fetch_post(self, community_name, post_slug):
+        seq = self._posts.get(community_name.lower(), {}).get(post_slug)
+        if seq is not None:
+            return seq, self._rendered.get((community_name.lower(), post_slug))
+
+    async def update_delivered(self, community_name, delivered):
+        community_name = community_name.lower()
+        for channel_id, high_water, mask in delivered:
+            self._delivered[(community_name, channel_id)] = (high_water, mask)
+
+    async def fetch_posts(self):
+        posts = [(community_name, post_slug, seq) for community_name, community_posts in self._posts.items()
+                 for post_slug, seq in community_posts.items()]
+        return sorted(posts, key=lambda post: post[2])
+
+    async def fetch_delivered(self):
+        return [(community_name, channel_id, high_water, mask)
+                for (community_name, channel_id), (high_water, mask) in self._delivered.items()]
+
+    async def insert_translation(self, key, translated):
+        self._translations.setdefault(key, translated)
+
+    async def fetch_translation(self, key):
+        return self._translations.get(key)
+
+    async def insert_webhook(self, channel_id, webhook_id, token):
+        self._webhooks[channel_id] = (webhook_id, token)
+
+    async def delete_webhook(self, channel_id):
+        self._webhooks.pop(channel_id, None)
+
+    async def fetch_webhooks(self):
+        return [(channel_id, webhook_id, token) for channel_id, (webhook_id, token) in self._webhooks.items()]
+
+    async def enqueue_jobs(self, jobs, worker=0, delay=0):
+        now = monotonic()
+        for club_slug, post_slug, community_name, channel_id, rank in jobs:
+            key = (post_slug, community_name.lower(), channel_id)
+            if key in self._job_ids:
+                continue
+            job_id = self._job_ids[key] = next(self._next_job_id)
+            self._jobs[job_id] = {"id": job_id, "clubslug": club_slug, "postslug": post_slug,
+                                  "communityname": key[1], "channelid": channel_id, "attempts": 0,
+                                  "worker": worker, "rank": rank, "availableat": now + delay,
+                                  "createdat": now}
+
+    async def claim_jobs(self, limit, lease, worker=0):
+        now = monotonic()
+        claimed = []
+        for job in sorted(self._jobs.values(), key=lambda job: (job["rank"], job["id"])):
+            if len(claimed) >= limit:
+                break
+            if job["worker"] == worker and job["availableat"] <= now:
+                job["availableat"] = now + lease
+                claimed.append(dict(job))
+        return claimed
+
+    async def claim_channel_jobs(self, community_name, channel_id, lease, worker=0):
+        now = monotonic()
+        claimed = []
+        for job in self._jobs.values():
+            if job["communityname"] == community_name.lower() and job["channelid"] == channel_id and \
+                    job["worker"] == worker and job["availableat"] <= now:
+                job["availableat"] = now + lease
+                claimed.append(dict(job))
+        return claimed
+
+    async def complete_job(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        if job:
+            self._job_ids.pop((job["postslug"], job["communityname"], job["channelid"]), None)
+
+    async def retry_job(self, job_id, delay):
+        job = self._jobs.get(job_id)
+        if job:
+            job["attempts"] += 1
+            job["availableat"] = monotonic() + delay
+
+    async def release_jobs(self, job_ids):
+        now = monotonic()
+        for job_id in job_ids:
+            job = self._jobs.get(job_id)
+            if job:
+                job["availableat"] = now
+
+    async def fetch_queue_stats(self):
+        if not self._jobs:
+            return 0, None
+        return len(self._jobs), monotonic() - min(job["createdat"] for job in self._jobs.values())
@@ -0,0 +1,208 @@
+from asyncio import sleep
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    """Format labels the way Prometheus expects them."""
+    parts = [f'{name}="{value}"' for name, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    __slots__ = ("name", "description", "_values")
+
+    def __init__(self, name, description):
+        """
+        A value that only goes up.
+
+        :param name: (str) The metric name.
+        :param description: (str) What the metric measures.
+        """
+        self.name = name
+        self.description = description
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter."""
+        key = tuple(labels.items())
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Get the current value."""
+        return self._values.get(tuple(labels.items()), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items())
+        return lines
+
+
+class Gauge:
+    __slots__ = ("name", "description", "_values", "_callback")
+
+    def __init__(self, name, description, callback: Optional[Callable[[], Dict[tuple, float]]] = None):
+        """
+        A value that can go up and down.
+
+        :param name: (str) The metric name.
+        :param description: (str) What the metric measures.
+        :param callback: An optional function called on every scrape that returns {labels: value}.
+        """
+        self.name = name
+        self.description = description
+        self._values: Dict[tuple, float] = {}
+        self._callback = callback
+
+    def set(self, value, **labels):
+        """Set the gauge."""
+        self._values[tuple(labels.items())] = value
+
+    def get(self, **labels) -> float:
+        """Get the current value."""
+        return self._values.get(tuple(labels.items()), 0)
+
+    def render(self) -> List[str]:
+        values = self._callback() if self._callback else self._values
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        lines.extend(f"{self.name}{_format_labels(key)} {value}" for key, value in values.items())
+        return lines
+
+
+class Histogram:
+    __slots__ = ("name", "description", "buckets", "_values")
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        """
+        Counts observations (usually seconds) in buckets.
+
+        :param name: (str) The metric name.
+        :param description: (str) What the metric measures.
+        :param buckets: (Tuple[float]) The sorted upper bounds of the buckets.
+        """
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}  # labels : [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        """Record an observation."""
+        key = tuple(labels.items())
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = [0] * (len(self.buckets) + 2)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def time(self, **labels):
+        """Time a block of code.
+
+        Use as ``with histogram.time():``.
+        """
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        """The amount of observations."""
+        values = self._values.get(tuple(labels.items()))
+        return sum(values[:-1]) if values else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, values in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                bound = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(key, bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {values[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(perf_counter() - self._start, **self._labels)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Holds every metric and serves them in the Prometheus text format.
+
+        Metrics are plain in-memory counters, so recording one is a dict update and they can stay on in production.
+        """
+        self._metrics: Dict[str, object] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name, description) -> Counter:
+        """Get or create a counter."""
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name, description, callback=None) -> Gauge:
+        """Get or create a gauge."""
+        return self._get_or_create(Gauge, name, description, callback=callback)
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram."""
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self.render(), content_type="text/plain")
+
+    async def start_server(self, host="127.0.0.1", port=9100):
+        """Serve the metrics at http://host:port/metrics."""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop_server(self):
+        """Stop serving the metrics."""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def monitor_loop_lag(self, interval=1.0):
+        """Measure how late the event loop wakes up from a sleep, forever."""
+        lag = self.histogram("ucube_event_loop_lag_seconds", "How late the event loop wakes up from a sleep.",
+                             buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+        current_lag = self.gauge("ucube_event_loop_lag_current_seconds", "The last measured event loop lag.")
+        while True:
+            start = perf_counter()
+            await sleep(interval)
+            late = max(perf_counter() - start - interval, 0)
+            lag.observe(late)
+            current_lag.set(late)
+
+
+metrics = MetricsRegistry()
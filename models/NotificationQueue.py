@@ -0,0 +1,222 @@
+import logging
+from asyncio import Event, Task, gather, get_event_loop, sleep, wait_for, TimeoutError
+from random import uniform
+from time import time
+from typing import Dict, List, Optional, Tuple
+from . import DeliveryScheduler, metrics
+
+log = logging.getLogger(__name__)
+
+JOBS = metrics.counter("ucube_queue_jobs_total", "Notification queue jobs by outcome.")
+
+
+class NotificationQueue:
+    def __init__(self, conn, handler, scheduler: DeliveryScheduler, on_batch_done=None, workers=2, batch_size=100,
+                 max_attempts=5, base_delay=5.0, lease=300, poll_interval=5.0, worker=0, group_by=None,
+                 group_handler=None, aging=100):
+        """
+        A persistent work queue of (notification, channel) deliveries stored in the DataBase.
+
+        Workers claim jobs for ``lease`` seconds and run them through the delivery scheduler. A job is only
+        removed after the handler succeeds, so jobs of a crashed process are picked up again once their
+        lease expires (at-least-once delivery). Failed jobs are retried with exponential backoff.
+
+        Jobs are claimed by rank. The rank of a job grows by ``aging`` every second it becomes available later,
+        so a job ranked ``n`` behind the jobs of a newer post waits at most ``n / aging`` seconds for them
+        instead of waiting as long as new posts keep coming.
+
+        :param conn: (AbstractDataBase) The DB connection that stores the queue.
+        :param handler: A coroutine function that takes a job record and returns True if it is done.
+        :param scheduler: (DeliveryScheduler) Runs each claimed batch with bounded concurrency.
+        :param on_batch_done: An optional coroutine function called after every batch.
+        :param workers: (int) The amount of workers claiming batches.
+        :param batch_size: (int) The max amount of jobs a worker claims at once.
+        :param max_attempts: (int) Attempts before a job is dropped.
+        :param base_delay: (float) Seconds before the first retry, doubled every attempt.
+        :param lease: (int) Seconds a claimed job is hidden from other workers.
+        :param poll_interval: (float) Max seconds an idle worker waits before checking the queue again.
+        :param worker: (int) The ID of the cluster worker whose jobs are queued and claimed.
+        :param group_by: An optional function that takes a job record and returns a key (or None). Jobs of a
+            claimed batch with the same key are run together, along with every other available job of the same
+            community and channel (claimed with ``claim_channel_jobs``), so no group is split between batches.
+        :param group_handler: A coroutine function that takes a list of grouped jobs and returns True if they
+            are done.
+        :param aging: (float) Ranks a job is ahead of the jobs that become available one second after it.
+        """
+        self._conn = conn
+        self._handler = handler
+        self._scheduler = scheduler
+        self._on_batch_done = on_batch_done
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.worker = worker
+        self._group_by = group_by
+        self._group_handler = group_handler
+        self.aging = aging
+
+        self._tasks: List[Task] = []
+        self._claimed: Dict[int, dict] = {}  # job id : job claimed by this process and not finished yet
+        self._new_jobs = Event()
+        self._running = False
+
+    async def enqueue(self, jobs: List[Tuple[str, str, str, int]], delay=0, worker=None):
+        """Add jobs to the queue and wake up the workers.
+
+        :param jobs: A list of (club slug, post slug, community name, channel id, rank).
+        :param delay: (float) Seconds before the jobs can be claimed.
+        :param worker: (int) The cluster worker that claims the jobs, this one if not given.
+        """
+        if not jobs:
+            return
+        offset = int((time() + delay) * self.aging)
+        jobs = [(club_slug, post_slug, community_name, channel_id, rank + offset)
+                for club_slug, post_slug, community_name, channel_id, rank in jobs]
+        await self._conn.enqueue_jobs(jobs, self.worker if worker is None else worker, delay)
+        if worker not in (None, self.worker):
+            return  # the other worker is woken up by the cluster leader.
+        if delay:
+            get_event_loop().call_later(delay, self._new_jobs.set)
+        else:
+            self._new_jobs.set()
+
+    def wake(self):
+        """Check the queue now instead of after ``poll_interval`` (another process queued jobs for this one)."""
+        self._new_jobs.set()
+
+    def start(self):
+        """Start the workers."""
+        if self._running:
+            return
+        self._running = True
+        loop = get_event_loop()
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers after their current batch."""
+        self._running = False
+        self._new_jobs.set()
+        for task in self._tasks:
+            await task
+        self._tasks = []
+
+    async def checkpoint(self):
+        """Cancel workers that are still running and hand their unfinished jobs back to the queue.
+
+        Finished jobs were already removed, so only the rest is delivered after a restart, without waiting for
+        the lease to expire.
+        """
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        if self._claimed:
+            log.info("Releasing unfinished jobs.", extra={"jobs": len(self._claimed)})
+            await self._conn.release_jobs(list(self._claimed))
+            self._claimed.clear()
+
+    async def get_stats(self) -> Tuple[int, Optional[float]]:
+        """Get the amount of queued jobs and the age (in seconds) of the oldest one."""
+        depth, oldest_age = await self._conn.fetch_queue_stats()
+        return depth, oldest_age
+
+    async def _work(self):
+        """Claim and run batches of jobs until stopped."""
+        while self._running:
+            try:
+                jobs = await self._conn.claim_jobs(self.batch_size, self.lease, self.worker)
+            except Exception:
+                log.exception("Failed to claim jobs from the notification queue.")
+                await sleep(self.poll_interval)
+                continue
+
+            if not jobs:
+                self._new_jobs.clear()
+                try:
+                    await wait_for(self._new_jobs.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+                continue
+
+            self._claimed.update((job["id"], job) for job in jobs)
+            units = self._group(jobs)
+            await self._claim_rest_of_groups(units)
+            await self._scheduler.deliver(units, self._run)
+            if self._on_batch_done:
+                try:
+                    await self._on_batch_done()
+                except Exception:
+                    log.exception("Failed to finish a batch of the notification queue.")
+
+    def _group(self, jobs) -> List[List[dict]]:
+        """Split a batch into the jobs that run on their own and the groups of jobs that run together."""
+        if not self._group_by:
+            return [[job] for job in jobs]
+
+        units = []
+        groups = {}  # key : jobs
+        for job in jobs:
+            key = self._group_by(job)
+            if key is None:
+                units.append([job])
+            elif key in groups:
+                groups[key].append(job)
+            else:
+                groups[key] = [job]
+                units.append(groups[key])
+        return units
+
+    async def _claim_rest_of_groups(self, units: List[List[dict]]):
+        """Add the available jobs of the same community and channel that were not claimed with a group."""
+        for unit in units:
+            job = unit[0]
+            if not self._group_by or self._group_by(job) is None:
+                continue
+            try:
+                rest = await self._conn.claim_channel_jobs(job["communityname"], job["channelid"], self.lease,
+                                                           self.worker)
+            except Exception:
+                log.exception("Failed to claim the rest of a group from the notification queue.")
+                continue
+            rest = [job for job in rest if job["id"] not in self._claimed]
+            self._claimed.update((job["id"], job) for job in rest)
+            unit.extend(rest)
+
+    async def _run(self, jobs):
+        """Run a job (or a group of jobs) and forget them once they were completed, retried or dropped."""
+        try:
+            if len(jobs) == 1:
+                done = await self._handler(jobs[0])
+            else:
+                done = await self._group_handler(jobs)
+        except Exception:
+            log.exception("Job failed.", extra={"job_ids": [job["id"] for job in jobs],
+                                                "channel_id": jobs[0]["channelid"]})
+            done = False
+
+        for job in jobs:
+            await self._finish(job, done)
+            self._claimed.pop(job["id"], None)
+
+    async def _finish(self, job, done):
+        """Complete, retry or drop a job that was run."""
+        if done:
+            JOBS.inc(outcome="done")
+            return await self._conn.complete_job(job["id"])
+
+        attempts = job["attempts"] + 1
+        if attempts >= self.max_attempts:
+            JOBS.inc(outcome="dropped")
+            log.warning("Dropping job after too many attempts.", extra={
+                "post_slug": job["postslug"], "channel_id": job["channelid"], "attempts": attempts})
+            return await self._conn.complete_job(job["id"])
+
+        JOBS.inc(outcome="retried")
+
+        delay = self.base_delay * 2 ** job["attempts"]
+        await self._conn.retry_job(job["id"], delay + uniform(0, delay / 2))
@@ -0,0 +1,238 @@
+import logging
+from asyncio import Event, Semaphore, Task, get_event_loop, wait_for, TimeoutError
+from heapq import heappop, heappush
+from math import log as ln
+from random import uniform
+from time import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+POLLS = metrics.counter("ucube_club_polls_total", "Polls of the notifications of a club by result.")
+POLL_INTERVAL = metrics.histogram("ucube_club_poll_interval_seconds", "Seconds until a club is polled again.")
+
+HOURS = 24
+
+
+class _ClubActivity:
+    __slots__ = ("score", "hours", "updated_at", "last_post", "errors", "stale")
+
+    def __init__(self):
+        """How often a club posts, as post counts that decay over time."""
+        self.score = 0.0  # recent posts, halved every ``half_life``
+        self.hours = [0.0] * HOURS  # posts by UTC hour of the day, halved every ``pattern_half_life``
+        self.updated_at = 0.0
+        self.last_post = 0.0
+        self.errors = 0  # polls that failed in a row
+        self.stale = False  # whether polls were skipped, so its notifications are out of date
+
+
+class PollScheduler:
+    def __init__(self, poll, is_followed, min_interval=10.0, max_interval=40.0, idle_interval=60.0,
+                 max_concurrency=4, posts_per_poll=0.003, burst_window=600.0, half_life=6 * 3600,
+                 pattern_half_life=7 * 86400):
+        """
+        Polls the notifications of every club on its own interval instead of every club on one fixed loop.
+
+        Clubs nobody follows are not polled. The interval of every other club follows how often it posted
+        recently and how much of that happens at the current hour of the day, so a poll finds about
+        ``posts_per_poll`` new posts: hot clubs are polled every ``min_interval`` and quiet clubs every
+        ``max_interval``. A club that just posted is polled every ``min_interval`` for ``burst_window`` seconds
+        since posts come in bursts. Failed polls back off exponentially with jitter, and at most
+        ``max_concurrency`` polls run at once.
+
+        ``max_interval`` bounds how late the first post of a burst of a quiet club is found. The defaults find
+        posts of every followed club sooner than a loop that sleeps 25 seconds between polling every club one
+        after another once there are more than about 50 clubs (benchmarks/polling.py), with fewer requests.
+        Below that, that loop polls every club more often than every 40 seconds, and a ``max_interval`` of 25
+        keeps up with it at the cost of more requests.
+
+        :param poll: A coroutine function taking (club slug, emit) that fetches the notifications of a club and
+            returns the post times (unix seconds) of the new ones, or None if the club no longer exists.
+            ``emit`` is False when the club was not polled for a while and its new notifications are old.
+        :param is_followed: A function taking a club slug that returns whether any channel follows it.
+        :param min_interval: (float) The min seconds between polls of a club.
+        :param max_interval: (float) The max seconds between polls of a club.
+        :param idle_interval: (float) Seconds between checks if a club nobody follows is followed yet.
+        :param max_concurrency: (int) The max amount of polls at the same time.
+        :param posts_per_poll: (float) The amount of new posts a poll should find on average.
+        :param burst_window: (float) Seconds after a post that a club is polled every ``min_interval``.
+        :param half_life: (float) Seconds until a post counts half as much for the post rate.
+        :param pattern_half_life: (float) Seconds until a post counts half as much for the hour of the day.
+        """
+        self._poll = poll
+        self._is_followed = is_followed
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval
+        self.posts_per_poll = posts_per_poll
+        self.burst_window = burst_window
+        self.half_life = half_life
+        self.pattern_half_life = pattern_half_life
+        self._semaphore = Semaphore(max_concurrency)
+        self._clubs: Dict[str, _ClubActivity] = {}  # club slug : activity
+        self._due: Dict[str, float] = {}  # club slug : when it is polled next
+        self._heap: List[Tuple[float, str]] = []  # (due, club slug), entries that no longer match _due are skipped
+        self._wake = Event()
+        self._task: Optional[Task] = None
+        self._polls: Set[Task] = set()
+
+    def add(self, club_slug, post_times: Iterable[float] = ()):
+        """Start polling a club.
+
+        :param club_slug: (str) The club slug.
+        :param post_times: The post times (unix seconds) the club is known for, to learn its activity.
+        """
+        if club_slug in self._clubs:
+            return
+        self._clubs[club_slug] = _ClubActivity()
+        self.record_posts(club_slug, post_times)
+        # spread the first polls so every club does not start at once.
+        self._schedule(club_slug, uniform(0, self.min_interval))
+
+    def remove(self, club_slug):
+        """Stop polling a club."""
+        self._clubs.pop(club_slug, None)
+        self._due.pop(club_slug, None)
+
+    def wake(self, club_slug):
+        """Poll a club now (it was just followed)."""
+        if club_slug in self._clubs:
+            self._schedule(club_slug, 0)
+
+    def record_posts(self, club_slug, post_times: Iterable[float]):
+        """Add posts to the activity of a club."""
+        activity = self._clubs.get(club_slug)
+        if not activity:
+            return
+        for post_time in sorted(post_times):
+            self._decay(activity, max(post_time, activity.updated_at))
+            activity.score += 1
+            activity.hours[int(post_time // 3600) % HOURS] += 1
+            activity.last_post = max(activity.last_post, post_time)
+
+    def _decay(self, activity: _ClubActivity, now):
+        elapsed = now - activity.updated_at
+        if elapsed <= 0:
+            return
+        activity.score *= 0.5 ** (elapsed / self.half_life)
+        pattern_decay = 0.5 ** (elapsed / self.pattern_half_life)
+        activity.hours = [posts * pattern_decay for posts in activity.hours]
+        activity.updated_at = now
+
+    def get_rate(self, club_slug, now=None) -> float:
+        """The expected posts per second of a club at this hour of the day."""
+        activity = self._clubs[club_slug]
+        now = now or time()
+        score = activity.score * 0.5 ** (max(now - activity.updated_at, 0) / self.half_life)
+        rate = score * ln(2) / self.half_life
+
+        total = sum(activity.hours)
+        if total:
+            # the share of posts made around this hour, with one post spread over the day so a single post does
+            # not decide the pattern. 1.0 is an average hour.
+            hour = int(now // 3600) % HOURS
+            around = sum(activity.hours[(hour + offset) % HOURS] for offset in (-1, 0, 1)) / 3
+            rate *= (around + 1 / HOURS) / (total + 1) * HOURS
+        return rate
+
+    def get_interval(self, club_slug, now=None) -> float:
+        """The seconds until a club that was polled successfully is polled again (without jitter)."""
+        now = now or time()
+        if now - self._clubs[club_slug].last_post < self.burst_window:
+            return self.min_interval
+        rate = self.get_rate(club_slug, now)
+        interval = self.posts_per_poll / rate if rate else self.max_interval
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def get_delay(self, club_slug, now=None) -> float:
+        """The seconds until a club is polled again, with jitter so clubs do not poll in lockstep."""
+        activity = self._clubs[club_slug]
+        if activity.errors:
+            backoff = min(self.min_interval * 2 ** activity.errors, self.max_interval)
+            return uniform(backoff / 2, backoff)
+        return self.get_interval(club_slug, now) * uniform(0.9, 1.1)
+
+    def _schedule(self, club_slug, delay):
+        due = self._due[club_slug] = time() + delay
+        heappush(self._heap, (due, club_slug))
+        self._wake.set()
+
+    def start(self):
+        """Start polling."""
+        if not self._task:
+            self._task = get_event_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop polling and cancel the polls that are running."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for poll in list(self._polls):
+            poll.cancel()
+
+    async def _run(self):
+        loop = get_event_loop()
+        while True:
+            if not self._heap:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            due, club_slug = self._heap[0]
+            wait = due - time()
+            if wait > 0:
+                self._wake.clear()
+                try:
+                    await wait_for(self._wake.wait(), wait)
+                except TimeoutError:
+                    pass
+                continue
+
+            heappop(self._heap)
+            if self._due.get(club_slug) != due:
+                continue  # rescheduled or removed.
+
+            if not self._is_followed(club_slug):
+                # nobody would receive its posts, check again later without a request.
+                POLLS.inc(result="skipped")
+                self._clubs[club_slug].stale = True
+                self._schedule(club_slug, self.idle_interval)
+                continue
+
+            await self._semaphore.acquire()
+            poll = loop.create_task(self._poll_club(club_slug))
+            self._polls.add(poll)
+            poll.add_done_callback(self._polls.discard)
+
+    async def _poll_club(self, club_slug):
+        try:
+            activity = self._clubs.get(club_slug)
+            if not activity:
+                return
+            try:
+                post_times = await self._poll(club_slug, not activity.stale)
+            except Exception as e:
+                activity.errors += 1
+                POLLS.inc(result="failed")
+                log.warning("Failed to poll a club.", extra={
+                    "club_slug": club_slug, "errors": activity.errors, "error": str(e)})
+            else:
+                if post_times is None:
+                    log.info("Club no longer exists, it is not polled anymore.", extra={"club_slug": club_slug})
+                    return self.remove(club_slug)
+                activity.errors = 0
+                activity.stale = False
+                self.record_posts(club_slug, post_times)
+                POLLS.inc(result="new" if post_times else "empty")
+
+            if club_slug in self._clubs:
+                delay = self.get_delay(club_slug)
+                POLL_INTERVAL.observe(delay)
+                self._schedule(club_slug, delay)
+        finally:
+            self._semaphore.release()
+
+    def __len__(self):
+        return len(self._clubs)
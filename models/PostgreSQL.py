@@ -1,7 +1,11 @@
+import logging
 import asyncpg
-from . import AbstractDataBase
+from . import AbstractDataBase, metrics
+from .AbstractDataBase import timed
 from asyncio import get_event_loop
 
+log = logging.getLogger(__name__)
+
 
 class PostgreSQL(AbstractDataBase):
     def __init__(self, *args, **kwargs):
@@ -11,41 +15,205 @@ class PostgreSQL(AbstractDataBase):
 
     async def create_db_and_connect(self):
         await self.connect()
-        await self.__create_ucube_schema()
-        await self.__create_ucube_table()
+        await self.migrate()
 
     async def connect(self):
         self.pool: asyncpg.pool.Pool = await asyncpg.create_pool(**self._connect_kwargs, command_timeout=60)
-        print("Successful Connection to DataBase.")
+        metrics.gauge("ucube_db_pool_connections", "Connections in the DataBase pool by state.",
+                      callback=self._pool_usage)
+        log.info("Successful Connection to DataBase.")
         return self.pool
 
-    async def __create_ucube_schema(self):
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+
+    def _pool_usage(self):
+        """The amount of used and idle connections in the pool."""
+        if not self.pool:
+            return {}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {(("state", "used"),): size - idle, (("state", "idle"),): idle}
+
+    @timed
+    async def migrate(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(self._create_schema_sql)
+                await conn.execute(self._create_version_table_sql)
+                await conn.execute(self._lock_version_table_sql)
+                version = await conn.fetchval(self._fetch_version_sql)
+                if version is None:
+                    version = 0
+                    await conn.execute(self._insert_version_sql, version)
+
+                for migration in self._migrations[version:]:
+                    await conn.execute(migration)
+
+                if version != len(self._migrations):
+                    await conn.execute(self._update_version_sql, len(self._migrations))
+                    log.info("Migrated DataBase.", extra={"from_version": version,
+                                                          "to_version": len(self._migrations)})
+        self.ready = True
+
+    @timed
+    async def bulk_insert_channels(self, channels):
+        records = [(channel_id, community_name.lower(), role_id) for channel_id, community_name, role_id in channels]
         async with self.pool.acquire() as conn:
-            await conn.execute(self._create_schema_sql)
+            async with conn.transaction():
+                await conn.execute(self._create_staging_table_sql)
+                await conn.copy_records_to_table("staging_channels", records=records)
+                await conn.execute(self._merge_staging_table_sql)
 
-    async def __create_ucube_table(self):
+    @timed
+    async def bulk_delete_channels(self, channels):
+        records = [(channel_id, community_name.lower()) for channel_id, community_name in channels]
         async with self.pool.acquire() as conn:
-            await conn.execute(self._create_table_sql)
+            async with conn.transaction():
+                await conn.executemany(self._delete_channel_sql, records)
+                await conn.executemany(self._delete_delivered_sql, records)
 
+    @timed
+    async def bulk_update_roles(self, roles):
+        records = [(role_id, channel_id, community_name.lower()) for channel_id, community_name, role_id in roles]
+        async with self.pool.acquire() as conn:
+            await conn.executemany(self._update_role_sql, records)
+
+    @timed
     async def insert_ucube_channel(self, channel_id, community_name):
         async with self.pool.acquire() as conn:
             await conn.execute(self._insert_channel_sql, channel_id, community_name.lower(), None)
 
+    @timed
     async def delete_ucube_channel(self, channel_id, community_name):
         async with self.pool.acquire() as conn:
             await conn.execute(self._delete_channel_sql, channel_id, community_name.lower())
+            await conn.execute(self._delete_delivered_sql, channel_id, community_name.lower())
 
+    @timed
     async def update_role(self, channel_id, community_name, role_id):
         async with self.pool.acquire() as conn:
             await conn.execute(self._update_role_sql, role_id, channel_id, community_name.lower())
 
+    @timed
+    async def update_digest(self, channel_id, community_name, digest):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._update_digest_sql, digest, channel_id, community_name.lower())
+
+    @timed
     async def fetch_channels(self):
         async with self.pool.acquire() as conn:
             return await conn.fetch(self._fetch_all_sql)
 
-    async def recreate_db(self):
+    async def iter_channels(self):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                async for record in conn.cursor(self._fetch_all_sql, prefetch=1000):
+                    yield record
+
+    @timed
+    async def insert_post(self, community_name, post_slug, seq):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._insert_post_sql, community_name.lower(), post_slug, seq)
+
+    @timed
+    async def delete_old_posts(self, community_name, min_seq):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._delete_old_posts_sql, community_name.lower(), min_seq)
+
+    @timed
+    async def update_rendered_post(self, community_name, post_slug, rendered):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._update_rendered_post_sql, community_name.lower(), post_slug, rendered)
+
+    @timed
+    async def fetch_post(self, community_name, post_slug):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchrow(self._fetch_post_sql, community_name.lower(), post_slug)
+
+    @timed
+    async def update_delivered(self, community_name, delivered):
+        if not delivered:
+            return
+        community_name = community_name.lower()
+        async with self.pool.acquire() as conn:
+            await conn.executemany(self._upsert_delivered_sql, [(community_name, channel_id, high_water, mask)
+                                                                for channel_id, high_water, mask in delivered])
+
+    @timed
+    async def fetch_posts(self):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(self._fetch_posts_sql)
+
+    @timed
+    async def fetch_delivered(self):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(self._fetch_delivered_sql)
+
+    @timed
+    async def insert_translation(self, key, translated):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._insert_translation_sql, key, translated)
+
+    @timed
+    async def fetch_translation(self, key):
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval(self._fetch_translation_sql, key)
+
+    @timed
+    async def insert_webhook(self, channel_id, webhook_id, token):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._upsert_webhook_sql, channel_id, webhook_id, token)
+
+    @timed
+    async def delete_webhook(self, channel_id):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._delete_webhook_sql, channel_id)
+
+    @timed
+    async def fetch_webhooks(self):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(self._fetch_webhooks_sql)
+
+    @timed
+    async def enqueue_jobs(self, jobs, worker=0, delay=0):
+        records = [(club_slug, post_slug, community_name.lower(), channel_id, worker, rank)
+                   for club_slug, post_slug, community_name, channel_id, rank in jobs]
+        async with self.pool.acquire() as conn:
+            if delay:
+                await conn.executemany(self._enqueue_delayed_job_sql, [(*record, delay) for record in records])
+            else:
+                await conn.executemany(self._enqueue_job_sql, records)
+
+    @timed
+    async def claim_jobs(self, limit, lease, worker=0):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(self._claim_jobs_sql, limit, float(lease), worker)
+
+    @timed
+    async def claim_channel_jobs(self, community_name, channel_id, lease, worker=0):
+        async with self.pool.acquire() as conn:
+            return await conn.fetch(self._claim_channel_jobs_sql, community_name.lower(), channel_id, worker,
+                                    float(lease))
+
+    @timed
+    async def complete_job(self, job_id):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._complete_job_sql, job_id)
+
+    @timed
+    async def retry_job(self, job_id, delay):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._retry_job_sql, job_id, float(delay))
+
+    @timed
+    async def release_jobs(self, job_ids):
+        async with self.pool.acquire() as conn:
+            await conn.execute(self._release_jobs_sql, list(job_ids))
+
+    @timed
+    async def fetch_queue_stats(self):
         async with self.pool.acquire() as conn:
-            await conn.execute(self._drop_table_sql)
-            await conn.execute(self._drop_schema_sql)
-        await self.__create_ucube_schema()
-        await self.__create_ucube_table()
+            depth, oldest_age = await conn.fetchrow(self._fetch_queue_stats_sql)
+            return depth, None if oldest_age is None else float(oldest_age)
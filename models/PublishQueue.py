@@ -0,0 +1,162 @@
+import logging
+from asyncio import Event, Queue, Task, TimerHandle, get_event_loop
+from random import uniform
+from typing import Dict, List, Set, Tuple
+import discord
+from . import DeliveryScheduler, metrics
+
+log = logging.getLogger(__name__)
+
+PUBLISHED = metrics.counter("ucube_messages_published_total", "News channel messages published by result.")
+PUBLISH_BACKLOG = metrics.gauge("ucube_publish_backlog", "News channels with messages waiting to be published.")
+
+
+class PublishQueue:
+    def __init__(self, scheduler: DeliveryScheduler, max_attempts=5, base_delay=5.0):
+        """
+        Publishes (crossposts) messages of news channels in the background.
+
+        Discord's crosspost limit is far stricter than the send limit, so publishing has its own workers and
+        buckets and never holds up delivery to other channels. Messages of the same channel waiting to be
+        published are coalesced into one entry, and a channel is worked on by one worker at a time so its
+        messages are published in order. A channel whose bucket is empty is set aside until it resets instead of
+        holding a worker, and 429s and server errors are retried with exponential backoff.
+
+        :param scheduler: (DeliveryScheduler) The concurrency and buckets used only for publishing.
+        :param max_attempts: (int) Attempts before the messages of a channel are dropped.
+        :param base_delay: (float) Seconds before the first retry, doubled every attempt.
+        """
+        self._scheduler = scheduler
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self._pending: Dict[int, dict] = {}  # channel id : {"messages": List[discord.Message], "attempts": int}
+        self._ready: Queue = Queue()  # channel ids that can be published now
+        self._busy: Set[int] = set()  # channel ids being published or set aside, new messages wait in _pending.
+        self._set_aside: Dict[int, Tuple[TimerHandle, List[discord.Message]]] = {}
+        self._tasks: List[Task] = []
+        self._idle = Event()  # set whenever nothing waits to be published.
+        self._idle.set()
+
+    def publish(self, channel_id, messages: List[discord.Message]):
+        """Queue messages of a news channel to be published.
+
+        :param channel_id: (int) The news channel ID.
+        :param messages: The messages to publish in order.
+        """
+        self._add(channel_id, messages, 0)
+
+    def _add(self, channel_id, messages, attempts, first=False):
+        entry = self._pending.get(channel_id)
+        if entry:
+            # the channel is already waiting, publish these with it (before the others if they were set aside).
+            entry["messages"] = list(messages) + entry["messages"] if first else entry["messages"] + list(messages)
+            entry["attempts"] = max(entry["attempts"], attempts)
+        else:
+            self._pending[channel_id] = {"messages": list(messages), "attempts": attempts}
+            PUBLISH_BACKLOG.set(len(self._pending))
+            self._idle.clear()
+        if channel_id not in self._busy:
+            # a busy channel is queued again once it is released.
+            self._ready.put_nowait(channel_id)
+
+    def _add_later(self, delay, channel_id, messages, attempts):
+        """Set the rest of the messages of a channel aside, the channel stays busy until they are added back."""
+        handle = get_event_loop().call_later(delay, self._add_back, channel_id, messages, attempts)
+        self._set_aside[channel_id] = (handle, messages)
+
+    def _add_back(self, channel_id, messages, attempts):
+        self._set_aside.pop(channel_id, None)
+        self._busy.discard(channel_id)
+        self._add(channel_id, messages, attempts, first=True)
+
+    def _release(self, channel_id):
+        if channel_id in self._set_aside:
+            return
+        self._busy.discard(channel_id)
+        if channel_id in self._pending:
+            self._ready.put_nowait(channel_id)
+        elif not self._pending and not self._busy:
+            self._idle.set()
+
+    def start(self):
+        """Start the workers."""
+        if self._tasks:
+            return
+        loop = get_event_loop()
+        self._tasks = [loop.create_task(self._work()) for _ in range(self._scheduler.max_concurrency)]
+
+    async def drain(self):
+        """Wait until every queued message was published, including channels that were set aside.
+
+        Run it within the shutdown deadline; a channel whose bucket resets after the deadline is left to ``stop``.
+        """
+        await self._idle.wait()
+
+    async def stop(self):
+        """Stop the workers. Messages that were still waiting (after ``drain`` timed out) are counted as dropped."""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        left = sum(len(entry["messages"]) for entry in self._pending.values())
+        for handle, messages in self._set_aside.values():
+            handle.cancel()
+            left += len(messages)
+        if left:
+            PUBLISHED.inc(left, result="dropped")
+            log.warning("Dropping messages to publish when shutting down.", extra={
+                "channels": len(self._pending) + len(self._set_aside), "messages": left})
+        self._pending.clear()
+        self._set_aside.clear()
+        self._busy.clear()
+        PUBLISH_BACKLOG.set(0)
+
+    @property
+    def backlog(self) -> int:
+        """The amount of channels with messages waiting to be published."""
+        return len(self._pending)
+
+    async def _work(self):
+        while True:
+            channel_id = await self._ready.get()
+            if channel_id in self._busy or channel_id not in self._pending:
+                # queued twice, the channel is already taken care of.
+                continue
+            entry = self._pending.pop(channel_id)
+            PUBLISH_BACKLOG.set(len(self._pending))
+            self._busy.add(channel_id)
+            try:
+                await self._publish(channel_id, entry["messages"], entry["attempts"])
+            except Exception:
+                log.exception("Failed to publish messages.", extra={"channel_id": channel_id})
+            finally:
+                self._release(channel_id)
+
+    async def _publish(self, channel_id, messages, attempts):
+        """Publish the messages of a channel in order, setting the rest aside if the channel is rate-limited."""
+        for index, message in enumerate(messages):
+            wait = self._scheduler.get_bucket(channel_id).delay
+            if wait:
+                self._add_later(wait, channel_id, messages[index:], attempts)
+                return
+
+            await self._scheduler.throttle(channel_id)
+            try:
+                await message.publish()
+                PUBLISHED.inc(result="published")
+            except discord.HTTPException as e:
+                if e.status == 429 or e.status >= 500:
+                    if e.status == 429:
+                        self._scheduler.rate_limited(channel_id, e)
+                    if attempts + 1 >= self.max_attempts:
+                        PUBLISHED.inc(len(messages) - index, result="dropped")
+                        log.warning("Dropping messages to publish after too many attempts.", extra={
+                            "channel_id": channel_id, "messages": len(messages) - index})
+                        return
+                    delay = self.base_delay * 2 ** attempts
+                    self._add_later(delay + uniform(0, delay / 2), channel_id, messages[index:], attempts + 1)
+                    return
+
+                # already published, deleted or no permission. Nothing to retry.
+                PUBLISHED.inc(result="failed")
+                log.warning("Failed to publish Message.", extra={
+                    "message_id": message.id, "channel_id": channel_id, "status": e.status, "error": str(e)})
@@ -0,0 +1,61 @@
+from asyncio import Lock, sleep
+from time import monotonic
+
+
+class RateLimitBucket:
+    def __init__(self, limit, per):
+        """
+        Represents a Discord rate-limit bucket as a fixed window of ``limit`` requests every ``per`` seconds.
+
+        :param limit: (int) The amount of requests allowed in a window.
+        :param per: (float) The length of a window in seconds.
+        """
+        self.limit = limit
+        self.per = per
+        self._remaining = limit
+        self._window_start = 0.0
+        self._blocked_until = 0.0
+        self._lock = Lock()
+
+    @property
+    def idle(self) -> bool:
+        """Whether the bucket has fully reset and nobody is waiting on it."""
+        now = monotonic()
+        return not self._lock.locked() and now - self._window_start >= self.per and now >= self._blocked_until
+
+    @property
+    def delay(self) -> float:
+        """Seconds until a slot is free in this bucket (0 if one is free now)."""
+        now = monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if now - self._window_start >= self.per or self._remaining > 0:
+            return 0.0
+        return self._window_start + self.per - now
+
+    async def acquire(self):
+        """Wait until a request may be made in this bucket and take a slot."""
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._blocked_until:
+                    await sleep(self._blocked_until - now)
+                    continue
+
+                if now - self._window_start >= self.per:
+                    self._window_start = now
+                    self._remaining = self.limit
+
+                if self._remaining > 0:
+                    self._remaining -= 1
+                    return
+
+                await sleep(self._window_start + self.per - now)
+
+    def block(self, retry_after):
+        """Block the bucket after Discord responded with a 429.
+
+        :param retry_after: (float) Seconds to wait before the next request.
+        """
+        self._blocked_until = max(self._blocked_until, monotonic() + retry_after)
+        self._remaining = 0
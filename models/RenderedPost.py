@@ -0,0 +1,152 @@
+from io import BytesIO
+from os import path
+from typing import List, Optional, Tuple
+import aiofiles
+import discord
+from . import TextSplitter
+from .TextSplitter import DESCRIPTION_LIMIT
+
+
+class RenderedPost:
+    __slots__ = ("club_name", "post_slug", "embeds", "attachments", "message_text", "media_files")
+
+    def __init__(self, club_name, post_slug, embeds, attachments, message_text, media_files=()):
+        """
+        A post that is rendered once and sent to every channel following the community.
+
+        The embeds and attachment bytes are shared by every send, only the role mention is added per channel.
+        This object should be treated as read-only.
+
+        :param club_name: (str) The name of the club.
+        :param post_slug: (str) The post slug.
+        :param embeds: (Tuple[Tuple[discord.Embed]]) The embeds of the post grouped by message.
+        :param attachments: (Tuple[Tuple[str, bytes]]) The file names and content of files to upload.
+        :param message_text: (str) The urls of media that is not uploaded.
+        :param media_files: (Tuple[str]) The locations the attachments were read from.
+        """
+        self.club_name: str = club_name
+        self.post_slug: str = post_slug
+        self.embeds: Tuple[Tuple[discord.Embed]] = tuple(tuple(group) for group in embeds)
+        self.attachments: Tuple[Tuple[str, bytes]] = tuple(attachments)
+        self.message_text: Optional[str] = message_text or None
+        self.media_files: Tuple[str] = tuple(media_files)
+
+    @classmethod
+    async def create(cls, club_name, post_slug, embeds, media_files, message_text, max_embeds=1):
+        """Render a post by packing its embeds into as few messages as possible and reading every media file
+        into memory once.
+
+        :param embeds: (List[discord.Embed]) The embeds of the post.
+        :param media_files: (List[str]) File locations to upload.
+        :param max_embeds: (int) The max amount of embeds that can be sent in one message.
+        """
+        attachments = await cls._read_files(media_files)
+        embed_groups = TextSplitter.pack(embeds, size=len, max_items=max_embeds)
+        return cls(club_name, post_slug, embed_groups, attachments, message_text, media_files)
+
+    @classmethod
+    def merge(cls, posts: List["RenderedPost"], max_embeds=1) -> "RenderedPost":
+        """Combine several posts of a club into one digest that is sent as if it was one post.
+
+        The embeds of every post are packed together, so a digest needs fewer messages than its posts. If a
+        message can only have one embed (discord.py before 2.0), the embeds are combined into as few embeds as
+        the description limit allows instead.
+
+        :param posts: (List[RenderedPost]) The posts in the order they were posted.
+        :param max_embeds: (int) The max amount of embeds that can be sent in one message.
+        """
+        embeds = [embed for post in posts for group in post.embeds for embed in group]
+        if max_embeds == 1:
+            embeds = cls.combine_embeds(embeds)
+        embeds = TextSplitter.pack(embeds, size=len, max_items=max_embeds)
+        return cls(posts[0].club_name, ",".join(post.post_slug for post in posts), embeds,
+                   [attachment for post in posts for attachment in post.attachments],
+                   "\n".join(post.message_text for post in posts if post.message_text),
+                   [media_file for post in posts for media_file in post.media_files])
+
+    @staticmethod
+    def combine_embeds(embeds: List[discord.Embed]) -> List[discord.Embed]:
+        """Combine embeds into as few embeds as possible, every embed becoming a section of a description.
+
+        Each combined embed keeps the look (color, author and footer) of its first embed. An embed whose section
+        alone is over the description limit is kept as it is.
+        """
+        def section(embed: discord.Embed) -> str:
+            return f"**{embed.title}**\n{embed.description or ''}"
+
+        combined = []
+        for group in TextSplitter.pack(embeds, size=lambda embed: len(section(embed)) + 2, max_items=len(embeds),
+                                       max_total=DESCRIPTION_LIMIT + 2):
+            if len(group) == 1:
+                combined.append(group[0])
+                continue
+            data = group[0].to_dict()
+            data.pop("title", None)
+            data["description"] = "\n\n".join(map(section, group))
+            combined.append(discord.Embed.from_dict(data))
+        return combined
+
+    @staticmethod
+    def pack_digests(posts: List["RenderedPost"], max_files=10, max_bytes=8000000,
+                     max_text=2000) -> List[List["RenderedPost"]]:
+        """Greedily group posts into digests whose media still fits in a single message, keeping their order.
+
+        :param posts: (List[RenderedPost]) The posts to group.
+        :param max_files: (int) The max amount of attachments of a message.
+        :param max_bytes: (int) The max total size of the attachments of a message.
+        :param max_text: (int) The max length of the text of a message.
+        :returns: A list of groups of posts.
+        """
+        groups = []
+        group = []
+        files = size = text = 0
+        for post in posts:
+            post_size = sum(len(data) for _, data in post.attachments)
+            post_text = len(post.message_text or "") + 1
+            if group and (files + len(post.attachments) > max_files or size + post_size > max_bytes or
+                          text + post_text > max_text):
+                groups.append(group)
+                group = []
+                files = size = text = 0
+            group.append(post)
+            files += len(post.attachments)
+            size += post_size
+            text += post_text
+
+        if group:
+            groups.append(group)
+        return groups
+
+    def to_dict(self) -> dict:
+        """Serialize the post so another process on this host can send it without rendering it again.
+
+        Attachments are sent as their file locations.
+        """
+        return {
+            "club_name": self.club_name,
+            "post_slug": self.post_slug,
+            "embeds": [[embed.to_dict() for embed in group] for group in self.embeds],
+            "media_files": list(self.media_files),
+            "message_text": self.message_text,
+        }
+
+    @classmethod
+    async def from_dict(cls, data):
+        """Load a post serialized with ``to_dict``, reading its media files once."""
+        attachments = await cls._read_files(data["media_files"])
+        embeds = [[discord.Embed.from_dict(embed) for embed in group] for group in data["embeds"]]
+        return cls(data["club_name"], data["post_slug"], embeds, attachments, data["message_text"],
+                   data["media_files"])
+
+    @staticmethod
+    async def _read_files(media_files) -> List[Tuple[str, bytes]]:
+        """Read the file name and content of every media file."""
+        attachments = []
+        for file_location in media_files:
+            async with aiofiles.open(file_location, mode='rb') as fd:
+                attachments.append((path.basename(file_location), await fd.read()))
+        return attachments
+
+    def get_files(self) -> List[discord.File]:
+        """Get new discord Files for a send (discord closes them after sending) without touching the disk."""
+        return [discord.File(BytesIO(data), filename=file_name) for file_name, data in self.attachments]
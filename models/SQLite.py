@@ -0,0 +1,360 @@
+import logging
+import sqlite3
+from asyncio import get_event_loop
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from . import AbstractDataBase
+from .AbstractDataBase import timed
+
+log = logging.getLogger(__name__)
+
+
+class SQLite(AbstractDataBase):
+    def __init__(self, location="ucubebot.sqlite3", table_name="channels", posts_table_name="posts",
+                 delivered_table_name="delivered", translations_table_name="translations", queue_table_name="queue",
+                 webhooks_table_name="webhooks", **kwargs):
+        """
+        A DataBase stored in a single SQLite file for small or single-node deployments.
+
+        sqlite3 is blocking, so every statement runs on one dedicated thread which also serializes the writes.
+
+        :param location: (str) The location of the DataBase file (``:memory:`` for a temporary DataBase).
+        """
+        super().__init__(None, None, None, None, None, table_name=table_name, posts_table_name=posts_table_name,
+                         delivered_table_name=delivered_table_name,
+                         translations_table_name=translations_table_name, queue_table_name=queue_table_name,
+                         webhooks_table_name=webhooks_table_name, **kwargs)
+        self.location = location
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+        channels = self._table_name
+        posts = self._posts_table_name
+        delivered = self._delivered_table_name
+        translations = self._translations_table_name
+        queue = self._queue_table_name
+        webhooks = self._webhooks_table_name
+
+        self._insert_channel_sql = f"INSERT OR IGNORE INTO {channels}(channelid, communityname, roleid) " \
+                                   f"VALUES(?, ?, ?)"
+        self._upsert_channel_sql = f"INSERT INTO {channels}(channelid, communityname, roleid) VALUES(?, ?, ?) " \
+                                   f"ON CONFLICT (channelid, communityname) DO UPDATE SET roleid = excluded.roleid"
+        self._delete_channel_sql = f"DELETE FROM {channels} WHERE channelid = ? AND communityname = ?"
+        self._update_role_sql = f"UPDATE {channels} SET roleid = ? WHERE channelid = ? AND communityname = ?"
+        self._update_digest_sql = f"UPDATE {channels} SET digest = ? WHERE channelid = ? AND communityname = ?"
+        self._fetch_all_sql = f"SELECT channelid, communityname, roleid, digest FROM {channels}"
+
+        self._insert_post_sql = f"INSERT OR IGNORE INTO {posts}(communityname, postslug, seq) VALUES(?, ?, ?)"
+        self._delete_old_posts_sql = f"DELETE FROM {posts} WHERE communityname = ? AND seq < ?"
+        self._upsert_delivered_sql = f"INSERT INTO {delivered}(communityname, channelid, highwater, mask) " \
+                                     f"VALUES(?, ?, ?, ?) ON CONFLICT (communityname, channelid) DO UPDATE SET " \
+                                     f"highwater = excluded.highwater, mask = excluded.mask"
+        self._delete_delivered_sql = f"DELETE FROM {delivered} WHERE channelid = ? AND communityname = ?"
+        self._fetch_posts_sql = f"SELECT communityname, postslug, seq FROM {posts} ORDER BY seq"
+        self._update_rendered_post_sql = f"UPDATE {posts} SET rendered = ? WHERE communityname = ? AND postslug = ?"
+        self._fetch_post_sql = f"SELECT seq, rendered FROM {posts} WHERE communityname = ? AND postslug = ?"
+        self._fetch_delivered_sql = f"SELECT communityname, channelid, highwater, mask FROM {delivered}"
+
+        self._insert_translation_sql = f"INSERT OR IGNORE INTO {translations}(key, translated) VALUES(?, ?)"
+        self._fetch_translation_sql = f"SELECT translated FROM {translations} WHERE key = ?"
+
+        self._enqueue_job_sql = f"INSERT OR IGNORE INTO {queue}(clubslug, postslug, communityname, channelid, " \
+                                f"worker, rank, availableat, createdat) VALUES(?, ?, ?, ?, ?, ?, ?, ?)"
+        self._fetch_available_jobs_sql = f"SELECT id, clubslug, postslug, communityname, channelid, attempts FROM " \
+                                         f"{queue} WHERE worker = ? AND availableat <= ? ORDER BY rank, id LIMIT ?"
+        self._fetch_available_channel_jobs_sql = f"SELECT id, clubslug, postslug, communityname, channelid, " \
+                                                 f"attempts FROM {queue} WHERE communityname = ? AND channelid = ? " \
+                                                 f"AND worker = ? AND availableat <= ?"
+        self._lease_job_sql = f"UPDATE {queue} SET availableat = ? WHERE id = ?"
+        self._complete_job_sql = f"DELETE FROM {queue} WHERE id = ?"
+        self._retry_job_sql = f"UPDATE {queue} SET attempts = attempts + 1, availableat = ? WHERE id = ?"
+        self._release_job_sql = f"UPDATE {queue} SET availableat = ? WHERE id = ?"
+        self._fetch_queue_stats_sql = f"SELECT count(*), ? - min(createdat) FROM {queue}"
+
+        self._upsert_webhook_sql = f"INSERT INTO {webhooks}(channelid, webhookid, token) VALUES(?, ?, ?) " \
+                                   f"ON CONFLICT (channelid) DO UPDATE SET webhookid = excluded.webhookid, " \
+                                   f"token = excluded.token"
+        self._delete_webhook_sql = f"DELETE FROM {webhooks} WHERE channelid = ?"
+        self._fetch_webhooks_sql = f"SELECT channelid, webhookid, token FROM {webhooks}"
+
+        # Each migration is run once, in order, and the amount that ran is stored in PRAGMA user_version.
+        # Only ever append to this list.
+        self._migrations = [
+            f"""
+            CREATE TABLE IF NOT EXISTS {channels}
+            (
+                id INTEGER PRIMARY KEY,
+                channelid INTEGER,
+                communityname TEXT,
+                roleid INTEGER,
+                UNIQUE (channelid, communityname)
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS {posts}
+            (
+                communityname TEXT,
+                postslug TEXT,
+                seq INTEGER,
+                PRIMARY KEY (communityname, postslug)
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS {delivered}
+            (
+                communityname TEXT,
+                channelid INTEGER,
+                highwater INTEGER,
+                mask INTEGER,
+                PRIMARY KEY (communityname, channelid)
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS {translations}
+            (
+                key TEXT PRIMARY KEY,
+                translated TEXT
+            )
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS {queue}
+            (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                clubslug TEXT,
+                postslug TEXT,
+                communityname TEXT,
+                channelid INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                availableat REAL NOT NULL,
+                createdat REAL NOT NULL,
+                UNIQUE (postslug, communityname, channelid)
+            )
+            """,
+            f"CREATE INDEX IF NOT EXISTS {queue}_availableat ON {queue} (availableat)",
+            f"ALTER TABLE {queue} ADD COLUMN worker INTEGER NOT NULL DEFAULT 0",
+            f"CREATE INDEX IF NOT EXISTS {queue}_worker_availableat ON {queue} (worker, availableat)",
+            f"ALTER TABLE {posts} ADD COLUMN rendered TEXT",
+            f"ALTER TABLE {queue} ADD COLUMN rank INTEGER NOT NULL DEFAULT 0",
+            f"CREATE INDEX IF NOT EXISTS {queue}_worker_rank ON {queue} (worker, rank, id)",
+            f"""
+            CREATE TABLE IF NOT EXISTS {webhooks}
+            (
+                channelid INTEGER PRIMARY KEY,
+                webhookid INTEGER,
+                token TEXT
+            )
+            """,
+            f"ALTER TABLE {channels} ADD COLUMN digest INTEGER NOT NULL DEFAULT 0",
+            f"CREATE INDEX IF NOT EXISTS {queue}_channelid_communityname ON {queue} (channelid, communityname)",
+        ]
+
+        loop = get_event_loop()
+        loop.create_task(self.create_db_and_connect())
+
+    async def create_db_and_connect(self):
+        await self.connect()
+        await self.migrate()
+
+    async def _run(self, function, *args):
+        """Run a function with the connection on the DataBase thread."""
+        return await get_event_loop().run_in_executor(self._executor, function, self.pool, *args)
+
+    async def _execute(self, sql, *args):
+        def execute(conn):
+            with conn:
+                conn.execute(sql, args)
+        await self._run(execute)
+
+    async def _executemany(self, *statements):
+        """Run many (sql, records) statements inside one transaction."""
+        def executemany(conn):
+            with conn:
+                for sql, records in statements:
+                    conn.executemany(sql, records)
+        await self._run(executemany)
+
+    async def _fetch(self, sql, *args):
+        return await self._run(lambda conn: conn.execute(sql, args).fetchall())
+
+    async def _fetchval(self, sql, *args):
+        def fetchval(conn):
+            row = conn.execute(sql, args).fetchone()
+            return row[0] if row else None
+        return await self._run(fetchval)
+
+    async def connect(self):
+        def connect():
+            conn = sqlite3.connect(self.location, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
+        self.pool = await get_event_loop().run_in_executor(self._executor, connect)
+        log.info("Successful Connection to DataBase.", extra={"location": self.location})
+        return self.pool
+
+    async def close(self):
+        if self.pool:
+            await self._run(lambda conn: conn.close())
+            self.pool = None
+        self._executor.shutdown(wait=False)
+
+    @timed
+    async def migrate(self):
+        def migrate(conn):
+            with conn:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for migration in self._migrations[version:]:
+                    conn.execute(migration)
+                conn.execute(f"PRAGMA user_version = {len(self._migrations)}")
+            return version
+
+        version = await self._run(migrate)
+        if version != len(self._migrations):
+            log.info("Migrated DataBase.", extra={"from_version": version, "to_version": len(self._migrations)})
+        self.ready = True
+
+    @timed
+    async def bulk_insert_channels(self, channels):
+        await self._executemany((self._upsert_channel_sql, [(channel_id, community_name.lower(), role_id)
+                                                            for channel_id, community_name, role_id in channels]))
+
+    @timed
+    async def bulk_delete_channels(self, channels):
+        records = [(channel_id, community_name.lower()) for channel_id, community_name in channels]
+        await self._executemany((self._delete_channel_sql, records), (self._delete_delivered_sql, records))
+
+    @timed
+    async def bulk_update_roles(self, roles):
+        await self._executemany((self._update_role_sql, [(role_id, channel_id, community_name.lower())
+                                                         for channel_id, community_name, role_id in roles]))
+
+    @timed
+    async def insert_ucube_channel(self, channel_id, community_name):
+        await self._execute(self._insert_channel_sql, channel_id, community_name.lower(), None)
+
+    @timed
+    async def delete_ucube_channel(self, channel_id, community_name):
+        records = [(channel_id, community_name.lower())]
+        await self._executemany((self._delete_channel_sql, records), (self._delete_delivered_sql, records))
+
+    @timed
+    async def update_role(self, channel_id, community_name, role_id):
+        await self._execute(self._update_role_sql, role_id, channel_id, community_name.lower())
+
+    @timed
+    async def update_digest(self, channel_id, community_name, digest):
+        await self._execute(self._update_digest_sql, digest, channel_id, community_name.lower())
+
+    @timed
+    async def fetch_channels(self):
+        return await self._fetch(self._fetch_all_sql)
+
+    async def iter_channels(self):
+        cursor = await self._run(lambda conn: conn.execute(self._fetch_all_sql))
+        while True:
+            records = await get_event_loop().run_in_executor(self._executor, cursor.fetchmany, 1000)
+            if not records:
+                break
+            for record in records:
+                yield record
+
+    @timed
+    async def insert_post(self, community_name, post_slug, seq):
+        await self._execute(self._insert_post_sql, community_name.lower(), post_slug, seq)
+
+    @timed
+    async def delete_old_posts(self, community_name, min_seq):
+        await self._execute(self._delete_old_posts_sql, community_name.lower(), min_seq)
+
+    @timed
+    async def update_delivered(self, community_name, delivered):
+        if not delivered:
+            return
+        community_name = community_name.lower()
+        await self._executemany((self._upsert_delivered_sql, [(community_name, channel_id, high_water, mask)
+                                                              for channel_id, high_water, mask in delivered]))
+
+    @timed
+    async def update_rendered_post(self, community_name, post_slug, rendered):
+        await self._execute(self._update_rendered_post_sql, rendered, community_name.lower(), post_slug)
+
+    @timed
+    async def fetch_post(self, community_name, post_slug):
+        rows = await self._fetch(self._fetch_post_sql, community_name.lower(), post_slug)
+        return rows[0] if rows else None
+
+    @timed
+    async def fetch_posts(self):
+        return await self._fetch(self._fetch_posts_sql)
+
+    @timed
+    async def fetch_delivered(self):
+        return await self._fetch(self._fetch_delivered_sql)
+
+    @timed
+    async def insert_translation(self, key, translated):
+        await self._execute(self._insert_translation_sql, key, translated)
+
+    @timed
+    async def fetch_translation(self, key):
+        return await self._fetchval(self._fetch_translation_sql, key)
+
+    @timed
+    async def insert_webhook(self, channel_id, webhook_id, token):
+        await self._execute(self._upsert_webhook_sql, channel_id, webhook_id, token)
+
+    @timed
+    async def delete_webhook(self, channel_id):
+        await self._execute(self._delete_webhook_sql, channel_id)
+
+    @timed
+    async def fetch_webhooks(self):
+        return await self._fetch(self._fetch_webhooks_sql)
+
+    @timed
+    async def enqueue_jobs(self, jobs, worker=0, delay=0):
+        now = time()
+        await self._executemany((self._enqueue_job_sql, [(club_slug, post_slug, community_name.lower(), channel_id,
+                                                          worker, rank, now + delay, now)
+                                                         for club_slug, post_slug, community_name, channel_id, rank
+                                                         in jobs]))
+
+    @timed
+    async def claim_jobs(self, limit, lease, worker=0):
+        def claim_jobs(conn):
+            now = time()
+            with conn:
+                jobs = conn.execute(self._fetch_available_jobs_sql, (worker, now, limit)).fetchall()
+                conn.executemany(self._lease_job_sql, [(now + lease, job["id"]) for job in jobs])
+            return jobs
+        return await self._run(claim_jobs)
+
+    @timed
+    async def claim_channel_jobs(self, community_name, channel_id, lease, worker=0):
+        def claim_channel_jobs(conn):
+            now = time()
+            with conn:
+                jobs = conn.execute(self._fetch_available_channel_jobs_sql,
+                                    (community_name.lower(), channel_id, worker, now)).fetchall()
+                conn.executemany(self._lease_job_sql, [(now + lease, job["id"]) for job in jobs])
+            return jobs
+        return await self._run(claim_channel_jobs)
+
+    @timed
+    async def complete_job(self, job_id):
+        await self._execute(self._complete_job_sql, job_id)
+
+    @timed
+    async def retry_job(self, job_id, delay):
+        await self._execute(self._retry_job_sql, time() + delay, job_id)
+
+    @timed
+    async def release_jobs(self, job_ids):
+        now = time()
+        await self._executemany((self._release_job_sql, [(now, job_id) for job_id in job_ids]))
+
+    @timed
+    async def fetch_queue_stats(self):
+        rows = await self._fetch(self._fetch_queue_stats_sql, time())
+        depth, oldest_age = rows[0]
+        return depth, oldest_age
@@ -0,0 +1,192 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from . import TextChannel
+
+NO_ROLE = 0  # discord snowflakes are never 0.
+
+
+class _Community:
+    __slots__ = ("channel_ids", "role_ids", "digests", "sorted")
+
+    def __init__(self):
+        """The channels following one community as parallel arrays sorted by channel id."""
+        self.channel_ids = array("q")
+        self.role_ids = array("q")
+        self.digests: Set[int] = set()  # channel ids that receive digests (few channels opt in)
+        self.sorted = True
+
+
+class SubscriptionStore:
+    def __init__(self):
+        """
+        Every (community, channel) subscription in a compact form.
+
+        Community names are interned to a small id. A community keeps its channel ids and role ids in two
+        sorted ``array("q")`` (16 bytes per subscription) instead of a dict of objects, and every channel keeps
+        the communities it follows as a bitmask of community ids instead of a set of names.
+        models.TextChannel is only created as a view when a single subscription is looked up.
+        """
+        self._community_ids: Dict[str, int] = {}  # lowercase community name : community id
+        self._community_names: List[str] = []  # community id : lowercase community name
+        self._communities: List[_Community] = []  # community id : subscriptions
+        self._followed: Dict[int, int] = {}  # channel id : bitmask of followed community ids
+
+    def _intern(self, community_name) -> int:
+        """Get (or create) the id of a community."""
+        community_name = community_name.lower()
+        community_id = self._community_ids.get(community_name)
+        if community_id is None:
+            community_id = self._community_ids[community_name] = len(self._community_names)
+            self._community_names.append(community_name)
+            self._communities.append(_Community())
+        return community_id
+
+    def _get_community(self, community_name) -> Optional[_Community]:
+        community_id = self._community_ids.get(community_name.lower())
+        if community_id is None:
+            return None
+        community = self._communities[community_id]
+        if not community.sorted:
+            self._sort(community)
+        return community
+
+    @staticmethod
+    def _sort(community: _Community):
+        # a channel loaded and added at the same time keeps its last role.
+        pairs = sorted(dict(zip(community.channel_ids, community.role_ids)).items())
+        community.channel_ids = array("q", (channel_id for channel_id, _ in pairs))
+        community.role_ids = array("q", (role_id for _, role_id in pairs))
+        community.sorted = True
+
+    def sort(self):
+        """Sort every community that was loaded, instead of on its first lookup."""
+        for community in self._communities:
+            if not community.sorted:
+                self._sort(community)
+
+    @staticmethod
+    def _find(community: _Community, channel_id) -> int:
+        """Get the index of a channel in a sorted community or -1."""
+        index = bisect_left(community.channel_ids, channel_id)
+        if index < len(community.channel_ids) and community.channel_ids[index] == channel_id:
+            return index
+        return -1
+
+    def load(self, community_name, channel_id, role_id, digest=False):
+        """Add a subscription that is known to be new (from the DataBase) without keeping the community sorted.
+
+        The community is sorted once on the next lookup (or ``sort``), so loading every subscription is not
+        quadratic.
+        """
+        community_id = self._intern(community_name)
+        community = self._communities[community_id]
+        community.channel_ids.append(channel_id)
+        community.role_ids.append(role_id or NO_ROLE)
+        if digest:
+            community.digests.add(channel_id)
+        community.sorted = False
+        self._followed[channel_id] = self._followed.get(channel_id, 0) | 1 << community_id
+
+    def add(self, community_name, channel_id, role_id=None):
+        """Add a subscription or replace its role."""
+        community_id = self._intern(community_name)
+        community = self._get_community(community_name)
+        index = bisect_left(community.channel_ids, channel_id)
+        if index < len(community.channel_ids) and community.channel_ids[index] == channel_id:
+            community.role_ids[index] = role_id or NO_ROLE
+        else:
+            community.channel_ids.insert(index, channel_id)
+            community.role_ids.insert(index, role_id or NO_ROLE)
+        self._followed[channel_id] = self._followed.get(channel_id, 0) | 1 << community_id
+
+    def remove(self, community_name, channel_id) -> bool:
+        """Remove a subscription.
+
+        :returns: Whether the channel was following the community.
+        """
+        community = self._get_community(community_name)
+        index = self._find(community, channel_id) if community else -1
+        if index == -1:
+            return False
+
+        del community.channel_ids[index]
+        del community.role_ids[index]
+        community.digests.discard(channel_id)
+        followed = self._followed.get(channel_id, 0) & ~(1 << self._community_ids[community_name.lower()])
+        if followed:
+            self._followed[channel_id] = followed
+        else:
+            self._followed.pop(channel_id, None)
+        return True
+
+    def get(self, community_name, channel_id) -> Optional[TextChannel]:
+        """Get a subscription as a models.TextChannel view (None if the channel is not following)."""
+        community = self._get_community(community_name)
+        index = self._find(community, channel_id) if community else -1
+        if index == -1:
+            return None
+        role_id = community.role_ids[index]
+        return TextChannel(channel_id, role_id if role_id != NO_ROLE else None, self, community_name.lower(),
+                           digest=channel_id in community.digests)
+
+    def set_role(self, community_name, channel_id, role_id):
+        """Change the role mentioned in a channel (nothing happens if the channel is not following)."""
+        community = self._get_community(community_name)
+        index = self._find(community, channel_id) if community else -1
+        if index != -1:
+            community.role_ids[index] = role_id or NO_ROLE
+
+    def set_digest(self, community_name, channel_id, digest):
+        """Change whether a channel receives digests (nothing happens if the channel is not following)."""
+        community = self._get_community(community_name)
+        if not community or self._find(community, channel_id) == -1:
+            return
+        if digest:
+            community.digests.add(channel_id)
+        else:
+            community.digests.discard(channel_id)
+
+    def is_digest(self, community_name, channel_id) -> bool:
+        """Whether a channel receives the posts of a community as a digest."""
+        community_id = self._community_ids.get(community_name.lower())
+        return community_id is not None and channel_id in self._communities[community_id].digests
+
+    def is_following(self, community_name, channel_id) -> bool:
+        community_id = self._community_ids.get(community_name.lower())
+        return community_id is not None and bool(self._followed.get(channel_id, 0) >> community_id & 1)
+
+    def count(self, community_name) -> int:
+        """The amount of channels following a community."""
+        community_id = self._community_ids.get(community_name.lower())
+        return 0 if community_id is None else len(self._communities[community_id].channel_ids)
+
+    def iter_community(self, community_name) -> Iterator[Tuple[int, int]]:
+        """Iterate over a snapshot of the (channel id, role id) following a community in channel id order.
+
+        The role id is 0 (``NO_ROLE``) if the channel does not mention a role.
+        """
+        community = self._get_community(community_name)
+        if not community:
+            return iter(())
+        return zip(community.channel_ids[:], community.role_ids[:])
+
+    def get_digests(self, community_name) -> Set[int]:
+        """A snapshot of the channel ids that receive the posts of a community as a digest."""
+        community_id = self._community_ids.get(community_name.lower())
+        return set() if community_id is None else self._communities[community_id].digests.copy()
+
+    def get_community_names(self, channel_id) -> List[str]:
+        """The lowercase names of the communities a channel follows."""
+        followed = self._followed.get(channel_id, 0)
+        return [community_name for community_id, community_name in enumerate(self._community_names)
+                if followed >> community_id & 1]
+
+    def iter_channels(self) -> Iterator[Tuple[int, List[str]]]:
+        """Iterate over a snapshot of every channel and the communities it follows."""
+        for channel_id in list(self._followed):
+            yield channel_id, self.get_community_names(channel_id)
+
+    def __len__(self):
+        """The amount of channels following at least one community."""
+        return len(self._followed)
@@ -1,12 +1,41 @@
 class TextChannel:
-    def __init__(self, channel_id, role_id):
+    __slots__ = ("id", "_role_id", "_digest", "_subscriptions", "_community_name")
+
+    def __init__(self, channel_id, role_id, subscriptions=None, community_name=None, digest=False):
         """
         Represents a discord Text Channel and the UCube settings. Note that this is UNIQUE TO A UCube COMMUNITY.
         It is not unique to it's text channel id.
 
+        When created by a models.SubscriptionStore it is a view, and changing the role or digest changes the store.
+
         :param channel_id: Text Channel ID
         :param role_id: Role ID
+        :param subscriptions: (SubscriptionStore) The store the subscription belongs to.
+        :param community_name: (str) The community the channel follows.
+        :param digest: (bool) Whether posts are coalesced into a digest.
         """
         self.id = channel_id
-        self.role_id = role_id
-        self.already_posted = []  # list of notification ids.
+        self._role_id = role_id
+        self._digest = digest
+        self._subscriptions = subscriptions
+        self._community_name = community_name
+
+    @property
+    def role_id(self):
+        return self._role_id
+
+    @role_id.setter
+    def role_id(self, role_id):
+        self._role_id = role_id
+        if self._subscriptions:
+            self._subscriptions.set_role(self._community_name, self.id, role_id)
+
+    @property
+    def digest(self):
+        return self._digest
+
+    @digest.setter
+    def digest(self, digest):
+        self._digest = digest
+        if self._subscriptions:
+            self._subscriptions.set_digest(self._community_name, self.id, digest)
@@ -0,0 +1,98 @@
+from typing import Callable, Iterable, List
+from unicodedata import category
+
+# Discord limits
+DESCRIPTION_LIMIT = 4096
+EMBED_TOTAL_LIMIT = 6000  # shared by every embed in a message
+EMBEDS_PER_MESSAGE = 10
+
+ZERO_WIDTH_JOINER = "\u200d"
+
+
+class TextSplitter:
+    def __init__(self, limit=DESCRIPTION_LIMIT):
+        """
+        Splits text into chunks no longer than ``limit`` in linear time.
+
+        A chunk ends at the last paragraph break, then line break, then space inside the limit.
+        If there is none (for example a long Korean sentence without spaces), it is cut at the limit but never
+        inside a grapheme (combining marks, variation selectors and zero width joiner sequences stay together).
+
+        :param limit: (int) The max length of a chunk.
+        """
+        if limit < 2:
+            raise ValueError("The limit must be at least 2.")
+        self.limit = limit
+
+    def split(self, text) -> List[str]:
+        """Split text into chunks.
+
+        :param text: (str) The text to split.
+        :returns: A list of chunks that are all within the limit.
+        """
+        chunks = []
+        start = 0
+        length = len(text)
+        while length - start > self.limit:
+            end = start + self.limit
+            cut = self._find_cut(text, start, end)
+            chunk = text[start:cut].rstrip()
+            if chunk:
+                chunks.append(chunk)
+            start = cut
+            # do not start the next chunk with the whitespace we split on.
+            while start < length and text[start] in "\n ":
+                start += 1
+
+        chunk = text[start:].rstrip()
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _find_cut(self, text, start, end) -> int:
+        """Find where to cut a chunk that can not go past ``end``."""
+        # only accept separators in the second half of the window so chunks do not get too small.
+        minimum = start + self.limit // 2
+        for separator in ("\n\n", "\n", " "):
+            position = text.rfind(separator, minimum, end)
+            if position != -1:
+                return position + len(separator)
+
+        cut = end
+        while cut > minimum and self._inside_grapheme(text, cut):
+            cut -= 1
+        return cut
+
+    @staticmethod
+    def _inside_grapheme(text, position) -> bool:
+        """Whether cutting before ``position`` would split a grapheme."""
+        char = text[position]
+        return category(char) in ("Mn", "Me", "Mc") or char == ZERO_WIDTH_JOINER or \
+            "\ufe00" <= char <= "\ufe0f" or text[position - 1] == ZERO_WIDTH_JOINER
+
+    @staticmethod
+    def pack(items: Iterable, size: Callable = len, max_items=EMBEDS_PER_MESSAGE,
+             max_total=EMBED_TOTAL_LIMIT) -> List[list]:
+        """Greedily group items (embeds) into as few messages as the limits allow, keeping their order.
+
+        :param items: The items to pack.
+        :param size: A function that returns the size of an item.
+        :param max_items: (int) The max amount of items in a group.
+        :param max_total: (int) The max total size of a group.
+        :returns: A list of groups.
+        """
+        groups = []
+        group = []
+        total = 0
+        for item in items:
+            item_size = size(item)
+            if group and (len(group) >= max_items or total + item_size > max_total):
+                groups.append(group)
+                group = []
+                total = 0
+            group.append(item)
+            total += item_size
+
+        if group:
+            groups.append(group)
+        return groups
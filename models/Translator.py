@@ -0,0 +1,169 @@
+import logging
+from asyncio import Future, get_event_loop, gather
+from collections import OrderedDict
+from hashlib import sha256
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.histogram("ucube_translation_request_seconds", "Time of a translation request.")
+
+BATCH_SEPARATOR = "\n\n|||\n\n"
+
+
+class Translator:
+    def __init__(self, web_session, endpoint, headers, conn=None, max_size=1024, batch=False, batch_delay=0.05):
+        """
+        Translates text through the translation endpoint with an in-memory LRU and a DB cache in front of it.
+
+        Concurrent requests for the same text share one call. In batch mode, texts requested within
+        ``batch_delay`` seconds of each other are joined into a single request.
+
+        :param web_session: (aiohttp.ClientSession) The web session to use.
+        :param endpoint: (str) The translation endpoint.
+        :param headers: (dict) Headers for the translation endpoint.
+        :param conn: (AbstractDataBase) The DB connection used as a persistent cache.
+        :param max_size: (int) The amount of translations kept in memory.
+        :param batch: (bool) Whether to group texts into one request.
+        :param batch_delay: (float) Seconds to wait for more texts before sending a batch.
+        """
+        self._web_session = web_session
+        self._endpoint = endpoint
+        self._headers = headers
+        self._conn = conn
+        self.max_size = max_size
+        self.batch = batch
+        self.batch_delay = batch_delay
+
+        self._cache: OrderedDict = OrderedDict()  # key : translated text
+        self._in_flight: Dict[str, Future] = {}  # key : future of the translated text
+        self._pending: Dict[Tuple[str, str], List[Tuple[str, Future]]] = {}  # (src, target) : [(text, future)]
+        self.stats = {"memory_hits": 0, "shared_hits": 0, "db_hits": 0, "misses": 0, "requests": 0}
+
+    @staticmethod
+    def get_key(text, src_lang, target_lang) -> str:
+        """Get the cache key of a text and language pair."""
+        return sha256(f"{src_lang}:{target_lang}:{text}".encode()).hexdigest()
+
+    async def translate(self, text, src_lang="ko", target_lang="en") -> Optional[str]:
+        """Translate text, using the cache when possible."""
+        if not text or not text.strip():
+            return text
+
+        key = self.get_key(text, src_lang, target_lang)
+        translated = self._cache.get(key)
+        if translated is not None:
+            self._cache.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return translated
+
+        in_flight = self._in_flight.get(key)
+        if in_flight:
+            self.stats["shared_hits"] += 1
+            return await in_flight
+
+        future = self._in_flight[key] = get_event_loop().create_future()
+        try:
+            translated = await self._fetch_translation(key)
+            if translated is not None:
+                self.stats["db_hits"] += 1
+            else:
+                self.stats["misses"] += 1
+                if self.batch:
+                    translated = await self._request_batched(text, src_lang, target_lang)
+                else:
+                    translated = await self._request(text, src_lang, target_lang)
+                if translated is not None:
+                    await self._insert_translation(key, translated)
+
+            if translated is not None:
+                self._cache[key] = translated
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+            future.set_result(translated)
+            return translated
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved so it is not logged when nobody else was waiting.
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def _fetch_translation(self, key) -> Optional[str]:
+        """Get a translation from the DB cache."""
+        if not self._conn or not self._conn.is_connected:
+            return
+        try:
+            return await self._conn.fetch_translation(key)
+        except Exception:
+            log.exception("Failed to fetch a translation from the DataBase.")
+
+    async def _insert_translation(self, key, translated):
+        """Add a translation to the DB cache."""
+        if not self._conn or not self._conn.is_connected:
+            return
+        try:
+            await self._conn.insert_translation(key, translated)
+        except Exception:
+            log.exception("Failed to insert a translation into the DataBase.")
+
+    async def _request(self, text, src_lang, target_lang) -> Optional[str]:
+        """Sends a request to the translating endpoint and returns the translated string."""
+        self.stats["requests"] += 1
+        start = perf_counter()
+        try:
+            data = {
+                'text': text,
+                'src_lang': src_lang,
+                'target_lang': target_lang
+            }
+            async with self._web_session.post(self._endpoint, headers=self._headers, data=data) as r:
+                if r.status == 200:
+                    try:
+                        body: dict = await r.json()
+                    except Exception:
+                        log.debug("Translation response was not sent as JSON.")
+                        body = await r.json(content_type="text/html")
+                    if body.get("code") == 0:
+                        return body.get("text")
+                log.warning("Translation request failed.", extra={"status": r.status})
+        except Exception:
+            log.exception("Translation request failed.")
+        finally:
+            REQUEST_SECONDS.observe(perf_counter() - start)
+
+    async def _request_batched(self, text, src_lang, target_lang) -> Optional[str]:
+        """Queue a text to be sent with any other texts requested shortly after it."""
+        loop = get_event_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault((src_lang, target_lang), [])
+        pending.append((text, future))
+        if len(pending) == 1:
+            loop.call_later(self.batch_delay, lambda: loop.create_task(self._send_batch(src_lang, target_lang)))
+        return await future
+
+    async def _send_batch(self, src_lang, target_lang):
+        """Send every queued text of a language pair as one request.
+
+        If the response can not be split back into the same amount of texts, they are sent one at a time.
+        """
+        pending = self._pending.pop((src_lang, target_lang), [])
+        texts = [text for text, _ in pending]
+        try:
+            if len(texts) == 1:
+                results = [await self._request(texts[0], src_lang, target_lang)]
+            else:
+                translated = await self._request(BATCH_SEPARATOR.join(texts), src_lang, target_lang)
+                results = [] if translated is None else \
+                    [result.strip() for result in translated.split(BATCH_SEPARATOR.strip())]
+                if len(results) != len(texts):
+                    results = await gather(*[self._request(text, src_lang, target_lang) for text in texts])
+
+            for (_, future), result in zip(pending, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
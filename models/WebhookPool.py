@@ -0,0 +1,140 @@
+import logging
+from asyncio import Event, Future, get_event_loop
+from time import monotonic
+from typing import Dict, Optional
+import discord
+from aiohttp import ClientSession
+from . import DeliveryScheduler, metrics
+
+log = logging.getLogger(__name__)
+
+WEBHOOKS = metrics.counter("ucube_webhooks_total", "Webhooks of text channels by what happened to them.")
+
+
+class WebhookPool:
+    def __init__(self, conn, session: ClientSession, scheduler: DeliveryScheduler, name="UCube", negative_ttl=3600):
+        """
+        Delivers to text channels through a webhook per channel instead of the bot's own channel.send.
+
+        Webhook requests have their own rate-limits (5 requests every 2 seconds per webhook) that do not count
+        against the bot, so a post can fan out to more channels at once. Every request goes through the shared
+        aiohttp session and ``scheduler``. Webhooks are stored in the DataBase and created on first use when the
+        bot has the Manage Webhooks permission. Channels without that permission (or that hit Discord's webhook
+        limit) are remembered for ``negative_ttl`` seconds and the caller falls back to channel.send.
+
+        :param conn: The DataBase connection.
+        :param session: (ClientSession) The pooled session every webhook request uses.
+        :param scheduler: (DeliveryScheduler) The concurrency and buckets used only for webhooks.
+        :param name: (str) The name of created webhooks.
+        :param negative_ttl: (float) Seconds before creating a webhook in a channel is tried again.
+        """
+        self.conn = conn
+        self.scheduler = scheduler
+        self.name = name
+        self.negative_ttl = negative_ttl
+        self._session = session
+        self._webhooks: Dict[int, discord.Webhook] = {}  # channel id : webhook
+        self._unavailable: Dict[int, float] = {}  # channel id : when to try creating a webhook again
+        self._in_flight: Dict[int, Future] = {}  # channel id : Future of a webhook being created
+        self._loaded = Event()
+
+    def _partial(self, webhook_id, token) -> discord.Webhook:
+        # an adapter is bound to a single webhook, the session is what gets shared.
+        return discord.Webhook.partial(webhook_id, token, adapter=discord.AsyncWebhookAdapter(self._session))
+
+    async def load(self):
+        """Load the webhooks stored in the DataBase. Lookups wait until this is done."""
+        try:
+            for channel_id, webhook_id, token in await self.conn.fetch_webhooks():
+                self._webhooks[channel_id] = self._partial(webhook_id, token)
+            log.info("Loaded webhooks.", extra={"webhooks": len(self._webhooks)})
+        except Exception:
+            log.exception("Failed to load webhooks.")
+        finally:
+            self._loaded.set()
+
+    @staticmethod
+    def can_manage(channel) -> bool:
+        """Check if the bot can create webhooks in a channel."""
+        me = getattr(getattr(channel, "guild", None), "me", None)
+        if not me or not isinstance(channel, discord.TextChannel):
+            return False
+        return channel.permissions_for(me).manage_webhooks
+
+    async def get(self, channel: discord.TextChannel) -> Optional[discord.Webhook]:
+        """Get the webhook of a channel, creating it if there is none yet.
+
+        :param channel: The text channel.
+        :returns: The webhook, or None if the channel can not have one and channel.send should be used.
+        """
+        await self._loaded.wait()
+        webhook = self._webhooks.get(channel.id)
+        if webhook:
+            return webhook
+
+        if self._unavailable.get(channel.id, 0) > monotonic() or not self.can_manage(channel):
+            return None
+
+        in_flight = self._in_flight.get(channel.id)
+        if in_flight:
+            return await in_flight
+
+        future = self._in_flight[channel.id] = get_event_loop().create_future()
+        try:
+            webhook = await self._create(channel)
+            future.set_result(webhook)
+            return webhook
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved so it is not logged when nobody else was waiting.
+            raise
+        finally:
+            self._in_flight.pop(channel.id, None)
+
+    async def _create(self, channel: discord.TextChannel) -> Optional[discord.Webhook]:
+        try:
+            created = await channel.create_webhook(name=self.name, reason="UCube notifications")
+        except discord.HTTPException as e:
+            # no permission after all or the channel already has the max amount of webhooks.
+            WEBHOOKS.inc(result="unavailable")
+            log.warning("Failed to create a webhook, using channel.send instead.", extra={
+                "channel_id": channel.id, "status": e.status, "error": str(e)})
+            self._unavailable[channel.id] = monotonic() + self.negative_ttl
+            return None
+
+        await self.conn.insert_webhook(channel.id, created.id, created.token)
+        WEBHOOKS.inc(result="created")
+        webhook = self._webhooks[channel.id] = self._partial(created.id, created.token)
+        return webhook
+
+    async def invalidate(self, channel_id):
+        """Forget the webhook of a channel (it was deleted or its token was revoked) so the next lookup creates a
+        new one.
+
+        :param channel_id: (int) The channel ID.
+        """
+        if self._webhooks.pop(channel_id, None):
+            WEBHOOKS.inc(result="invalidated")
+            log.info("Webhook is no longer valid.", extra={"channel_id": channel_id})
+        await self.conn.delete_webhook(channel_id)
+
+    async def remove(self, channel_id):
+        """Delete the webhook of a channel that no longer follows anything.
+
+        Deleting it on Discord is best-effort, it is forgotten either way.
+
+        :param channel_id: (int) The channel ID.
+        """
+        self._unavailable.pop(channel_id, None)
+        webhook = self._webhooks.pop(channel_id, None)
+        if not webhook:
+            return
+        await self.conn.delete_webhook(channel_id)
+        WEBHOOKS.inc(result="removed")
+        try:
+            await webhook.delete(reason="The channel no longer follows a UCube club.")
+        except discord.HTTPException as e:
+            log.info("Failed to delete webhook.", extra={"channel_id": channel_id, "error": str(e)})
+
+    def __len__(self):
+        return len(self._webhooks)
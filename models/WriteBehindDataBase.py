@@ -0,0 +1,207 @@
+import logging
+from asyncio import Lock, get_event_loop, sleep
+from typing import Dict, Optional, Tuple
+from . import AbstractDataBase, metrics
+
+log = logging.getLogger(__name__)
+
+PENDING_WRITES = metrics.gauge("ucube_db_pending_writes", "Channel changes waiting to be written to the DataBase.")
+
+# the state of a pending channel change.
+DELETE = "delete"
+INSERT = "insert"
+REPLACE = "replace"  # delete the old row and insert a new one.
+ROLE = "role"
+
+
+class WriteBehindDataBase(AbstractDataBase):
+    def __init__(self, conn: AbstractDataBase, flush_interval=1.0):
+        """
+        Buffers channel changes (follows, unfollows and roles) of any DataBase and writes them in batches.
+
+        The UCube cog already applies every change to its cache, so the commands no longer wait on the DataBase.
+        Changes to the same channel are coalesced into their final state and written with one ``executemany``
+        per kind every ``flush_interval`` seconds, before channels are read and on close.
+        Every other method goes straight to the wrapped DataBase.
+
+        :param conn: (AbstractDataBase) The DataBase to write to.
+        :param flush_interval: (float) Seconds between flushes.
+        """
+        # the wrapped DataBase holds the connection and SQL, so the base class is not initialized.
+        self._conn = conn
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[int, str], Tuple[str, Optional[int]]] = {}  # (channel id, community) : change
+        self._flush_lock = Lock()
+        self._closed = False
+        get_event_loop().create_task(self._flush_loop())
+
+    @property
+    def is_connected(self) -> bool:
+        return self._conn.is_connected
+
+    @property
+    def ready(self):
+        return self._conn.ready
+
+    def _change(self, channel_id, community_name, action, role_id=None):
+        """Coalesce a change with the change already pending for the channel."""
+        key = (channel_id, community_name.lower())
+        pending = self._pending.get(key)
+        state = pending[0] if pending else None
+
+        if action == DELETE:
+            change = (DELETE, None)
+        elif action == INSERT:
+            if state == DELETE:
+                change = (REPLACE, None)
+            elif state is None:
+                change = (INSERT, None)
+            else:
+                return  # the channel is already following.
+        elif state == DELETE:
+            return  # there is no row to update.
+        else:
+            change = (state or ROLE, role_id)
+
+        self._pending[key] = change
+        PENDING_WRITES.set(len(self._pending))
+
+    async def flush(self):
+        """Write every pending change to the DataBase.
+
+        A change is only removed once it was written, so a failed flush is retried with the next one.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            pending = self._pending.copy()
+
+            deletes = [key for key, (state, _) in pending.items() if state in (DELETE, REPLACE)]
+            inserts = [(*key, role_id) for key, (state, role_id) in pending.items() if state in (INSERT, REPLACE)]
+            roles = [(*key, role_id) for key, (state, role_id) in pending.items() if state == ROLE]
+            if deletes:
+                await self._conn.bulk_delete_channels(deletes)
+            if inserts:
+                await self._conn.bulk_insert_channels(inserts)
+            if roles:
+                await self._conn.bulk_update_roles(roles)
+
+            for key, change in pending.items():
+                # changes made during the flush are written with the next one.
+                if self._pending.get(key) is change:
+                    self._pending.pop(key)
+            PENDING_WRITES.set(len(self._pending))
+
+    async def _flush_loop(self):
+        """Flush on an interval until closed."""
+        while not self._closed:
+            await sleep(self.flush_interval)
+            if not self._conn.ready:
+                continue
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Failed to flush channel changes.", extra={"pending": len(self._pending)})
+
+    async def connect(self):
+        return await self._conn.connect()
+
+    async def migrate(self):
+        await self._conn.migrate()
+
+    async def close(self):
+        self._closed = True
+        await self.flush()
+        await self._conn.close()
+
+    async def bulk_insert_channels(self, channels):
+        await self.flush()
+        await self._conn.bulk_insert_channels(channels)
+
+    async def bulk_delete_channels(self, channels):
+        for channel_id, community_name in channels:
+            self._change(channel_id, community_name, DELETE)
+
+    async def bulk_update_roles(self, roles):
+        for channel_id, community_name, role_id in roles:
+            self._change(channel_id, community_name, ROLE, role_id)
+
+    async def insert_ucube_channel(self, channel_id, community_name):
+        self._change(channel_id, community_name, INSERT)
+
+    async def delete_ucube_channel(self, channel_id, community_name):
+        self._change(channel_id, community_name, DELETE)
+
+    async def update_role(self, channel_id, community_name, role_id):
+        self._change(channel_id, community_name, ROLE, role_id)
+
+    async def update_digest(self, channel_id, community_name, digest):
+        # a follow that is still pending would have no row to update.
+        await self.flush()
+        await self._conn.update_digest(channel_id, community_name, digest)
+
+    async def fetch_channels(self):
+        await self.flush()
+        return await self._conn.fetch_channels()
+
+    async def iter_channels(self):
+        await self.flush()
+        async for record in self._conn.iter_channels():
+            yield record
+
+    async def insert_post(self, community_name, post_slug, seq):
+        await self._conn.insert_post(community_name, post_slug, seq)
+
+    async def delete_old_posts(self, community_name, min_seq):
+        await self._conn.delete_old_posts(community_name, min_seq)
+
+    async def update_rendered_post(self, community_name, post_slug, rendered):
+        await self._conn.update_rendered_post(community_name, post_slug, rendered)
+
+    async def fetch_post(self, community_name, post_slug):
+        return await self._conn.fetch_post(community_name, post_slug)
+
+    async def update_delivered(self, community_name, delivered):
+        await self._conn.update_delivered(community_name, delivered)
+
+    async def fetch_posts(self):
+        return await self._conn.fetch_posts()
+
+    async def fetch_delivered(self):
+        return await self._conn.fetch_delivered()
+
+    async def insert_translation(self, key, translated):
+        await self._conn.insert_translation(key, translated)
+
+    async def fetch_translation(self, key):
+        return await self._conn.fetch_translation(key)
+
+    async def insert_webhook(self, channel_id, webhook_id, token):
+        await self._conn.insert_webhook(channel_id, webhook_id, token)
+
+    async def delete_webhook(self, channel_id):
+        await self._conn.delete_webhook(channel_id)
+
+    async def fetch_webhooks(self):
+        return await self._conn.fetch_webhooks()
+
+    async def enqueue_jobs(self, jobs, worker=0, delay=0):
+        await self._conn.enqueue_jobs(jobs, worker, delay)
+
+    async def claim_jobs(self, limit, lease, worker=0):
+        return await self._conn.claim_jobs(limit, lease, worker)
+
+    async def claim_channel_jobs(self, community_name, channel_id, lease, worker=0):
+        return await self._conn.claim_channel_jobs(community_name, channel_id, lease, worker)
+
+    async def complete_job(self, job_id):
+        await self._conn.complete_job(job_id)
+
+    async def retry_job(self, job_id, delay):
+        await self._conn.retry_job(job_id, delay)
+
+    async def release_jobs(self, job_ids):
+        await self._conn.release_jobs(job_ids)
+
+    async def fetch_queue_stats(self):
+        return await self._conn.fetch_queue_stats()
@@ -1,3 +1,29 @@
+from .Metrics import MetricsRegistry, metrics
+from .JsonFormatter import JsonFormatter
+from .Lifecycle import Lifecycle, STOP_INTAKE, DRAIN, CHECKPOINT, CLOSE
 from .AbstractDataBase import AbstractDataBase
 from .PostgreSQL import PostgreSQL
+from .MemoryDataBase import MemoryDataBase
+from .SQLite import SQLite
+from .WriteBehindDataBase import WriteBehindDataBase
 from .TextChannel import TextChannel
+from .SubscriptionStore import SubscriptionStore
+from .RateLimitBucket import RateLimitBucket
+from .DeliveryScheduler import DeliveryScheduler
+from .DeliveryPlanner import DeliveryPlanner
+from .DedupIndex import DedupIndex
+from .MediaCache import MediaCache
+from .MediaTranscoder import MediaTranscoder
+from .Translator import Translator
+from .TextSplitter import TextSplitter
+from .RenderedPost import RenderedPost
+from .ClubRegistry import ClubRegistry
+from .ClubSnapshot import ClubSnapshot
+from .NotificationQueue import NotificationQueue
+from .ClusterServer import ClusterServer
+from .ClusterClient import ClusterClient
+from .ChannelResolver import ChannelResolver
+from .MediaRelay import MediaRelay
+from .PublishQueue import PublishQueue
+from .WebhookPool import WebhookPool
+from .PollScheduler import PollScheduler
@@ -1,23 +1,70 @@
+import logging
+from asyncio import all_tasks, gather
+from signal import SIGINT, SIGTERM
 from typing import Optional
 import discord
 from dbl import DBLClient
 from dotenv import load_dotenv
 from discord.ext.commands import AutoShardedBot, errors
+from multiprocessing import get_context
 from os import getenv
-from models import PostgreSQL, AbstractDataBase
+from models import PostgreSQL, SQLite, MemoryDataBase, WriteBehindDataBase, AbstractDataBase, JsonFormatter, \
+    Lifecycle, metrics
 
 load_dotenv()  # reloads .env to memory
 
+log = logging.getLogger(__name__)
+
 
 class UCubeBot(AutoShardedBot):
     def __init__(self, command_prefix, **options):
         super().__init__(command_prefix, **options.get("options"))
 
-        self.conn: AbstractDataBase = PostgreSQL(**options.get("db_kwargs"))  # db connection
+        # the process in a cluster (worker 0 is the leader). A bot that is not clustered is a single worker.
+        cluster = options.get("cluster") or {}
+        self.worker_id: int = cluster.get("worker_id", 0)
+        self.workers: int = cluster.get("workers", 1)
+
+        self.conn: AbstractDataBase = self.create_db_connection(options.get("db_kwargs"))  # db connection
+
+        # cogs register what to stop, drain, checkpoint and close when the bot shuts down.
+        self.lifecycle = Lifecycle(deadline=float(getenv("SHUTDOWN_DEADLINE") or 30))
+        self.lifecycle.on_shutdown(metrics.stop_server)
 
-        top_gg_key = getenv("TOP_GG_KEY")
+        # only the leader posts to top.gg so the workers do not overwrite each other.
+        top_gg_key = getenv("TOP_GG_KEY") if self.worker_id == 0 else None
         self.top_gg_client: Optional[DBLClient] = None if not top_gg_key else DBLClient(self, top_gg_key, autopost=True)
 
+        self.loop.create_task(metrics.monitor_loop_lag())
+        metrics_port = getenv("METRICS_PORT")
+        if metrics_port:
+            # every worker of a cluster serves its metrics on the next port.
+            self.loop.create_task(metrics.start_server(getenv("METRICS_HOST") or "127.0.0.1",
+                                                       int(metrics_port) + self.worker_id))
+
+    @staticmethod
+    def create_db_connection(db_kwargs) -> AbstractDataBase:
+        """Create the DataBase chosen with DB_BACKEND (postgres, sqlite or memory)."""
+        backend = (getenv("DB_BACKEND") or "postgres").lower()
+        if backend == "sqlite":
+            conn = SQLite(getenv("SQLITE_LOCATION") or "ucubebot.sqlite3")
+        elif backend == "memory":
+            log.warning("DB_BACKEND=memory keeps nothing across restarts, use it for testing only.")
+            conn = MemoryDataBase()
+        else:
+            conn = PostgreSQL(**db_kwargs)
+
+        write_behind = getenv("DB_WRITE_BEHIND")
+        if write_behind:
+            conn = WriteBehindDataBase(conn, flush_interval=float(write_behind))
+        return conn
+
+    async def close(self):
+        # deliveries still need the discord connection, so they are finished before it is closed.
+        await self.lifecycle.shutdown()
+        await super().close()
+        await self.conn.close()
+
     async def on_command_error(self, context, exception):
         if isinstance(exception, errors.CommandNotFound):
             ...
@@ -26,6 +73,7 @@ class UCubeBot(AutoShardedBot):
                 if exception.original.status == 403:
                     return
             except AttributeError:
+                log.error("Command failed.", exc_info=exception.original, extra={"command": str(context.command)})
                 return
             return await context.send(f"{exception}")
         elif isinstance(exception, errors.BadArgument):
@@ -34,7 +82,18 @@ class UCubeBot(AutoShardedBot):
             ...
 
 
-if __name__ == '__main__':
+def start_bot(worker_id=0, workers=1, shard_ids=None, shard_count=None):
+    """Run the bot (or one worker of a cluster) until it is closed.
+
+    :param worker_id: (int) The ID of the worker in the cluster.
+    :param workers: (int) The amount of workers in the cluster.
+    :param shard_ids: (List[int]) The shards this worker connects. All of them if not given.
+    :param shard_count: (int) The total amount of shards.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logging.basicConfig(level=getenv("LOG_LEVEL") or "INFO", handlers=[handler])
+
     intents = discord.Intents.default()
     # intents.members = True  # turn on privileged members intent
     # intents.presences = True  # turn on presences intent
@@ -43,7 +102,13 @@ if __name__ == '__main__':
         "options": {
             "case_insensitive": True,
             "owner_id": int(getenv("BOT_OWNER_ID")),
-            "intents": intents
+            "intents": intents,
+            "shard_ids": shard_ids,
+            "shard_count": shard_count
+        },
+        "cluster": {
+            "worker_id": worker_id,
+            "workers": workers
         },
         "db_kwargs": {
             "host": getenv("POSTGRES_HOST"),
@@ -61,4 +126,47 @@ if __name__ == '__main__':
     for cog in cogs:
         bot.load_extension(f"cogs.{cog}")
 
-    bot.run(getenv("BOT_TOKEN"))
+    # unlike bot.run, a signal closes the bot gracefully instead of cancelling every delivery at once.
+    loop = bot.loop
+    closing = []  # the task closing the bot after the first signal
+
+    def on_signal():
+        if not closing:
+            closing.append(loop.create_task(bot.close()))
+
+    for signal in (SIGINT, SIGTERM):
+        try:
+            loop.add_signal_handler(signal, on_signal)
+        except NotImplementedError:
+            pass  # Windows
+
+    try:
+        loop.run_until_complete(bot.start(getenv("BOT_TOKEN")))
+    finally:
+        loop.run_until_complete(closing[0] if closing else bot.close())
+        tasks = [task for task in all_tasks(loop) if not task.done()]
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(gather(*tasks, return_exceptions=True))
+        loop.close()
+
+
+if __name__ == '__main__':
+    cluster_workers = int(getenv("CLUSTER_WORKERS") or 1)
+    if cluster_workers <= 1:
+        start_bot()
+    else:
+        # split the shards into ranges and run every range in its own process.
+        total_shards = int(getenv("SHARD_COUNT") or cluster_workers)
+        processes = []
+        for cluster_worker_id in range(cluster_workers):
+            worker_shard_ids = [shard_id for shard_id in range(total_shards)
+                                if shard_id * cluster_workers // total_shards == cluster_worker_id]
+            process = get_context("spawn").Process(target=start_bot, name=f"ucubebot-{cluster_worker_id}",
+                                                   args=(cluster_worker_id, cluster_workers, worker_shard_ids,
+                                                         total_shards))
+            process.start()
+            processes.append(process)
+
+        for process in processes:
+            process.join()
@@ -0,0 +1,76 @@
+from random import Random
+import pytest
+from models import TextSplitter
+
+WORDS = ["a", "UCube", "안녕하세요", "é", "👩‍👩‍👧", "✌️", "x" * 50, "가" * 120]
+SEPARATORS = [" ", " ", " ", "\n", "\n\n", "\t", "   "]
+
+
+def random_text(rng: Random, words):
+    return "".join(rng.choice(WORDS) + rng.choice(SEPARATORS) for _ in range(words))
+
+
+def assert_rejoins(text, chunks):
+    """Every chunk is the next part of the text, with only the whitespace it was split on between them."""
+    position = 0
+    for chunk in chunks:
+        index = text.find(chunk, position)
+        assert index != -1, chunk
+        assert not text[position:index].strip()
+        position = index + len(chunk)
+    assert not text[position:].strip()
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_split_rejoins_within_limit(seed):
+    rng = Random(seed)
+    limit = rng.choice([2, 3, 10, 64, 100, 4096])
+    text = random_text(rng, rng.randint(0, 300))
+
+    chunks = TextSplitter(limit).split(text)
+
+    assert all(0 < len(chunk) <= limit for chunk in chunks)
+    assert_rejoins(text, chunks)
+
+
+@pytest.mark.parametrize("limit", [2, 7, 100])
+def test_split_words_longer_than_limit(limit):
+    text = "가" * (limit * 5 + 3) + " " + "x" * (limit * 2)
+
+    chunks = TextSplitter(limit).split(text)
+
+    assert all(len(chunk) <= limit for chunk in chunks)
+    assert_rejoins(text, chunks)
+    assert len(chunks) >= len(text) // limit
+
+
+@pytest.mark.parametrize("text", ["", " ", "\n\n\n", " \n \t " * 1000])
+def test_split_whitespace_only(text):
+    assert TextSplitter(10).split(text) == []
+
+
+def test_split_keeps_graphemes_together():
+    text = "👩‍👩‍👧" * 40
+    for chunk in TextSplitter(10).split(text):
+        assert not chunk.startswith("‍") and not chunk.endswith("‍")
+
+
+def test_split_small_limit_is_rejected():
+    with pytest.raises(ValueError):
+        TextSplitter(1)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_pack_keeps_order_within_limits(seed):
+    rng = Random(seed)
+    items = [rng.choice(["", "a" * rng.randint(1, 7000)]) for _ in range(rng.randint(0, 40))]
+    max_items = rng.randint(1, 10)
+    max_total = rng.choice([1, 100, 6000])
+
+    groups = TextSplitter.pack(items, max_items=max_items, max_total=max_total)
+
+    assert [item for group in groups for item in group] == items
+    for group in groups:
+        assert 0 < len(group) <= max_items
+        # an item larger than max_total still has to be sent, alone.
+        assert sum(map(len, group)) <= max_total or len(group) == 1